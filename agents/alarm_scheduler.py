@@ -0,0 +1,231 @@
+# agents/alarm_scheduler.py
+import heapq, itertools, logging, threading, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from agents.schedule_agent import ScheduleAgent
+from utils import http, metrics
+
+log = logging.getLogger(__name__)
+
+# ---------- notifiers: notify(user, title, message) ----------
+class LogNotifier:
+    def notify(self, user, title, message):
+        log.info("alarm for %s: %s — %s", user, title, message)
+
+class InboxNotifier:
+    """
+    keeps undelivered messages per user; the UI drains them (e.g. into a
+    browser notification). Boxes nobody drained for ttl_s (closed tabs) are
+    dropped on a sweep at most every SWEEP_EVERY_S.
+    """
+    SWEEP_EVERY_S = 60
+
+    def __init__(self, maxlen=50, ttl_s=6*3600):
+        self.maxlen = maxlen
+        self.ttl_s = ttl_s
+        self._boxes = {}  # user -> (deque, last message time)
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def notify(self, user, title, message):
+        now = time.monotonic()
+        with self._lock:
+            box = self._boxes.get(user)
+            box = box[0] if box is not None else deque(maxlen=self.maxlen)
+            box.append((title, message))
+            self._boxes[user] = (box, now)
+            if now - self._last_sweep >= self.SWEEP_EVERY_S:
+                self._last_sweep = now
+                for u in [u for u, (_, t) in self._boxes.items() if now - t > self.ttl_s]:
+                    del self._boxes[u]
+
+    def __len__(self):
+        return len(self._boxes)
+
+    def drain(self, user):
+        with self._lock:
+            box = self._boxes.pop(user, None)
+        return list(box[0]) if box else []
+
+class WebhookNotifier:
+    """POSTs {"user", "title", "message"} as JSON to url (push gateway, IoT hub, ...)"""
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def notify(self, user, title, message):
+        http.post(self.url, json={"user": user, "title": title, "message": message},
+                  timeout=self.timeout, endpoint="alarm-webhook")
+
+class MultiNotifier:
+    def __init__(self, *notifiers):
+        self.notifiers = [n for n in notifiers if n is not None]
+
+    def notify(self, user, title, message):
+        for n in self.notifiers:
+            try:
+                n.notify(user, title, message)
+            except Exception:
+                log.exception("notifier %r failed", n)
+
+class Alarm:
+    __slots__ = ("alarm_id", "user", "wake_dt", "levels", "refresh", "version", "fired")
+
+    def __init__(self, alarm_id, user, wake_dt, levels, refresh):
+        self.alarm_id = alarm_id
+        self.user = user
+        self.wake_dt = wake_dt
+        self.levels = sorted(set(int(l) for l in levels), reverse=True)
+        self.refresh = refresh
+        self.version = 0
+        self.fired = set()
+
+class AlarmScheduler:
+    """
+    Server-side progressive alarms for many users on one timer thread.
+
+    Every alarm has one "fire" heap entry per level (wake_dt - level minutes)
+    and, when a refresh callback is given, one "refresh" entry. The timer
+    thread only pops entries: notifications are delivered on a pool of
+    notify_workers so a slow notifier can't hold up other alarms. refresh() is
+    run on a small worker pool at the ScheduleAgent.dynamic_update_interval_seconds
+    cadence and returns the recomputed wake-up datetime (or None); when it
+    moves by a minute or more the pending levels are rescheduled. Stale heap
+    entries are skipped lazily by comparing the alarm's version.
+    """
+    # a recomputed wake time must move at least this much to reschedule
+    MOVE_THRESHOLD = timedelta(minutes=1)
+
+    def __init__(self, notifier=None, refresh_workers=4, notify_workers=8):
+        self.notifier = notifier or LogNotifier()
+        self._alarms = {}
+        self._heap = []  # (when_ts, seq, alarm_id, version, kind, level)
+        self._seq = itertools.count()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._pool = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="alarm-refresh")
+        self._notify_pool = ThreadPoolExecutor(max_workers=notify_workers, thread_name_prefix="alarm-notify")
+        self._sa = ScheduleAgent()
+        self._thread = None
+        self._stopped = False
+
+    def __len__(self):
+        return len(self._alarms)
+
+    # ---------- public API ----------
+    def schedule(self, user, wake_dt, levels=(30, 10, 0), refresh=None):
+        """register alarms at wake_dt - level minutes; returns alarm_id"""
+        with self._lock:
+            alarm = Alarm(next(self._ids), user, wake_dt, levels, refresh)
+            # computed first: a wake_dt that can't be scheduled leaves no alarm behind
+            entries = self._entries(alarm, wake_dt, alarm.version)
+            self._alarms[alarm.alarm_id] = alarm
+            for e in entries:
+                heapq.heappush(self._heap, e)
+            self._wakeup.notify()
+        self.start()
+        return alarm.alarm_id
+
+    def cancel(self, alarm_id):
+        with self._lock:
+            return self._alarms.pop(alarm_id, None) is not None
+
+    def pending(self, user=None):
+        with self._lock:
+            return [{"alarm_id": a.alarm_id, "user": a.user, "wake_dt": a.wake_dt,
+                     "levels": [l for l in a.levels if l not in a.fired]}
+                    for a in self._alarms.values() if user is None or a.user == user]
+
+    def start(self):
+        with self._lock:
+            if self._thread is None and not self._stopped:
+                self._thread = threading.Thread(target=self._run, name="alarm-timer", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify()
+        self._pool.shutdown(wait=False)
+        self._notify_pool.shutdown(wait=False)
+
+    # ---------- heap bookkeeping (caller holds the lock) ----------
+    def _push(self, when, alarm, kind, level=None):
+        heapq.heappush(self._heap, (when, next(self._seq), alarm.alarm_id, alarm.version, kind, level))
+
+    def _entries(self, alarm, wake_dt, version):
+        """heap entries for the pending levels (and next refresh) of alarm at wake_dt"""
+        entries = [((wake_dt - timedelta(minutes=lvl)).timestamp(), next(self._seq), alarm.alarm_id, version, "fire", lvl)
+                   for lvl in alarm.levels if lvl not in alarm.fired]
+        if alarm.refresh is not None:
+            entries.append((time.time() + self._sa.dynamic_update_interval_seconds(wake_dt), next(self._seq),
+                            alarm.alarm_id, version, "refresh", None))
+        return entries
+
+    # ---------- timer thread ----------
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._stopped and (not self._heap or self._heap[0][0] > time.time()):
+                    timeout = self._heap[0][0] - time.time() if self._heap else None
+                    self._wakeup.wait(timeout)
+                if self._stopped:
+                    return
+                _, _, alarm_id, version, kind, level = heapq.heappop(self._heap)
+                alarm = self._alarms.get(alarm_id)
+                if alarm is None or alarm.version != version:
+                    continue
+                if kind == "refresh":
+                    self._pool.submit(self._refresh, alarm, version)
+                    continue
+                alarm.fired.add(level)
+                if len(alarm.fired) == len(alarm.levels):
+                    del self._alarms[alarm_id]
+                wake_dt = alarm.wake_dt
+            msg = f"{level}분 전 알림 (기상 {wake_dt.strftime('%H:%M')})" if level else f"기상 시간입니다 ({wake_dt.strftime('%H:%M')})"
+            metrics.incr("alarm_fired")
+            self._deliver(alarm.user, msg)
+
+    def _deliver(self, user, msg):
+        try:
+            self._notify_pool.submit(self._notify, user, msg)
+        except RuntimeError:  # stopped
+            pass
+
+    def _notify(self, user, msg):
+        try:
+            with metrics.span("alarm_notify"):
+                self.notifier.notify(user, "Smart Commute", msg)
+        except Exception:
+            log.exception("alarm delivery failed")
+
+    def _refresh(self, alarm, version):
+        try:
+            with metrics.span("alarm_refresh"):
+                new_dt = alarm.refresh()
+        except Exception:
+            log.exception("alarm refresh failed")
+            new_dt = None
+        moved = False
+        with self._lock:
+            if self._alarms.get(alarm.alarm_id) is not alarm or alarm.version != version:
+                return
+            try:
+                if new_dt is not None and abs(new_dt - alarm.wake_dt) >= self.MOVE_THRESHOLD:
+                    entries = self._entries(alarm, new_dt, alarm.version + 1)
+                    alarm.wake_dt = new_dt
+                    alarm.version += 1
+                    for e in entries:
+                        heapq.heappush(self._heap, e)
+                    moved = True
+            except Exception:  # e.g. an offset-aware datetime from refresh()
+                log.exception("alarm refresh failed")
+            # keep refreshing on the current wake time unless it moved
+            if not moved and alarm.wake_dt > datetime.now():
+                self._push(time.time() + self._sa.dynamic_update_interval_seconds(alarm.wake_dt), alarm, "refresh")
+            self._wakeup.notify()
+        if moved:
+            metrics.incr("alarm_moved")
+            self._deliver(alarm.user, f"기상 시간 변경: {new_dt.strftime('%H:%M')}")
@@ -0,0 +1,161 @@
+# agents/arrival_service.py
+import heapq, threading, time
+from datetime import datetime
+from concurrent.futures import Future, ThreadPoolExecutor
+from agents.data_agent import DataAgent
+from agents.schedule_agent import ScheduleAgent
+from utils import metrics
+
+class ArrivalService:
+    """
+    Shared real-time arrival cache for bus stations / subway stations.
+
+    - get(): returns the latest cached ETA (minutes); on a miss, concurrent
+      callers for the same station share one upstream call (single-flight).
+    - watch(): marks a station hot; a background thread keeps it refreshed on
+      the ScheduleAgent.dynamic_update_interval_seconds cadence for the
+      nearest wake-up time still ahead among its watchers. A station is
+      dropped once its wake-up times have all passed; untimed watches (no
+      wake_dt) also end when nobody has read the station for idle_ttl_s.
+    """
+    def __init__(self, data_agent=None, default_interval_s=60, max_age_s=600, idle_ttl_s=900, workers=4):
+        self.da = data_agent or DataAgent()
+        self.default_interval_s = default_interval_s
+        self.max_age_s = max_age_s
+        self.idle_ttl_s = idle_ttl_s
+        self._sa = ScheduleAgent()
+        self._fetchers = {
+            "bus": lambda key: self.da.get_bus_eta(station_id=key),
+            "subway": lambda key: self.da.get_subway_eta(station=key),
+        }
+        self._values = {}     # (kind, key) -> (eta_minutes, fetched_at)
+        self._inflight = {}   # (kind, key) -> Future
+        self._hot = {}        # (kind, key) -> {"wakes": set, "untimed": bool, "due": float, "last_read": float}
+        self._heap = []       # (due, (kind, key))
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="arrival-refresh")
+        self._thread = None
+        self._stopped = False
+
+    # ---------- reads ----------
+    def get(self, kind, key):
+        sk = (kind, key)
+        now = time.time()
+        hit = self._values.get(sk)
+        hot = self._hot.get(sk)
+        if hot is not None:
+            hot["last_read"] = now
+        fresh = hit is not None and now - hit[1] <= self.max_age_s
+        metrics.cache("arrival", fresh)
+        if fresh:
+            return hit[0]
+        return self._fetch(sk).result()
+
+    def get_bus_eta(self, station_id):
+        return self.get("bus", station_id)
+
+    def get_subway_eta(self, station):
+        return self.get("subway", station)
+
+    # ---------- single-flight upstream call ----------
+    def _fetch(self, sk):
+        with self._lock:
+            fut = self._inflight.get(sk)
+            if fut is not None:
+                return fut
+            fut = Future()
+            self._inflight[sk] = fut
+        try:
+            with metrics.span("arrival_fetch", kind=sk[0]):
+                value = self._fetchers[sk[0]](sk[1])
+            self._values[sk] = (value, time.time())
+            fut.set_result(value)
+        except BaseException as e:
+            fut.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop(sk, None)
+        return fut
+
+    # ---------- background refresh ----------
+    def watch(self, kind, key, wake_dt=None):
+        """
+        keep (kind, key) refreshed until wake_dt (or, without one, until idle).
+        The caller has just read the station, so the first refresh is one
+        interval away.
+        """
+        sk = (kind, key)
+        now = time.time()
+        with self._lock:
+            hot = self._hot.get(sk)
+            if hot is None:
+                hot = self._hot[sk] = {"wakes": set(), "untimed": False, "due": None, "last_read": now}
+            if wake_dt is None:
+                hot["untimed"] = True
+            elif wake_dt > datetime.now():
+                hot["wakes"].add(wake_dt)
+            interval = self._interval(hot)
+            if interval is None:
+                del self._hot[sk]
+                return
+            # (re)schedule when new or when a nearer wake-up time shortens the wait
+            if hot["due"] is None or now + interval < hot["due"]:
+                hot["due"] = now + interval
+                heapq.heappush(self._heap, (hot["due"], sk))
+                self._wakeup.notify()
+        self.start()
+
+    def _interval(self, hot):
+        """seconds to the next refresh, None once every wake-up time has passed"""
+        now = datetime.now()
+        hot["wakes"] = {w for w in hot["wakes"] if w > now}
+        if hot["wakes"]:
+            return self._sa.dynamic_update_interval_seconds(min(hot["wakes"]))
+        return self.default_interval_s if hot["untimed"] else None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None and not self._stopped:
+                self._thread = threading.Thread(target=self._run, name="arrival-poller", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify()
+        self._pool.shutdown(wait=False)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._stopped and (not self._heap or self._heap[0][0] > time.time()):
+                    timeout = self._heap[0][0] - time.time() if self._heap else None
+                    self._wakeup.wait(timeout)
+                if self._stopped:
+                    return
+                due, sk = heapq.heappop(self._heap)
+                hot = self._hot.get(sk)
+                if hot is None or due != hot["due"]:  # dropped / rescheduled
+                    continue
+                if hot["untimed"] and time.time() - hot["last_read"] > self.idle_ttl_s:
+                    hot["untimed"] = False  # timed watchers still keep it until their wake_dt
+                interval = self._interval(hot)
+                if interval is None:
+                    del self._hot[sk]
+                    continue
+                hot["due"] = time.time() + interval
+                heapq.heappush(self._heap, (hot["due"], sk))
+            self._pool.submit(self._fetch, sk)
+
+_service = None
+_service_lock = threading.Lock()
+
+def arrival_service():
+    """process-wide ArrivalService shared by every session"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = ArrivalService()
+    return _service
@@ -1,86 +1,215 @@
 # agents/data_agent.py
-import requests, math, time
-from utils.api_keys import BUS_API_KEY, WEATHER_API_KEY, SUBWAY_API_KEY, TRAFFIC_API_KEY
+import math, time
+from array import array
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, wait
+import threading
+import pytz
+from utils.api_keys import BUS_API_KEY, WEATHER_API_KEY, SUBWAY_API_KEY, TRAFFIC_API_KEY, CROSSINGS_PATH
+from utils.api_keys import KMA_URL, BUS_API_URL, SUBWAY_API_URL
 from utils.map_utils import geocode
+from utils.cache import TTLCache
+from utils import http, metrics
+from utils.geo import haversine_km
+from utils.crossing_index import CrossingIndex
+
+# overall latency budget (seconds) for the upstream calls of one plan
+PLAN_BUDGET_S = 9.0
+
+# shared worker pool for concurrent upstream calls (all sessions in the process)
+_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="data-agent")
+
+# ---------- KMA grid (Lambert conformal conic) constants, computed once ----------
+_DEGRAD = math.pi/180.0
+def _lcc_constants():
+    RE=6371.00877; GRID=5.0; SLAT1=30.0; SLAT2=60.0; OLON=126.0; OLAT=38.0
+    re=RE/GRID
+    slat1=SLAT1*_DEGRAD; slat2=SLAT2*_DEGRAD; olon=OLON*_DEGRAD; olat=OLAT*_DEGRAD
+    sn=math.tan(math.pi*0.25+slat2*0.5)/math.tan(math.pi*0.25+slat1*0.5)
+    sn=math.log(math.cos(slat1)/math.cos(slat2))/math.log(sn)
+    sf=math.tan(math.pi*0.25+slat1*0.5); sf=(sf**sn*math.cos(slat1))/sn
+    ro=math.tan(math.pi*0.25+olat*0.5); ro=re*sf/(ro**sn)
+    return re, sn, sf, ro, olon
+_LCC_RE, _LCC_SN, _LCC_SF, _LCC_RO, _LCC_OLON = _lcc_constants()
+_LCC_XO, _LCC_YO = 43, 136
+
+# ---------- KMA short-term forecast issue schedule ----------
+KST = pytz.timezone("Asia/Seoul")
+_KMA_ISSUE_HOURS = (2, 5, 8, 11, 14, 17, 20, 23)
+_KMA_PUBLISH_DELAY = timedelta(minutes=10)  # a base_time is served ~10 min after issue
+
+def kma_base_time(now=None):
+    """
+    Latest published (base_date, base_time) for getVilageFcst and the epoch
+    time at which the next one is published.
+    """
+    now = now or datetime.now(KST)
+    t = now - _KMA_PUBLISH_DELAY
+    day = t.replace(minute=0, second=0, microsecond=0)
+    past = [h for h in _KMA_ISSUE_HOURS if h <= t.hour]
+    if past:
+        base = day.replace(hour=past[-1])
+    else:
+        base = (day - timedelta(days=1)).replace(hour=_KMA_ISSUE_HOURS[-1])
+    nxt = base + timedelta(hours=3)
+    expires_at = (nxt + _KMA_PUBLISH_DELAY).timestamp()
+    return base.strftime("%Y%m%d"), base.strftime("%H%M"), expires_at
+
+class Forecast:
+    """
+    Compact per-hour forecast for one grid cell: hour keys (YYYYMMDDHH) with
+    precipitation probability (POP, %) and precipitation type (PTY) arrays.
+    """
+    __slots__ = ("hours", "pop", "pty")
+
+    def __init__(self, hours, pop, pty):
+        self.hours = hours
+        self.pop = pop
+        self.pty = pty
+
+    @classmethod
+    def from_items(cls, items):
+        rows = {}
+        for it in items:
+            cat = it.get("category")
+            if cat not in ("PTY", "POP"):
+                continue
+            try:
+                hour = int(it.get("fcstDate", "0") + it.get("fcstTime", "0000")[:2])
+                val = int(it.get("fcstValue", 0))
+            except (TypeError, ValueError):
+                continue
+            slot = rows.setdefault(hour, [0, 0])
+            slot[0 if cat == "POP" else 1] = val
+        keys = sorted(rows)
+        return cls(array("q", keys),
+                   array("h", (rows[k][0] for k in keys)),
+                   array("h", (rows[k][1] for k in keys)))
+
+    @property
+    def rain(self):
+        # same threshold as before: any POP/PTY value >= 30
+        return any(v >= 30 for v in self.pop) or any(v >= 30 for v in self.pty)
+
+# cross-session forecast cache, keyed by (nx, ny, base_date, base_time)
+_forecast_cache = TTLCache(maxsize=4096)
+
+# signalized intersections, loaded once per process from CROSSINGS_PATH
+_crossing_index = None
+_crossing_index_lock = threading.Lock()
+
+def crossing_index(path=CROSSINGS_PATH):
+    """shared CrossingIndex, or None when no dump is configured / loadable"""
+    global _crossing_index
+    if _crossing_index is None and path:
+        with _crossing_index_lock:
+            if _crossing_index is None:
+                try:
+                    _crossing_index = CrossingIndex.load(path)
+                except Exception:
+                    _crossing_index = CrossingIndex([], [], [])
+    return _crossing_index if _crossing_index is not None and len(_crossing_index) else None
+
+def _timed(name, fn, args):
+    with metrics.span("upstream", call=name):
+        return fn(*args)
 
 class DataAgent:
     def __init__(self):
-        self.session = requests.Session()
+        self.session = http.session()
         # small in-memory cache
         self._cache = {}
 
+    # ---------- concurrent upstream calls under one deadline ----------
+    def gather(self, calls, deadline):
+        """
+        calls: {name: (fn, args, fallback)}, deadline: time.monotonic() value.
+        Runs all calls at once on the shared pool and waits until `deadline`.
+        Returns (results, failed): a call that raised or is still running at
+        the deadline gets its fallback, and failed[name] holds the exception
+        (TimeoutError for a missed deadline).
+        """
+        futs = {name: _POOL.submit(_timed, name, fn, args) for name, (fn, args, _) in calls.items()}
+        wait(futs.values(), timeout=max(0.0, deadline - time.monotonic()))
+        results, failed = {}, {}
+        for name, fut in futs.items():
+            fallback = calls[name][2]
+            if not fut.done():
+                fut.cancel()
+                results[name] = fallback
+                failed[name] = TimeoutError(f"{name}: exceeded plan budget")
+                metrics.fallback(name, "deadline")
+            elif fut.exception() is not None:
+                results[name] = fallback
+                failed[name] = fut.exception()
+                metrics.fallback(name, "error")
+            else:
+                results[name] = fut.result()
+        return results, failed
+
     # ---------- weather (KMA simple) ----------
     def _latlon_to_grid(self, lat, lon):
-        # conversion used earlier — returns (nx, ny)
-        RE=6371.00877; GRID=5.0; SLAT1=30.0; SLAT2=60.0; OLON=126.0; OLAT=38.0; XO=43; YO=136
-        DEGRAD=math.pi/180.0
-        re=RE/GRID
-        slat1=SLAT1*DEGRAD; slat2=SLAT2*DEGRAD; olon=OLON*DEGRAD; olat=OLAT*DEGRAD
-        sn=math.tan(math.pi*0.25+slat2*0.5)/math.tan(math.pi*0.25+slat1*0.5)
-        sn=math.log(math.cos(slat1)/math.cos(slat2))/math.log(sn)
-        sf=math.tan(math.pi*0.25+slat1*0.5); sf=(sf**sn*math.cos(slat1))/sn
-        ro=math.tan(math.pi*0.25+olat*0.5); ro=re*sf/(ro**sn)
-        ra=math.tan(math.pi*0.25+(lat*DEGRAD)*0.5); ra=re*sf/(ra**sn)
-        theta=lon*DEGRAD-olon
+        # conversion used earlier — returns (nx, ny); constants precomputed in _LCC
+        ra=math.tan(math.pi*0.25+(lat*_DEGRAD)*0.5); ra=_LCC_RE*_LCC_SF/(ra**_LCC_SN)
+        theta=lon*_DEGRAD-_LCC_OLON
         if theta>math.pi: theta-=2.0*math.pi
         if theta<-math.pi: theta+=2.0*math.pi
-        theta*=sn
-        x=(ra*math.sin(theta))+XO+0.5
-        y=(ro-ra*math.cos(theta))+YO+0.5
+        theta*=_LCC_SN
+        x=(ra*math.sin(theta))+_LCC_XO+0.5
+        y=(_LCC_RO-ra*math.cos(theta))+_LCC_YO+0.5
         return int(x), int(y)
 
+    def _fetch_forecast(self, nx, ny, base_date, base_time):
+        url = f"{KMA_URL}/VilageFcstInfoService_2.0/getVilageFcst"
+        params = {
+            "serviceKey": WEATHER_API_KEY,
+            "pageNo": "1",
+            "numOfRows": "1000",
+            "dataType": "JSON",
+            "base_date": base_date,
+            "base_time": base_time,
+            "nx": nx,
+            "ny": ny
+        }
+        r = http.get(url, params=params, timeout=8, endpoint="kma-vilage-fcst")
+        j = r.json()
+        items = j.get("response", {}).get("body", {}).get("items", {}).get("item", [])
+        return Forecast.from_items(items)
+
+    def forecast_key(self, coord):
+        """((nx, ny, base_date, base_time), expires_at) of the forecast currently served for coord"""
+        lat, lon = coord
+        nx, ny = self._latlon_to_grid(lat, lon)
+        base_date, base_time, expires_at = kma_base_time()
+        return (nx, ny, base_date, base_time), expires_at
+
     def get_weather(self, coord):
         """
-        Returns dict: {'rain': bool, 'raw': ...}
-        If API missing / error, returns fallback {'rain':False}
+        Returns dict: {'rain': bool, 'forecast': Forecast}
+        Forecasts are shared across sessions per (nx, ny, base_date, base_time)
+        until the next KMA issue. If API missing / error, returns fallback
+        {'rain': False, 'forecast': None}
         """
         try:
-            lat, lon = coord
-            nx, ny = self._latlon_to_grid(lat, lon)
-            base_date = time.strftime("%Y%m%d")
-            base_time = "0500"
-            url = "https://apis.data.go.kr/1360000/VilageFcstInfoService_2.0/getVilageFcst"
-            params = {
-                "serviceKey": WEATHER_API_KEY,
-                "pageNo": "1",
-                "numOfRows": "1000",
-                "dataType": "JSON",
-                "base_date": base_date,
-                "base_time": base_time,
-                "nx": nx,
-                "ny": ny
-            }
-            r = self.session.get(url, params=params, timeout=8)
-            r.raise_for_status()
-            j = r.json()
-            items = j.get("response", {}).get("body", {}).get("items", {}).get("item", [])
-            rain = False
-            for it in items:
-                if it.get("category") in ("PTY", "POP"):
-                    try:
-                        if int(it.get("fcstValue",0)) >= 30:
-                            rain = True
-                            break
-                    except:
-                        continue
-            return {"rain": rain, "raw": j}
+            key, expires_at = self.forecast_key(coord)
+            fc = _forecast_cache.get(key)
+            metrics.cache("forecast", fc is not None)
+            if fc is None:
+                with metrics.span("weather_fetch"):
+                    fc = self._fetch_forecast(*key)
+                _forecast_cache.set(key, fc, expires_at=expires_at)
+            return {"rain": fc.rain, "forecast": fc}
         except Exception:
-            return {"rain": False, "raw": None}
+            metrics.fallback("weather")
+            return {"rain": False, "forecast": None}
 
     # ---------- traffic heuristic ----------
-    def get_traffic_delay(self, start_coord, end_coord):
+    def get_traffic_delay(self, start_coord, end_coord, when=None):
         # simple heuristic based on distance and peak hours
-        def haversine(a,b):
-            R=6371.0
-            lat1,lon1=map(math.radians,a)
-            lat2,lon2=map(math.radians,b)
-            dlat=lat2-lat1; dlon=lon2-lon1
-            aa=math.sin(dlat/2)**2 + math.cos(lat1)*math.cos(lat2)*math.sin(dlon/2)**2
-            c=2*math.atan2(math.sqrt(aa), math.sqrt(1-aa))
-            return R*c
-        dist = haversine(start_coord, end_coord)
-        now_h = time.localtime().tm_hour
-        peak = (7 <= now_h <= 9) or (17 <= now_h <= 19)
+        # when: datetime of the commute (default now), not of the planning run
+        dist = self.get_distance_km(start_coord, end_coord)
+        hour = when.hour if when is not None else time.localtime().tm_hour
+        peak = (7 <= hour <= 9) or (17 <= hour <= 19)
         base = 3 if dist < 2 else 8
         return base + (7 if peak else 0)
 
@@ -89,25 +218,27 @@ class DataAgent:
         if not BUS_API_KEY or not station_id:
             return 5
         try:
-            url = "https://apis.data.go.kr/6410000/busarrivalservice/v2/arrivalsByRoute"
+            url = f"{BUS_API_URL}/busarrivalservice/v2/arrivalsByRoute"
             params = {"serviceKey": BUS_API_KEY, "stationId": station_id, "format":"json"}
-            r = self.session.get(url, params=params, timeout=6)
-            r.raise_for_status()
+            r = http.get(url, params=params, timeout=6, endpoint="gg-bus-arrival")
             j = r.json()
-            arrs = j.get("response", {}).get("busArrivalList", [])
+            body = j.get("response", {}).get("msgBody") or {}
+            arrs = body.get("busArrivalList") or []
+            if isinstance(arrs, dict):  # a single arrival comes as an object
+                arrs = [arrs]
             if arrs:
                 return int(arrs[0].get("predictTime1", 0))
             return 10
         except Exception:
+            metrics.fallback("bus_eta")
             return 10
 
     def get_subway_eta(self, station=None, line_no=None):
         if not SUBWAY_API_KEY or not station:
             return 3
         try:
-            url = f"http://swopenAPI.seoul.go.kr/api/subway/{SUBWAY_API_KEY}/json/realtimeStationArrival/0/5/{station}"
-            r = self.session.get(url, timeout=6)
-            r.raise_for_status()
+            url = f"{SUBWAY_API_URL}/api/subway/{SUBWAY_API_KEY}/json/realtimeStationArrival/0/5/{station}"
+            r = http.get(url, timeout=6, endpoint="seoul-subway-arrival")
             j = r.json()
             arrs = j.get("realtimeArrivalList", [])
             if arrs:
@@ -115,12 +246,18 @@ class DataAgent:
                 return max(1, sec//60)
             return 5
         except Exception:
+            metrics.fallback("subway_eta")
             return 5
 
-    # ---------- traffic light / crossings (fallback heuristic) ----------
-    def get_crossings_info(self, start_coord, end_coord):
+    # ---------- traffic light / crossings ----------
+    def get_crossings_info(self, start_coord, end_coord, route_coords=None, buffer_m=25.0):
         # returns list of (lat, lon, max_wait_seconds)
-        # If API exists, call it; else create points every ~0.6km and max_wait 60s
+        # With a crossing dump loaded: real signals within buffer_m of the route
+        # (route_coords, else the straight line), wait = signal cycle length.
+        idx = crossing_index()
+        if idx is not None:
+            return idx.query_polyline(route_coords or [start_coord, end_coord], buffer_m)
+        # else create points every ~0.6km and max_wait 60s
         km = self.get_distance_km(start_coord, end_coord)
         cnt = max(0, int(km / 0.6))
         pts = []
@@ -140,10 +277,4 @@ class DataAgent:
         return (max_wait // 60)
 
     def get_distance_km(self, a, b):
-        R=6371.0
-        lat1,lon1=map(math.radians,a)
-        lat2,lon2=map(math.radians,b)
-        dlat=lat2-lat1; dlon=lon2-lon1
-        aa=math.sin(dlat/2)**2 + math.cos(lat1)*math.cos(lat2)*math.sin(dlon/2)**2
-        c=2*math.atan2(math.sqrt(aa), math.sqrt(1-aa))
-        return R*c
+        return haversine_km(a, b)
@@ -1,77 +1,512 @@
-
 # agents/history_agent.py
 import sqlite3
 import os
-from datetime import datetime
+import queue
+import threading
+import math
+import pytz
 import numpy as np
-from sklearn.linear_model import LinearRegression
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import islice
+from utils import metrics
+from utils.sketch import KLLSketch
+
+DB_PATH = os.environ.get("ETA_HISTORY_DB") or os.path.join(os.path.dirname(__file__), "..", "eta_history.db")
+
+# compact(): raw rows older than this are rolled up into eta_daily and archived
+RETENTION_DAYS = 90
+COMPACT_CHUNK = 100_000  # rows per archive file / transaction
+# idle connections kept open for reuse; more are opened (and closed after use) under load
+POOL_SIZE = 8
+ARCHIVE_DIR = os.environ.get("ETA_ARCHIVE_DIR") or os.path.join(os.path.dirname(__file__), "..", "eta_archive")
+
+# exponentially decayed error stats behave like a ~EW_WINDOW-trip moving window
+EW_WINDOW = 200
+_EW_ALPHA = 2.0 / (EW_WINDOW + 1)
+
+_SUMMARY_COLS = ("n", "sum_p", "sum_a", "sum_pp", "sum_aa", "sum_pa", "ew_mean", "ew_var")
+
+# error quantiles are kept per hour of week (local time); a query merges the
+# nearest buckets until at least MIN_BUCKET_N trips are covered
+KST = pytz.timezone("Asia/Seoul")
+HOURS_PER_WEEK = 7 * 24
+MIN_BUCKET_N = 20
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "..", "eta_history.db")
+def hour_of_week(dt):
+    """0 = Monday 00:00-00:59 ... 167 = Sunday 23:00-23:59; naive datetimes are local (KST) time"""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(KST)
+    return dt.weekday() * 24 + dt.hour
+
+def _record_bucket(timestamp):
+    # eta_history timestamps are naive UTC ISO strings
+    try:
+        dt = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        dt = datetime.utcnow()
+    if dt.tzinfo is None:
+        dt = pytz.utc.localize(dt)
+    return hour_of_week(dt)
+
+def _bucket_order(target):
+    """all buckets, nearest first: same hour on other days before neighbouring hours"""
+    def dist(b):
+        dh = abs(b % 24 - target % 24)
+        dd = abs(b // 24 - target // 24)
+        return min(dh, 24 - dh), min(dd, 7 - dd)
+    return sorted(range(HOURS_PER_WEEK), key=dist)
+
+def _fold(st, p, a):
+    """
+    Add one (predicted, actual) pair to running stats
+    [n, sum_p, sum_a, sum_pp, sum_aa, sum_pa, ew_mean, ew_var].
+    For the first trips alpha is 1/n, so ew_* are the exact mean/variance
+    until the decayed window takes over.
+    """
+    n = st[0] + 1
+    st[0] = n
+    st[1] += p; st[2] += a
+    st[3] += p*p; st[4] += a*a; st[5] += p*a
+    d = a - p
+    alpha = max(1.0 / n, _EW_ALPHA)
+    diff = d - st[6]
+    incr = alpha * diff
+    st[6] += incr
+    st[7] = (1 - alpha) * (st[7] + diff * incr)
+    return st
 
 class HistoryAgent:
-    def __init__(self, dbpath=DB_PATH):
+    def __init__(self, dbpath=DB_PATH, pool_size=POOL_SIZE):
         self.dbpath = dbpath
+        # long-lived connections shared by every thread (Streamlit runs each
+        # rerun on a new thread), handed out one caller at a time; WAL lets
+        # readers run alongside a writer, _write_lock queues writers in-process
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+        self._write_lock = threading.Lock()
         self._ensure_db()
 
+    def _open(self):
+        conn = sqlite3.connect(self.dbpath, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-16000")  # ~16 MB page cache
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        """borrow a pooled connection for the duration of the block"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
     def _ensure_db(self):
-        conn = sqlite3.connect(self.dbpath)
-        c = conn.cursor()
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS eta_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            route_key TEXT,
-            mode TEXT,
-            predicted INTEGER,
-            actual INTEGER,
-            timestamp TEXT
-        )
-        """)
-        conn.commit()
-        conn.close()
+        with self._connection() as conn:
+            c = conn.cursor()
+            c.execute("""
+            CREATE TABLE IF NOT EXISTS eta_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                route_key TEXT,
+                mode TEXT,
+                predicted INTEGER,
+                actual INTEGER,
+                timestamp TEXT
+            )
+            """)
+            # covering index: per-route lookups newest-first without touching the table
+            c.execute("""
+            CREATE INDEX IF NOT EXISTS idx_eta_route_mode
+            ON eta_history(route_key, mode, id, predicted, actual)
+            """)
+            # running sufficient statistics per (route_key, mode), kept in sync by add_record(s)
+            c.execute("""
+            CREATE TABLE IF NOT EXISTS eta_summary (
+                route_key TEXT,
+                mode TEXT,
+                n INTEGER,
+                sum_p REAL,
+                sum_a REAL,
+                sum_pp REAL,
+                sum_aa REAL,
+                sum_pa REAL,
+                ew_mean REAL,
+                ew_var REAL,
+                PRIMARY KEY (route_key, mode)
+            )
+            """)
+            # error (actual - predicted) quantile sketch per (route_key, mode, hour of week)
+            c.execute("""
+            CREATE TABLE IF NOT EXISTS eta_sketch (
+                route_key TEXT,
+                mode TEXT,
+                bucket INTEGER,
+                n INTEGER,
+                sketch BLOB,
+                PRIMARY KEY (route_key, mode, bucket)
+            )
+            """)
+            # per-day rollups of compacted rows; day is the KST calendar date
+            c.execute("""
+            CREATE TABLE IF NOT EXISTS eta_daily (
+                route_key TEXT,
+                mode TEXT,
+                day TEXT,
+                n INTEGER,
+                sum_p REAL,
+                sum_a REAL,
+                sum_err REAL,
+                sum_err2 REAL,
+                min_err INTEGER,
+                max_err INTEGER,
+                PRIMARY KEY (route_key, mode, day)
+            )
+            """)
+            conn.commit()
+            no_summary = c.execute("SELECT 1 FROM eta_summary LIMIT 1").fetchone() is None
+            no_sketch = c.execute("SELECT 1 FROM eta_sketch LIMIT 1").fetchone() is None
+        if no_summary:
+            self._backfill_summary()
+        if no_sketch:
+            self._backfill_sketches()
 
+    def _backfill_summary(self):
+        # one pass over existing history (databases created before eta_summary)
+        with self._connection() as conn:
+            stats = {}
+            for route_key, mode, p, a in conn.execute(
+                    "SELECT route_key, mode, predicted, actual FROM eta_history ORDER BY id"):
+                st = stats.setdefault((route_key, mode), [0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0])
+                _fold(st, p, a)
+        if stats:
+            with self._write_txn() as conn:
+                self._store_stats(conn, stats)
+
+    def _backfill_sketches(self):
+        with self._connection() as conn:
+            sketches = {}
+            for route_key, mode, p, a, ts in conn.execute(
+                    "SELECT route_key, mode, predicted, actual, timestamp FROM eta_history ORDER BY id"):
+                key = (route_key, mode, _record_bucket(ts))
+                sk = sketches.get(key)
+                if sk is None:
+                    sk = sketches[key] = KLLSketch()
+                sk.update(a - p)
+        if sketches:
+            with self._write_txn() as conn:
+                self._store_sketches(conn, sketches)
+
+    @contextmanager
+    def _write_txn(self):
+        # take the write lock up front so the summary read-modify-write can't race
+        with self._write_lock, self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def _load_stats(self, conn, keys):
+        stats = {}
+        for key in keys:
+            row = conn.execute("SELECT " + ", ".join(_SUMMARY_COLS) + " FROM eta_summary WHERE route_key=? AND mode=?", key).fetchone()
+            stats[key] = list(row) if row else [0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+        return stats
+
+    def _store_stats(self, conn, stats):
+        conn.executemany(
+            "INSERT OR REPLACE INTO eta_summary(route_key, mode, " + ", ".join(_SUMMARY_COLS) + ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(k[0], k[1], *st) for k, st in stats.items()])
+
+    def _load_sketches(self, conn, keys):
+        sketches = {}
+        for key in keys:
+            row = conn.execute("SELECT sketch FROM eta_sketch WHERE route_key=? AND mode=? AND bucket=?", key).fetchone()
+            sketches[key] = KLLSketch.from_bytes(row[0]) if row else KLLSketch()
+        return sketches
+
+    def _store_sketches(self, conn, sketches):
+        conn.executemany(
+            "INSERT OR REPLACE INTO eta_sketch(route_key, mode, bucket, n, sketch) VALUES (?, ?, ?, ?, ?)",
+            [(k[0], k[1], k[2], sk.n, sk.to_bytes()) for k, sk in sketches.items()])
+
+    def _insert(self, conn, batch):
+        # rows + running stats + sketches in the caller's transaction
+        conn.executemany("INSERT INTO eta_history(route_key, mode, predicted, actual, timestamp) VALUES (?, ?, ?, ?, ?)", batch)
+        stats = self._load_stats(conn, {(r[0], r[1]) for r in batch})
+        buckets = [_record_bucket(r[4]) for r in batch]
+        sketches = self._load_sketches(conn, {(r[0], r[1], b) for r, b in zip(batch, buckets)})
+        for r, b in zip(batch, buckets):
+            _fold(stats[(r[0], r[1])], r[2], r[3])
+            sketches[(r[0], r[1], b)].update(r[3] - r[2])
+        self._store_stats(conn, stats)
+        self._store_sketches(conn, sketches)
+
+    @metrics.timed("history", op="add_record")
     def add_record(self, route_key, mode, predicted_minutes, actual_minutes):
-        conn = sqlite3.connect(self.dbpath)
-        c = conn.cursor()
-        c.execute("INSERT INTO eta_history(route_key, mode, predicted, actual, timestamp) VALUES (?, ?, ?, ?, ?)",
-                  (route_key, mode, int(predicted_minutes), int(actual_minutes), datetime.utcnow().isoformat()))
-        conn.commit()
-        conn.close()
+        with self._write_txn() as conn:
+            self._insert(conn, [(route_key, mode, int(predicted_minutes), int(actual_minutes), datetime.utcnow().isoformat())])
+
+    @metrics.timed("history", op="add_records")
+    def add_records(self, records, batch_size=10000):
+        """
+        Bulk insert. records: iterable of (route_key, mode, predicted, actual)
+        or (route_key, mode, predicted, actual, timestamp). Rows are written
+        with executemany and committed every `batch_size` rows.
+        Returns the number of rows inserted.
+        """
+        it = iter(records)
+        total = 0
+        while True:
+            now = datetime.utcnow().isoformat()
+            batch = [(r[0], r[1], int(r[2]), int(r[3]), r[4] if len(r) > 4 else now)
+                     for r in islice(it, batch_size)]
+            if not batch:
+                break
+            with self._write_txn() as conn:
+                self._insert(conn, batch)
+            total += len(batch)
+        return total
 
+    @metrics.timed("history", op="summarize")
     def summarize(self, route_key, mode, limit=200):
-        conn = sqlite3.connect(self.dbpath)
-        c = conn.cursor()
-        c.execute("SELECT predicted, actual FROM eta_history WHERE route_key=? AND mode=? ORDER BY id DESC LIMIT ?", (route_key, mode, limit))
-        rows = c.fetchall()
-        conn.close()
+        """
+        Error stats over the last `limit` trips. When fewer live rows remain
+        after compaction, whole days from eta_daily (newest first) make up
+        the difference.
+        """
+        with self._connection() as conn:
+            n, s1, s2 = conn.execute(
+                "SELECT count(*), total(actual - predicted), total((actual - predicted) * (actual - predicted)) FROM "
+                "(SELECT predicted, actual FROM eta_history WHERE route_key=? AND mode=? ORDER BY id DESC LIMIT ?)",
+                (route_key, mode, limit)).fetchone()
+            if n < limit:
+                for dn, d1, d2 in conn.execute(
+                        "SELECT n, sum_err, sum_err2 FROM eta_daily WHERE route_key=? AND mode=? ORDER BY day DESC",
+                        (route_key, mode)):
+                    n, s1, s2 = n + dn, s1 + d1, s2 + d2
+                    if n >= limit:
+                        break
+        if not n:
+            return None
+        mean = s1 / n
+        return {"count": n, "mean_error": mean, "std_error": math.sqrt(max(0.0, s2 / n - mean * mean))}
+
+    def daily_stats(self, route_key, mode, days=30):
+        """
+        Per-day error stats for the last `days` KST dates, newest first,
+        from eta_daily plus the live rows of the same days.
+        """
+        since = (datetime.now(KST) - timedelta(days=days)).date().isoformat()
+        with self._connection() as conn:
+            rows = conn.execute("""
+                SELECT day, sum(n), sum(sum_err), sum(sum_err2), min(min_err), max(max_err) FROM (
+                    SELECT day, n, sum_err, sum_err2, min_err, max_err
+                    FROM eta_daily WHERE route_key=? AND mode=? AND day >= ?
+                    UNION ALL
+                    SELECT date(timestamp, '+9 hours') AS day, count(*), total(actual - predicted),
+                           total((actual - predicted) * (actual - predicted)), min(actual - predicted), max(actual - predicted)
+                    FROM eta_history WHERE route_key=? AND mode=? GROUP BY day HAVING day >= ?
+                ) GROUP BY day ORDER BY day DESC
+            """, (route_key, mode, since, route_key, mode, since)).fetchall()
+        out = []
+        for day, n, s1, s2, lo, hi in rows:
+            mean = s1 / n
+            out.append({"day": day, "count": n, "mean_error": mean,
+                        "std_error": math.sqrt(max(0.0, s2 / n - mean * mean)), "min_error": lo, "max_error": hi})
+        return out
+
+    def frequent_routes(self, min_trips=10, days=30, limit=1000):
+        """
+        [(route_key, trips)] of routes with at least `min_trips` recorded trips
+        (all modes) in the last `days` days, most travelled first. Compacted
+        days are counted from eta_daily.
+        """
+        since = datetime.utcnow() - timedelta(days=days)
+        with self._connection() as conn:
+            return conn.execute("""
+                SELECT route_key, sum(n) AS trips FROM (
+                    SELECT route_key, n FROM eta_daily WHERE day >= ?
+                    UNION ALL
+                    SELECT route_key, count(*) FROM eta_history WHERE timestamp >= ? GROUP BY route_key
+                ) GROUP BY route_key HAVING trips >= ? ORDER BY trips DESC LIMIT ?
+            """, (since.date().isoformat(), since.isoformat(), min_trips, limit)).fetchall()
+
+    # ---------- retention ----------
+    @metrics.timed("history", op="compact")
+    def compact(self, older_than_days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR, vacuum=True, chunk=COMPACT_CHUNK):
+        """
+        Move raw rows older than `older_than_days` out of the hot table, in
+        id order, `chunk` rows at a time so memory stays flat however large
+        the backlog is. Per chunk:
+        1. write it to a compressed columnar archive (numpy .npz) in archive_dir,
+        2. add it to the eta_daily rollups and delete it in one transaction.
+        Then VACUUM once so the file shrinks back.
+        eta_summary / eta_sketch already cover every trip and are untouched.
+        Returns {"rows", "archives", "days"}: the archive paths written and
+        the eta_daily rows touched (summed over chunks).
+        """
+        cutoff = (datetime.utcnow() - timedelta(days=older_than_days)).isoformat()
+        total, archives, days, last_id = 0, [], 0, 0
+        while True:
+            with self._connection() as conn:
+                rows = conn.execute(
+                    "SELECT id, route_key, mode, predicted, actual, timestamp FROM eta_history "
+                    "WHERE id > ? AND timestamp < ? ORDER BY id LIMIT ?", (last_id, cutoff, chunk)).fetchall()
+            if not rows:
+                break
+            first_id, last_id = rows[0][0], rows[-1][0]
+            archives.append(self._archive_chunk(rows, archive_dir))
+            with self._write_txn() as conn:
+                conn.execute("""
+                    INSERT INTO eta_daily(route_key, mode, day, n, sum_p, sum_a, sum_err, sum_err2, min_err, max_err)
+                    SELECT route_key, mode, date(timestamp, '+9 hours') AS day, count(*), total(predicted), total(actual),
+                           total(actual - predicted), total((actual - predicted) * (actual - predicted)),
+                           min(actual - predicted), max(actual - predicted)
+                    FROM eta_history WHERE id BETWEEN ? AND ? AND timestamp < ? GROUP BY route_key, mode, day
+                    ON CONFLICT(route_key, mode, day) DO UPDATE SET
+                        n = n + excluded.n, sum_p = sum_p + excluded.sum_p, sum_a = sum_a + excluded.sum_a,
+                        sum_err = sum_err + excluded.sum_err, sum_err2 = sum_err2 + excluded.sum_err2,
+                        min_err = min(min_err, excluded.min_err), max_err = max(max_err, excluded.max_err)
+                """, (first_id, last_id, cutoff))
+                days += conn.execute("SELECT changes()").fetchone()[0]
+                conn.execute("DELETE FROM eta_history WHERE id BETWEEN ? AND ? AND timestamp < ?",
+                             (first_id, last_id, cutoff))
+            total += len(rows)
+            del rows
+        if total and vacuum:
+            with self._write_lock, self._connection() as conn:
+                conn.execute("VACUUM")
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {"rows": total, "archives": archives, "days": days}
+
+    @staticmethod
+    def _archive_chunk(rows, archive_dir):
+        """write one compact() chunk as .npz (strings dictionary-encoded, timestamps int64 us); returns the path"""
+        n = len(rows)
+        ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=n)
+        preds = np.fromiter((r[3] for r in rows), dtype=np.int32, count=n)
+        acts = np.fromiter((r[4] for r in rows), dtype=np.int32, count=n)
+        stamps = np.array([r[5] for r in rows], dtype="datetime64[us]").astype(np.int64)
+        # unique over object arrays: no fixed-width copy sized by the longest key
+        route_names, route_codes = np.unique(np.array([r[1] for r in rows], dtype=object), return_inverse=True)
+        mode_names, mode_codes = np.unique(np.array([r[2] for r in rows], dtype=object), return_inverse=True)
+        os.makedirs(archive_dir, exist_ok=True)
+        path = os.path.join(archive_dir, f"eta_history-{rows[0][5][:10]}-{rows[-1][5][:10]}-{int(ids[-1])}.npz")
+        tmp = path + ".tmp.npz"
+        np.savez_compressed(
+            tmp, id=ids,
+            route_names=route_names.astype(str), route_code=route_codes.astype(np.int32),
+            mode_names=mode_names.astype(str), mode_code=mode_codes.astype(np.int8),
+            predicted=preds, actual=acts, timestamp_us=stamps)
+        os.replace(tmp, path)
+        return path
+
+    @metrics.timed("history", op="route_stats")
+    def route_stats(self, route_key, mode):
+        """
+        Single-row lookup of the running stats for (route_key, mode), or None.
+        """
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT " + ", ".join(_SUMMARY_COLS) + " FROM eta_summary WHERE route_key=? AND mode=?",
+                (route_key, mode)).fetchone()
+        if not row or not row[0]:
+            return None
+        return dict(zip(_SUMMARY_COLS, row))
+
+    @metrics.timed("history", op="error_quantile")
+    def error_quantile(self, route_key, mode, q, when=None):
+        """
+        Approximate q-quantile of (actual - predicted) for trips around `when`
+        (default now), from the hour-of-week sketches; None without history.
+        The bucket of `when` is merged with the nearest ones until
+        MIN_BUCKET_N trips are covered, so sparse routes fall back to all hours.
+        """
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT bucket, n, sketch FROM eta_sketch WHERE route_key=? AND mode=?", (route_key, mode)).fetchall()
         if not rows:
             return None
-        preds = np.array([r[0] for r in rows])
-        acts = np.array([r[1] for r in rows])
-        diffs = acts - preds
-        return {"count": len(rows), "mean_error": float(diffs.mean()), "std_error": float(diffs.std())}
+        by_bucket = {b: (n, blob) for b, n, blob in rows}
+        merged, covered = KLLSketch(), 0
+        for b in _bucket_order(hour_of_week(when or datetime.now(KST))):
+            if b in by_bucket:
+                n, blob = by_bucket[b]
+                merged.merge(KLLSketch.from_bytes(blob))
+                covered += n
+                if covered >= MIN_BUCKET_N:
+                    break
+        return merged.quantile(q)
 
-    def predict_correction(self, route_key, mode):
+    def predict_correction(self, route_key, mode, percentile=None, when=None):
         """
-        Return (mean_error, std_error) — positive means actual > predicted => add time
+        Return (correction, std_error) — positive means actual > predicted => add time
+        Without percentile the correction is the exponentially decayed mean
+        error from eta_summary (O(1) per call). With percentile (e.g. 90) it
+        is that percentile of the error for trips at the hour of week of
+        `when`, so scheduling on it is late only ~10% of the time.
         """
-        s = self.summarize(route_key, mode)
+        s = self.route_stats(route_key, mode)
         if not s:
             return 0.0, 0.0
-        return s["mean_error"], s["std_error"]
+        std = math.sqrt(max(0.0, s["ew_var"]))
+        if percentile is None:
+            return s["ew_mean"], std
+        err = self.error_quantile(route_key, mode, percentile / 100.0, when)
+        return (s["ew_mean"] if err is None else err), std
 
     def train_simple_model(self, route_key, mode):
         """
-        (optional) train a linear regression: actual ~ predicted
+        (optional) least-squares fit actual ~ predicted from the running sums
         returns (slope, intercept) if trained else None
         """
-        conn = sqlite3.connect(self.dbpath)
-        c = conn.cursor()
-        c.execute("SELECT predicted, actual FROM eta_history WHERE route_key=? AND mode=?", (route_key, mode))
-        rows = c.fetchall()
-        conn.close()
-        if len(rows) < 10:
+        s = self.route_stats(route_key, mode)
+        if not s or s["n"] < 10:
             return None
-        X = [[r[0]] for r in rows]
-        y = [r[1] for r in rows]
-        model = LinearRegression().fit(X, y)
-        return float(model.coef_[0]), float(model.intercept_)
+        n = s["n"]
+        sxx = n * s["sum_pp"] - s["sum_p"] ** 2
+        sxy = n * s["sum_pa"] - s["sum_p"] * s["sum_a"]
+        slope = sxy / sxx if sxx else 0.0
+        intercept = (s["sum_a"] - slope * s["sum_p"]) / n
+        return float(slope), float(intercept)
+
+def read_archive(path):
+    """yield (route_key, mode, predicted, actual, timestamp) rows of a compact() archive (add_records() input)"""
+    with np.load(path, allow_pickle=False) as z:
+        routes, modes = z["route_names"], z["mode_names"]
+        stamps = z["timestamp_us"].astype("datetime64[us]").astype(str)
+        for rc, mc, p, a, ts in zip(z["route_code"], z["mode_code"], z["predicted"], z["actual"], stamps):
+            yield str(routes[rc]), str(modes[mc]), int(p), int(a), str(ts)
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Roll up and archive old eta_history rows (run nightly).")
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--older-than-days", type=int, default=RETENTION_DAYS)
+    ap.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    ap.add_argument("--no-vacuum", action="store_true")
+    ap.add_argument("--chunk", type=int, default=COMPACT_CHUNK, help="rows archived / deleted per transaction")
+    args = ap.parse_args()
+    res = HistoryAgent(args.db).compact(args.older_than_days, args.archive_dir, vacuum=not args.no_vacuum,
+                                        chunk=args.chunk)
+    print(f"archived {res['rows']} rows into {res['days']} daily rollups -> {len(res['archives'])} archives in {args.archive_dir}")
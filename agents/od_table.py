@@ -0,0 +1,277 @@
+# agents/od_table.py
+"""
+Precomputed origin–destination ETAs for recurring commutes.
+
+Most plans are the same commuters sending the same start|end pair every
+morning. A nightly job takes the frequent route keys from eta_history and
+stores, per (addresses, target_time) and mode, everything plan() would
+otherwise recompute at peak: coordinates, minutes, route polyline / transit
+legs, crossings and signal penalty, plus the weather and history correction
+terms. plan() then only adds the live parts (traffic delay, arrival waits,
+percentile correction, weather when the stored forecast is superseded).
+
+    python -m agents.od_table                      # nightly: rebuild stale routes
+    python -m agents.od_table --target-times 08:00,08:40,09:00 --min-trips 5
+    python -m agents.od_table --incremental        # hourly: weather + history terms only
+
+Routes are rebuilt after MAX_AGE_S; in between a refresh only rewrites
+the weather of entries whose KMA forecast has been superseded and the
+correction terms of modes whose eta_summary trip count moved.
+"""
+import json, os, sqlite3, threading, time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from utils import metrics
+from utils.map_utils import normalize_address
+
+DB_PATH = os.environ.get("OD_TABLE_DB") or os.path.join(os.path.dirname(__file__), "..", "od_table.db")
+
+# routes / timetables change slowly; older entries are rebuilt (and not served)
+MAX_AGE_S = 3 * 24 * 3600
+
+# a route key needs this many trips in the last FREQUENT_DAYS to be precomputed
+MIN_TRIPS = 10
+FREQUENT_DAYS = 30
+MAX_ROUTES = 5000
+TARGET_TIMES = ("08:40",)
+
+def od_key(start_addr, end_addr):
+    return f"{normalize_address(start_addr)}|{normalize_address(end_addr)}"
+
+def _points(blob, cols):
+    return [tuple(float(v) for v in row) for row in np.frombuffer(blob, dtype=np.float64).reshape(-1, cols)]
+
+def _blob(points, cols):
+    return np.asarray(points, dtype=np.float64).reshape(-1, cols).tobytes()
+
+def _weather_key(key):
+    return None if key is None else json.dumps(list(key))
+
+def _history_terms(ha, route_key, mode):
+    """(mean_err, std_err, trips) as plan() would use them without a percentile"""
+    s = ha.route_stats(route_key, mode)
+    mean, std = ha.predict_correction(route_key, mode)
+    return mean, std, s["n"] if s else 0
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def od_table(path=DB_PATH):
+    """shared ODTable, or None until the precompute job has created the database"""
+    global _shared
+    if _shared is None and os.path.exists(path):
+        with _shared_lock:
+            if _shared is None:
+                _shared = ODTable(path)
+    return _shared
+
+class ODTable:
+    def __init__(self, path=DB_PATH, max_age_s=MAX_AGE_S):
+        self.path = path
+        self.max_age_s = max_age_s
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS od_route (
+            od_key TEXT,
+            target_time TEXT,
+            route_key TEXT,
+            start_lat REAL,
+            start_lon REAL,
+            end_lat REAL,
+            end_lon REAL,
+            weather_key TEXT,
+            rain INTEGER,
+            built REAL,
+            PRIMARY KEY (od_key, target_time)
+        )
+        """)
+        # one row per mode available on the route; coords / crossings are float64 blobs
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS od_mode (
+            od_key TEXT,
+            target_time TEXT,
+            mode TEXT,
+            minutes INTEGER,
+            signal_penalty INTEGER,
+            coords BLOB,
+            crossings BLOB,
+            legs TEXT,
+            mean_err REAL,
+            std_err REAL,
+            hist_n INTEGER,
+            timetabled INTEGER DEFAULT 0,
+            PRIMARY KEY (od_key, target_time, mode)
+        )
+        """)
+        # tables created before minutes were flagged as timetable-based
+        if "timetabled" not in {r[1] for r in conn.execute("PRAGMA table_info(od_mode)")}:
+            conn.execute("ALTER TABLE od_mode ADD COLUMN timetabled INTEGER DEFAULT 0")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self):
+        return self._conn().execute("SELECT count(*) FROM od_route").fetchone()[0]
+
+    # ---------- serving ----------
+    def get(self, start_addr, end_addr, target_time="08:40"):
+        """
+        Stored entry for the commute, or None when it is not precomputed or
+        older than max_age_s: {"start_coord", "end_coord", "weather_key",
+        "rain", "modes": {mode: {"minutes", "timetabled", "signal_penalty",
+        "coords", "crossings", "legs", "mean_err", "std_err"}}}
+        """
+        key, tt = od_key(start_addr, end_addr), (target_time or "").strip()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT start_lat, start_lon, end_lat, end_lon, weather_key, rain, built FROM od_route "
+            "WHERE od_key=? AND target_time=?", (key, tt)).fetchone()
+        if row is None or time.time() - row[6] > self.max_age_s:
+            metrics.cache("od_table", False)
+            return None
+        metrics.cache("od_table", True)
+        modes = {}
+        for mode, minutes, timetabled, penalty, coords, crossings, legs, mean, std in conn.execute(
+                "SELECT mode, minutes, timetabled, signal_penalty, coords, crossings, legs, mean_err, std_err FROM od_mode "
+                "WHERE od_key=? AND target_time=?", (key, tt)):
+            if legs is not None:
+                legs = json.loads(legs)
+                for leg in legs:
+                    leg["coords"] = [tuple(c) for c in leg["coords"]]
+            modes[mode] = {"minutes": minutes, "timetabled": bool(timetabled), "signal_penalty": penalty, "coords": _points(coords, 2),
+                           "crossings": [(lat, lon, int(w)) for lat, lon, w in _points(crossings, 3)],
+                           "legs": legs, "mean_err": mean, "std_err": std}
+        return {"start_coord": (row[0], row[1]), "end_coord": (row[2], row[3]),
+                "weather_key": tuple(json.loads(row[4])) if row[4] else None,
+                "rain": bool(row[5]), "modes": modes}
+
+    # ---------- precompute ----------
+    def _weather(self, da, coord):
+        w = da.get_weather(coord)
+        # a fallback (no forecast) is not stored as current, so plan() fetches live
+        key = da.forecast_key(coord)[0] if w.get("forecast") is not None else None
+        return _weather_key(key), int(bool(w.get("rain")))
+
+    def build(self, pa, route_key, target_time):
+        """precompute and store one route key at one target time"""
+        start_addr, _, end_addr = route_key.partition("|")
+        with metrics.span("od_build"):
+            entry = pa.precompute(start_addr, end_addr, target_time)
+        weather_key, rain = self._weather(pa.da, entry["start_coord"])
+        key = od_key(start_addr, end_addr)
+        rows = []
+        for mode, m in entry["modes"].items():
+            mean, std, n = _history_terms(pa.ha, route_key, mode)
+            rows.append((key, target_time, mode, m["minutes"], m["signal_penalty"], _blob(m["coords"], 2),
+                         _blob(m["crossings"], 3), None if m["legs"] is None else json.dumps(m["legs"], ensure_ascii=False),
+                         mean, std, n, int(m["timetabled"])))
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM od_mode WHERE od_key=? AND target_time=?", (key, target_time))
+            conn.executemany("INSERT INTO od_mode VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("INSERT OR REPLACE INTO od_route VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         (key, target_time, route_key, *entry["start_coord"], *entry["end_coord"],
+                          weather_key, rain, time.time()))
+
+    def _update_terms(self, pa, key, target_time, route_key, start_coord, weather_key):
+        """(weather updated, modes with new history terms) for one stored entry"""
+        conn = self._conn()
+        weather = 0
+        if weather_key != _weather_key(pa.da.forecast_key(start_coord)[0]):
+            with conn:
+                conn.execute("UPDATE od_route SET weather_key=?, rain=? WHERE od_key=? AND target_time=?",
+                             (*self._weather(pa.da, start_coord), key, target_time))
+            weather = 1
+        updates = []
+        for mode, hist_n in conn.execute(
+                "SELECT mode, hist_n FROM od_mode WHERE od_key=? AND target_time=?", (key, target_time)).fetchall():
+            s = pa.ha.route_stats(route_key, mode)
+            if (s["n"] if s else 0) != hist_n:
+                updates.append((*_history_terms(pa.ha, route_key, mode), key, target_time, mode))
+        if updates:
+            with conn:
+                conn.executemany("UPDATE od_mode SET mean_err=?, std_err=?, hist_n=? "
+                                 "WHERE od_key=? AND target_time=? AND mode=?", updates)
+        return weather, len(updates)
+
+    @metrics.timed("od_refresh")
+    def refresh(self, pa, target_times=TARGET_TIMES, min_trips=MIN_TRIPS, days=FREQUENT_DAYS, limit=MAX_ROUTES,
+                incremental=False, workers=4):
+        """
+        Bring the table in line with the frequent routes of pa.ha: build
+        missing or expired entries (unless incremental), refresh weather /
+        history terms of the rest, drop routes that are no longer frequent.
+        Returns counts {"routes", "built", "weather", "history", "failed", "dropped"}.
+        """
+        conn = self._conn()
+        stored = {(k, tt): (rk, (slat, slon), wk, built) for k, tt, rk, slat, slon, wk, built in conn.execute(
+            "SELECT od_key, target_time, route_key, start_lat, start_lon, weather_key, built FROM od_route")}
+        wanted = {}
+        for route_key, _ in pa.ha.frequent_routes(min_trips, days, limit):
+            start_addr, sep, end_addr = route_key.partition("|")
+            if sep:
+                for tt in target_times:
+                    wanted.setdefault((od_key(start_addr, end_addr), tt), route_key)
+        counts = {"routes": len(wanted), "built": 0, "weather": 0, "history": 0, "failed": 0, "dropped": 0}
+
+        now = time.time()
+        build, update = [], []
+        for (key, tt), route_key in wanted.items():
+            cur = stored.get((key, tt))
+            if cur is None or (not incremental and (now - cur[3] > self.max_age_s or cur[0] != route_key)):
+                if not incremental:
+                    build.append((route_key, tt))
+            else:
+                update.append((key, tt, cur[0], cur[1], cur[2]))
+
+        def run_build(args):
+            try:
+                self.build(pa, *args)
+                return True
+            except Exception:
+                metrics.fallback("od_build")
+                return False
+
+        def run_update(args):
+            return self._update_terms(pa, *args)
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="od-table") as pool:
+            for ok in pool.map(run_build, build):
+                counts["built" if ok else "failed"] += 1
+            for weather, history in pool.map(run_update, update):
+                counts["weather"] += weather
+                counts["history"] += history
+
+        gone = [k for k in stored if k not in wanted]
+        if gone and not incremental:
+            with conn:
+                conn.executemany("DELETE FROM od_route WHERE od_key=? AND target_time=?", gone)
+                conn.executemany("DELETE FROM od_mode WHERE od_key=? AND target_time=?", gone)
+            counts["dropped"] = len(gone)
+        return counts
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Precompute ETAs for frequent commutes (run nightly, --incremental hourly).")
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--target-times", default=",".join(TARGET_TIMES), help="HH:MM arrival times to precompute")
+    ap.add_argument("--min-trips", type=int, default=MIN_TRIPS)
+    ap.add_argument("--days", type=int, default=FREQUENT_DAYS)
+    ap.add_argument("--limit", type=int, default=MAX_ROUTES)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--incremental", action="store_true", help="only refresh weather and history terms")
+    args = ap.parse_args()
+    from agents.plan_agent import PlanAgent
+    table = ODTable(args.db)
+    res = table.refresh(PlanAgent(od=table), [t.strip() for t in args.target_times.split(",") if t.strip()],
+                        args.min_trips, args.days, args.limit, incremental=args.incremental, workers=args.workers)
+    print(f"{res['routes']} frequent route/time pairs: built {res['built']}, failed {res['failed']}, "
+          f"weather {res['weather']}, history {res['history']}, dropped {res['dropped']}")
@@ -0,0 +1,286 @@
+# agents/plan_agent.py
+import sys, time
+from datetime import date
+import numpy as np
+from utils.map_utils import geocode, normalize_address
+from agents.data_agent import DataAgent, PLAN_BUDGET_S
+from agents.route_agent import RouteAgent, journey_minutes, map_polyline
+from agents.history_agent import HistoryAgent
+from agents.schedule_agent import ScheduleAgent
+from agents.arrival_service import arrival_service
+from agents.od_table import od_table
+from utils import metrics
+from utils.cache import TTLCache
+
+# "transit" = multi-leg walk/bus/subway trip on the local timetable (TRANSIT_PATH)
+ALL_MODES = ("walk", "bus", "subway", "transit")
+
+# zoom the result map opens at; route polylines are kept simplified to ~1 px
+# there (crossings are looked up on the full-resolution route first)
+MAP_ZOOM = 13
+
+# identical inputs within this window reuse the previous plan (reruns, double clicks)
+PLAN_MEMO_TTL_S = 120
+_plan_memo = TTLCache(maxsize=1024, ttl_s=PLAN_MEMO_TTL_S)
+
+class PlanError(ValueError):
+    """input problem that prevents a plan (address not found, no mode allowed)"""
+
+def osrm_profile(mode):
+    return "walking" if mode == "walk" else "driving"
+
+class PlanResult:
+    """
+    What a plan keeps after it is computed: scalars, the route as one float32
+    (N,2) array, crossings as float32 (M,3) (lat, lon, wait s) and transit
+    legs without their points (leg i is coords[leg_ends[i-1]:leg_ends[i]]).
+    Upstream payloads (the KMA forecast) are not kept, only the rain flag.
+    Held per session and in the plan memo, so a few KB instead of Python
+    tuples per polyline point.
+    """
+    __slots__ = ("best_mode", "base_minutes", "final_minutes", "wake_dt", "rain", "traffic_delay", "wait_eta",
+                 "signal_penalty", "mean_err", "std_err", "percentile", "start_coord", "end_coord",
+                 "coords", "crossings", "legs", "leg_ends", "progressive_levels")
+
+    def __init__(self, best_mode, base_minutes, final_minutes, wake_dt, rain, traffic_delay, wait_eta,
+                 signal_penalty, mean_err, std_err, percentile, start_coord, end_coord,
+                 coords=(), crossings=(), legs=None, progressive_levels=()):
+        self.best_mode = best_mode
+        self.base_minutes = int(base_minutes)
+        self.final_minutes = int(final_minutes)
+        self.wake_dt = wake_dt
+        self.rain = bool(rain)
+        self.traffic_delay = int(traffic_delay)
+        self.wait_eta = int(wait_eta)
+        self.signal_penalty = int(signal_penalty)
+        self.mean_err = float(mean_err)
+        self.std_err = float(std_err)
+        self.percentile = percentile
+        self.start_coord = (float(start_coord[0]), float(start_coord[1]))
+        self.end_coord = (float(end_coord[0]), float(end_coord[1]))
+        self.coords = np.asarray(coords, dtype=np.float32).reshape(-1, 2)
+        self.crossings = np.asarray(crossings, dtype=np.float32).reshape(-1, 3)
+        self.legs = None
+        self.leg_ends = None
+        if legs:
+            self.legs = tuple({k: v for k, v in leg.items() if k != "coords"} for leg in legs)
+            self.leg_ends = np.cumsum([len(leg["coords"]) for leg in legs]).astype(np.int32)
+        self.progressive_levels = tuple(progressive_levels)
+
+    def leg_coords(self, i):
+        start = int(self.leg_ends[i - 1]) if i else 0
+        return self.coords[start:int(self.leg_ends[i])]
+
+    def nbytes(self):
+        """approximate memory held by this result: the object, its arrays, strings and leg dicts"""
+        n = sys.getsizeof(self)
+        for name in self.__slots__:
+            v = getattr(self, name)
+            if isinstance(v, np.ndarray):
+                # getsizeof counts the buffer only when the array owns it
+                n += sys.getsizeof(v) + (v.nbytes if v.base is not None else 0)
+            elif isinstance(v, tuple) and name == "legs":
+                n += sys.getsizeof(v) + sum(sys.getsizeof(leg) + sum(sys.getsizeof(x) for x in leg.values())
+                                            for leg in v)
+            elif v is not None:
+                n += sys.getsizeof(v)
+        return n
+
+class PlanAgent:
+    """
+    geocode -> mode choice -> weather + route -> crossings along the route
+    -> history correction -> wake-up time. Shared by the Streamlit page and the batch CLI.
+    Recurring commutes found in the precomputed OD table (agents/od_table.py)
+    skip geocoding and routing; only traffic, weather, waits and the
+    percentile correction are looked up live.
+    """
+    def __init__(self, data_agent=None, route_agent=None, history_agent=None, arrivals=None, od=None):
+        self.da = data_agent or DataAgent()
+        self.ra = route_agent or RouteAgent()
+        self.ha = history_agent or HistoryAgent()
+        self.arrivals = arrivals or arrival_service()
+        self._od = od
+
+    @property
+    def od(self):
+        # resolved per plan(): the table appears once the first precompute job has run
+        return self._od if self._od is not None else od_table()
+
+    @staticmethod
+    def plan_key(start_addr, end_addr, target_time="08:40", prep_minutes=30, safety_margin=5,
+                 modes=ALL_MODES, use_history=True, progressive_levels=(), day=None,
+                 bus_station_id=None, subway_station=None, percentile=None, **_):
+        """normalized, hashable form of the plan() inputs; budget_s is not part of it"""
+        return (
+            normalize_address(start_addr), normalize_address(end_addr), (target_time or "").strip(),
+            tuple(m for m in ALL_MODES if m in modes), int(prep_minutes), int(safety_margin),
+            bool(use_history), tuple(sorted(set(progressive_levels), reverse=True)), day,
+            (bus_station_id or "").strip() or None, (subway_station or "").strip() or None,
+            None if percentile is None else int(percentile),
+        )
+
+    def plan_cached(self, *args, **kwargs):
+        """plan() memoized for PLAN_MEMO_TTL_S on plan_key(); PlanError is not cached"""
+        key = self.plan_key(*args, **kwargs)
+        result = _plan_memo.get(key)
+        metrics.cache("plan", result is not None)
+        if result is None:
+            result = self.plan(*args, **kwargs)
+            _plan_memo.set(key, result)
+        return result
+
+    def mode_options(self, start_coord, end_coord, modes, arrive_by, traffic_delay=0):
+        """
+        ([(mode, minutes)] in ALL_MODES order, transit journey or None,
+        set of modes timed by the timetable). Timetable modes count from the
+        found journey's leave time to arrive_by; that already covers the wait
+        at the stop and the scheduled run, so they get no traffic delay.
+        """
+        ra = self.ra
+        options, timed = [], set()
+        if "walk" in modes:
+            options.append(("walk", ra.estimate_walk_minutes(start_coord, end_coord)))
+        for mode in ("bus", "subway"):
+            if mode in modes:
+                minutes, timetabled = ra.estimate_minutes(start_coord, end_coord, mode, arrive_by)
+                if timetabled:
+                    timed.add(mode)
+                elif mode == "bus":
+                    minutes += traffic_delay
+                options.append((mode, minutes))
+        journey = ra.transit_journey(start_coord, end_coord, arrive_by) if "transit" in modes else None
+        if journey:  # rides at least one vehicle and arrives by arrive_by
+            options.append(("transit", journey_minutes(journey, arrive_by)))
+            timed.add("transit")
+        return options, journey, timed
+
+    def precompute(self, start_addr, end_addr, target_time="08:40"):
+        """
+        Time-of-day independent part of plan() for every mode: coordinates,
+        timetable/straight-line minutes (bus without traffic delay), route
+        polyline or transit legs, crossings and signal penalty. The OD table
+        stores this per (addresses, target_time).
+        """
+        start_coord, end_coord = geocode(start_addr), geocode(end_addr)
+        options, journey, timed = self.mode_options(start_coord, end_coord, ALL_MODES, ScheduleAgent(target_time).target_dt())
+        modes = {}
+        for mode, minutes in options:
+            legs = journey["legs"] if mode == "transit" else None
+            if legs is None:
+                coords = self.ra.get_osrm_coords(start_coord, end_coord, osrm_profile(mode))
+            else:
+                coords = [pt for leg in legs for pt in leg["coords"]]
+            crossings = self.da.get_crossings_info(start_coord, end_coord, route_coords=coords)
+            if legs is None:
+                coords = map_polyline(coords, MAP_ZOOM)
+            modes[mode] = {"minutes": minutes, "timetabled": mode in timed, "coords": coords, "crossings": crossings, "legs": legs,
+                           "signal_penalty": self.da.traffic_light_penalty_minutes(crossings)}
+        return {"start_coord": start_coord, "end_coord": end_coord, "modes": modes}
+
+    @metrics.timed("plan")
+    def plan(self, start_addr, end_addr, target_time="08:40", prep_minutes=30, safety_margin=5,
+             modes=ALL_MODES, use_history=True, progressive_levels=(), day=None, budget_s=PLAN_BUDGET_S,
+             bus_station_id=None, subway_station=None, percentile=None):
+        """
+        Returns a PlanResult. percentile=None corrects the ETA by the recent
+        mean error; e.g. percentile=90 uses the p90 error of trips at this
+        hour of the week.
+        """
+        da, ra, ha = self.da, self.ra, self.ha
+        # 모든 외부 호출은 하나의 마감 시간(budget_s)을 공유
+        deadline = time.monotonic() + budget_s
+        sa = ScheduleAgent(target_time, prep_minutes, safety_margin)
+        route_key = f"{start_addr}|{end_addr}"
+
+        # 반복 통근: 미리 계산된 OD 테이블에서 좌표/경로/교차로를 가져옴
+        table = self.od
+        od = table.get(start_addr, end_addr, target_time) if table is not None else None
+        if od is not None:
+            start_coord, end_coord = od["start_coord"], od["end_coord"]
+        else:
+            # 1단계: 출발지/목적지 지오코딩 (동시에)
+            geo, geo_failed = da.gather({
+                "start": (geocode, (start_addr, deadline), None),
+                "end": (geocode, (end_addr, deadline), None),
+            }, deadline)
+            if geo_failed:
+                raise PlanError("주소 변환 실패: " + ", ".join(f"{k}: {e}" for k, e in geo_failed.items()))
+            start_coord, end_coord = geo["start"], geo["end"]
+
+        traffic_delay = da.get_traffic_delay(start_coord, end_coord, sa.target_dt(day))
+
+        # the signal penalty is the same for every mode, so the mode is chosen
+        # first and crossings are looked up along that mode's actual route
+        if od is not None:
+            timed = {m for m, row in od["modes"].items() if row["timetabled"]}
+            options = [(m, od["modes"][m]["minutes"] + (traffic_delay if m == "bus" and m not in timed else 0))
+                       for m in ALL_MODES if m in modes and m in od["modes"]]
+        else:
+            options, journey, timed = self.mode_options(start_coord, end_coord, modes, sa.target_dt(day), traffic_delay)
+
+        if not options:
+            raise PlanError("이동수단을 선택하세요.")
+
+        best_mode, base_minutes = min(options, key=lambda x: x[1])
+
+        # 2단계: 날씨 + 경로 (동시에, 남은 예산 안에서 / 초과 시 각자 fallback)
+        calls = {}
+        if od is None or od["weather_key"] != da.forecast_key(start_coord)[0]:
+            calls["weather"] = (da.get_weather, (start_coord,), {"rain": False, "forecast": None})
+        if od is not None:
+            legs = od["modes"][best_mode]["legs"]
+        else:
+            legs = journey["legs"] if best_mode == "transit" else None
+            if legs is None:
+                calls["coords"] = (ra.get_osrm_coords, (start_coord, end_coord, osrm_profile(best_mode)), [])
+        # 실시간 도착 정보 (정류소/역이 주어진 경우, 세션 간 공유 캐시) — 오늘 통근에만
+        station = {"bus": bus_station_id, "subway": subway_station}.get(best_mode)
+        if day is not None and day > date.today():
+            station = None  # 내일 이후의 계획에 지금의 대기 시간을 더하지 않음
+        if best_mode in timed:
+            station = None  # 시간표 여정의 출발 시각에 이미 배차 대기가 포함됨
+        if station:
+            calls["wait"] = (self.arrivals.get, (best_mode, station), 0)
+        fetched, _ = da.gather(calls, deadline)
+        weather = fetched.get("weather") or {"rain": od["rain"], "forecast": None}
+        wait_eta = fetched.get("wait", 0)
+
+        if od is not None:
+            row = od["modes"][best_mode]
+            coords, crossings, signal_penalty = row["coords"], row["crossings"], row["signal_penalty"]
+        else:
+            # transit: the polyline follows the stops of each leg
+            coords = fetched["coords"] if legs is None else [pt for leg in legs for pt in leg["coords"]]
+            crossings = da.get_crossings_info(start_coord, end_coord, route_coords=coords)
+            signal_penalty = da.traffic_light_penalty_minutes(crossings)
+            if legs is None:
+                coords = map_polyline(coords, MAP_ZOOM)  # 지도 표시/저장용으로만 단순화
+        base_minutes += signal_penalty
+
+        mean_err, std_err = (0, 0)
+        if use_history:
+            if od is not None and percentile is None:
+                mean_err, std_err = od["modes"][best_mode]["mean_err"], od["modes"][best_mode]["std_err"]
+            else:
+                mean_err, std_err = ha.predict_correction(route_key, best_mode,
+                                                          percentile=percentile, when=sa.target_dt(day))
+
+        final_minutes = max(1, int(base_minutes + mean_err))
+
+        weather_pen = 5 if weather.get("rain") else 0
+
+        wake_dt = sa.compute_wakeup_dt(
+            final_minutes,
+            wait_eta=wait_eta,
+            weather_penalty=weather_pen,
+            day=day
+        )
+        if station:
+            self.arrivals.watch(best_mode, station, wake_dt)
+        metrics.maybe_write_snapshot()
+
+        return PlanResult(
+            best_mode, base_minutes, final_minutes, wake_dt, weather.get("rain"), traffic_delay, wait_eta,
+            signal_penalty, mean_err, std_err, percentile, start_coord, end_coord,
+            coords=coords, crossings=crossings, legs=legs, progressive_levels=progressive_levels
+        )
@@ -1,41 +1,181 @@
 # agents/route_agent.py
-import requests, math
+import threading
+from datetime import datetime
+import numpy as np
+from utils import http, metrics
+from utils.api_keys import OSRM_URL, TRANSIT_PATH
+from utils.cache import TTLCache
+from utils.geo import haversine_matrix, haversine_km, simplify_polyline, zoom_tolerance_m
+from utils.transit import TransitNetwork, route_mode
+
+# straight-line average speeds (km/h) per mode
+MODE_SPEEDS_KMH = {"walk": 4.5, "bus": 25.0, "subway": 40.0}
+
+# endpoints are rounded to ~10 m for the route cache key
+ROUTE_KEY_DECIMALS = 4
+
+# process-wide OSRM route cache: key -> (N,2) float array of (lat, lon)
+_route_cache = TTLCache(maxsize=2048, ttl_s=6*3600)
+
+# timetable journeys: key -> journey dict (or None), per arrival deadline minute
+_journey_cache = TTLCache(maxsize=4096, ttl_s=15*60)
+_MISS = object()
+
+_transit = None
+_transit_lock = threading.Lock()
+
+def transit_network(path=TRANSIT_PATH):
+    """shared memory-mapped TransitNetwork, or None when none is configured / loadable"""
+    global _transit
+    if _transit is None and path:
+        with _transit_lock:
+            if _transit is None:
+                try:
+                    _transit = TransitNetwork.load(path)
+                except Exception:
+                    _transit = False
+    return _transit or None
+
+def journey_minutes(j, arrive_by=None):
+    """
+    Minutes to budget for a timetable journey: from its leave time to the
+    deadline arrive_by (so the wake-up time follows the trip that was found),
+    or its travel time when there is no deadline.
+    """
+    if arrive_by is None:
+        return j["minutes"]
+    deadline = arrive_by.hour * 3600 + arrive_by.minute * 60
+    return -(-(deadline - j["leave_s"]) // 60)
+
+def map_polyline(coords, zoom):
+    """(lat, lon) polyline Douglas–Peucker simplified to about one pixel at the map zoom"""
+    if len(coords) < 3:
+        return list(coords)
+    tolerance_m = zoom_tolerance_m(zoom, sum(c[0] for c in coords) / len(coords))
+    return [(float(lat), float(lon)) for lat, lon in simplify_polyline(coords, tolerance_m)]
 
 class RouteAgent:
-    def __init__(self):
-        pass
+    """
+    Travel-time estimates. With a compiled timetable (TRANSIT_PATH) bus and
+    subway times come from RAPTOR journeys that arrive by the deadline, and
+    transit_journey() gives multi-leg walk/bus/subway trips; without one (or
+    when no ride of that kind helps) they fall back to straight-line
+    distance / MODE_SPEEDS_KMH.
+    """
+    def __init__(self, osrm_url=OSRM_URL, transit=None):
+        self.osrm_url = osrm_url.rstrip("/")
+        self._transit = transit
 
     def haversine_km(self, a, b):
-        R=6371.0
-        lat1,lon1=map(math.radians,a)
-        lat2,lon2=map(math.radians,b)
-        dlat=lat2-lat1; dlon=lon2-lon1
-        aa=math.sin(dlat/2)**2 + math.cos(lat1)*math.cos(lat2)*math.sin(dlon/2)**2
-        c=2*math.atan2(math.sqrt(aa), math.sqrt(1-aa))
-        return R*c
+        return haversine_km(a, b)
+
+    def eta_matrix(self, origins, destinations, modes=("walk", "bus", "subway"), speeds=None):
+        """
+        origins (N,2), destinations (M,2) as (lat, lon) -> {mode: (N,M) int minutes}.
+        Pairwise distances are computed once and shared by every mode.
+        """
+        speeds = {**MODE_SPEEDS_KMH, **(speeds or {})}
+        km = haversine_matrix(origins, destinations)
+        out = {}
+        buf = np.empty_like(km)
+        for mode in modes:
+            np.divide(km, speeds[mode], out=buf); buf *= 60
+            minutes = buf.astype(np.int32)  # truncation, same as int() for positive values
+            np.maximum(minutes, 1, out=minutes)
+            out[mode] = minutes
+        return out
+
+    def _estimate(self, start, end, mode, speed_kmh=None):
+        speeds = {mode: speed_kmh} if speed_kmh is not None else None
+        return int(self.eta_matrix(start, end, modes=(mode,), speeds=speeds)[mode][0, 0])
 
     def estimate_walk_minutes(self, start, end, speed_kmh=4.5):
-        km = self.haversine_km(start, end)
-        return max(1, int((km / speed_kmh) * 60))
+        return self._estimate(start, end, "walk", speed_kmh)
+
+    def estimate_minutes(self, start, end, mode, arrive_by=None):
+        """
+        (minutes, timetabled) for bus / subway. timetabled is True when the
+        minutes come from a timetable journey, whose leave time already
+        includes the wait for the scheduled vehicle.
+        """
+        j = self.transit_journey(start, end, arrive_by, mode=mode)
+        if j:
+            return journey_minutes(j, arrive_by), True
+        return self._estimate(start, end, mode), False
+
+    def estimate_bus_minutes(self, start, end, arrive_by=None):
+        return self.estimate_minutes(start, end, "bus", arrive_by)[0]
+
+    def estimate_subway_minutes(self, start, end, arrive_by=None):
+        return self.estimate_minutes(start, end, "subway", arrive_by)[0]
+
+    # ---------- timetable routing ----------
+    @property
+    def transit(self):
+        return self._transit if self._transit is not None else transit_network()
 
-    def estimate_bus_minutes(self, start, end):
-        km = self.haversine_km(start, end)
-        return max(1, int((km / 25) * 60))
+    def transit_journey(self, start, end, arrive_by=None, mode="transit"):
+        """
+        Latest-leaving journey on the loaded timetable that arrives by
+        arrive_by (datetime; default: leave now, earliest arrival). mode
+        "bus" / "subway" rides only that kind of vehicle, "transit" mixes
+        them. Returns the TransitNetwork.query() dict (leave_s, arrive_s,
+        minutes, transfers, legs) when it rides at least one vehicle, else
+        None (no timetable, no stop in walking range, walking is faster or
+        nothing arrives in time).
+        """
+        net = self.transit
+        if net is None:
+            return None
+        when = arrive_by or datetime.now()
+        secs = when.hour * 3600 + when.minute * 60
+        key = (tuple(round(float(v), ROUTE_KEY_DECIMALS) for v in (*start, *end)), secs, arrive_by is None, mode)
+        j = _journey_cache.get(key, _MISS)
+        metrics.cache("journey", j is not _MISS)
+        if j is not _MISS:
+            return j
+        types = None
+        if mode != "transit":
+            types = [int(t) for t in np.unique(net.route_type) if route_mode(t) == mode]
+        with metrics.span("raptor", mode=mode):
+            if arrive_by is None:
+                j = net.query(start, end, secs, route_types=types)
+            else:
+                j = net.query_arrive_by(start, end, secs, route_types=types)
+        if j is not None and len(j["legs"]) < 2:  # walk-only: no ride helps
+            j = None
+        _journey_cache.set(key, j)
+        return j
 
-    def estimate_subway_minutes(self, start, end):
-        km = self.haversine_km(start, end)
-        return max(1, int((km / 40) * 60))
+    def _fetch_osrm(self, start, end, mode):
+        lon1,lat1 = start[1], start[0]
+        lon2,lat2 = end[1], end[0]
+        url = f"{self.osrm_url}/route/v1/{mode}/{lon1},{lat1};{lon2},{lat2}"
+        params = {"overview":"full","geometries":"geojson"}
+        r = http.get(url, params=params, timeout=8, endpoint="osrm")
+        data = r.json()
+        coords = np.asarray(data["routes"][0]["geometry"]["coordinates"], dtype=np.float64)
+        return coords[:, ::-1].copy()  # (lon, lat) -> (lat, lon)
 
-    def get_osrm_coords(self, start, end, mode="walking"):
+    def get_osrm_coords(self, start, end, mode="walking", simplify_zoom=None, tolerance_m=None):
+        """
+        Route polyline as [(lat, lon), ...], [] on failure. Routes are cached
+        per (rounded endpoints, profile). With simplify_zoom (map zoom level) or
+        tolerance_m the line is Douglas–Peucker simplified to about one pixel.
+        """
+        key = (tuple(round(float(v), ROUTE_KEY_DECIMALS) for v in (*start, *end)), mode, self.osrm_url)
         try:
-            lon1,lat1 = start[1], start[0]
-            lon2,lat2 = end[1], end[0]
-            url = f"https://router.project-osrm.org/route/v1/{mode}/{lon1},{lat1};{lon2},{lat2}"
-            params = {"overview":"full","geometries":"geojson"}
-            r = requests.get(url, params=params, timeout=8)
-            r.raise_for_status()
-            data = r.json()
-            coords = data["routes"][0]["geometry"]["coordinates"]
-            return [(lat, lon) for lon,lat in coords]
+            pts = _route_cache.get(key)
+            metrics.cache("osrm_route", pts is not None)
+            if pts is None:
+                with metrics.span("osrm_fetch"):
+                    pts = self._fetch_osrm(start, end, mode)
+                _route_cache.set(key, pts)
         except Exception:
+            metrics.fallback("osrm")
             return []
+        if tolerance_m is None and simplify_zoom is not None and len(pts):
+            tolerance_m = zoom_tolerance_m(simplify_zoom, float(pts[:, 0].mean()))
+        if tolerance_m:
+            pts = simplify_polyline(pts, tolerance_m)
+        return [(float(lat), float(lon)) for lat, lon in pts]
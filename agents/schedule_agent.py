@@ -7,11 +7,15 @@ class ScheduleAgent:
         self.prep_minutes = int(prep_minutes)
         self.safety_margin = int(safety_margin)
 
-    def compute_wakeup_dt(self, travel_minutes, wait_eta=0, weather_penalty=0, extra_margin=0):
-        total = int(travel_minutes) + int(wait_eta) + int(weather_penalty) + int(self.prep_minutes) + int(self.safety_margin) + int(extra_margin)
-        today = datetime.now().date()
+    def target_dt(self, day=None):
+        # day: date of the commute (default today)
+        today = day or datetime.now().date()
         sh, sm = map(int, self.target_time_str.split(":"))
-        school_dt = datetime.combine(today, datetime.min.time()).replace(hour=sh, minute=sm)
+        return datetime.combine(today, datetime.min.time()).replace(hour=sh, minute=sm)
+
+    def compute_wakeup_dt(self, travel_minutes, wait_eta=0, weather_penalty=0, extra_margin=0, day=None):
+        total = int(travel_minutes) + int(wait_eta) + int(weather_penalty) + int(self.prep_minutes) + int(self.safety_margin) + int(extra_margin)
+        school_dt = self.target_dt(day)
         wake_dt = school_dt - timedelta(minutes=total)
         return wake_dt
 
@@ -0,0 +1,147 @@
+# batch_plan.py
+"""
+Headless batch planner: streams commuter profiles in (CSV or JSONL) and
+plan results out (JSONL), planning several commuters in parallel.
+
+    python batch_plan.py profiles.csv -o plans.jsonl --workers 8 --date 2026-10-18
+
+Profile fields: id, start_addr, end_addr, target_time (HH:MM), prep_minutes,
+safety_margin, modes ("walk,bus,subway,transit"), use_history (true/false),
+bus_station_id, subway_station (real-time wait at the boarding stop),
+percentile (e.g. 90: schedule on the p90 history error for that hour of week).
+Only start_addr and end_addr are required.
+"""
+import argparse, csv, json, sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from agents.plan_agent import PlanAgent, ALL_MODES
+
+def read_profiles(fp, fmt):
+    if fmt == "csv":
+        yield from csv.DictReader(fp)
+    else:
+        for line in fp:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+def _bool(v, default=True):
+    if v is None or v == "":
+        return default
+    if isinstance(v, bool):
+        return v
+    return str(v).strip().lower() in ("1", "true", "yes", "y")
+
+def _modes(v):
+    if not v:
+        return ALL_MODES
+    if isinstance(v, str):
+        v = v.replace("|", ",").split(",")
+    return tuple(m.strip() for m in v if m.strip())
+
+def plan_kwargs(profile, day=None):
+    """profile dict (CSV row, JSONL object or HTTP body) -> PlanAgent.plan() keyword arguments"""
+    return dict(
+        start_addr=profile["start_addr"], end_addr=profile["end_addr"],
+        target_time=profile.get("target_time") or "08:40",
+        prep_minutes=int(profile.get("prep_minutes") or 30),
+        safety_margin=int(profile.get("safety_margin") or 5),
+        modes=_modes(profile.get("modes")),
+        use_history=_bool(profile.get("use_history")),
+        day=day,
+        bus_station_id=profile.get("bus_station_id") or None,
+        subway_station=profile.get("subway_station") or None,
+        percentile=int(profile["percentile"]) if profile.get("percentile") not in (None, "") else None
+    )
+
+def result_json(r, with_route=False):
+    """PlanResult -> JSON-serializable dict"""
+    out = {
+        "best_mode": r.best_mode,
+        "base_minutes": r.base_minutes,
+        "final_minutes": r.final_minutes,
+        "wake_dt": r.wake_dt.isoformat(timespec="minutes"),
+        "rain": r.rain,
+        "traffic_delay": r.traffic_delay,
+        "wait_eta": r.wait_eta,
+        "signal_penalty": r.signal_penalty,
+        "mean_err": r.mean_err,
+        "std_err": r.std_err,
+        "percentile": r.percentile,
+        "start_coord": list(r.start_coord),
+        "end_coord": list(r.end_coord),
+    }
+    if r.legs:
+        out["legs"] = [dict(leg, coords=r.leg_coords(i).tolist()) if with_route else dict(leg)
+                       for i, leg in enumerate(r.legs)]
+    if with_route:
+        out["coords"] = r.coords.tolist()
+        out["crossings"] = [[lat, lon, int(w)] for lat, lon, w in r.crossings.tolist()]
+    return out
+
+def plan_profile(pa, profile, day, with_route=False):
+    out = {"id": profile.get("id")}
+    try:
+        r = pa.plan(**plan_kwargs(profile, day))
+    except Exception as e:
+        out["error"] = str(e)
+        return out
+    out.update(result_json(r, with_route))
+    return out
+
+def run(profiles, out_fp, pa=None, workers=8, day=None, with_route=False):
+    """
+    Plans profiles on a worker pool and writes one JSON line per profile in
+    input order. At most 2*workers profiles are in flight, so memory stays
+    bounded however long the input is. Returns (ok, failed) counts.
+    """
+    pa = pa or PlanAgent()
+    window = max(1, 2 * workers)
+    pending = deque()
+    ok = failed = 0
+
+    def drain(n):
+        nonlocal ok, failed
+        while len(pending) > n:
+            res = pending.popleft().result()
+            if "error" in res:
+                failed += 1
+            else:
+                ok += 1
+            out_fp.write(json.dumps(res, ensure_ascii=False) + "\n")
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-plan") as pool:
+        for profile in profiles:
+            pending.append(pool.submit(plan_profile, pa, profile, day, with_route))
+            drain(window)
+        drain(0)
+    out_fp.flush()
+    return ok, failed
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Plan wake-up times for many commuters.")
+    ap.add_argument("input", help="CSV or JSONL file of commuter profiles ('-' for stdin)")
+    ap.add_argument("-o", "--output", default="-", help="JSONL output file (default stdout)")
+    ap.add_argument("--format", choices=("csv", "jsonl"), help="input format (default: from extension)")
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--date", help="commute date YYYY-MM-DD (default tomorrow)")
+    ap.add_argument("--with-route", action="store_true", help="include route polyline and crossings")
+    args = ap.parse_args(argv)
+
+    fmt = args.format or ("csv" if args.input.endswith(".csv") else "jsonl")
+    day = datetime.strptime(args.date, "%Y-%m-%d").date() if args.date else date.today() + timedelta(days=1)
+    fin = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8", newline="")
+    fout = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        ok, failed = run(read_profiles(fin, fmt), fout, workers=args.workers, day=day, with_route=args.with_route)
+    finally:
+        if fin is not sys.stdin:
+            fin.close()
+        if fout is not sys.stdout:
+            fout.close()
+    print(f"planned {ok}, failed {failed}", file=sys.stderr)
+    return 0 if failed == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+# bench/bench_server.py
+"""
+Load test for server.py against local stand-ins (bench/fake_upstream.py).
+
+    python -m bench.bench_server --requests 2000 --clients 50,200,500 -o server.json
+    python -m bench.bench_server --concurrency 32 --queue 64 --latency kma=0.3
+
+Starts the fake upstreams and the API in this process, then drives POST
+/plan from many keep-alive clients. --distinct controls how many different
+address pairs are used (fewer pairs = more plan-memo hits). Reports
+requests/s, latency percentiles and the status mix (503 = backpressure).
+"""
+import argparse, asyncio, json, os, sys, tempfile, threading, time
+from collections import Counter
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from bench.fake_upstream import FakeUpstream, build_config
+from bench.run_bench import _addresses, _git_rev, _stats
+
+async def _client(host, port, bodies, lat, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for body in bodies:
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            t = time.perf_counter()
+            writer.write(b"POST /plan HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+                         + f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            n = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                k, _, v = line.decode("latin-1").partition(":")
+                if k.lower() == "content-length":
+                    n = int(v)
+            await reader.readexactly(n)
+            lat.append(time.perf_counter() - t)
+            statuses[status] += 1
+    finally:
+        writer.close()
+
+async def _drive(host, port, n_requests, clients, distinct):
+    addrs = _addresses(2 * distinct)
+    bodies = [{"start_addr": addrs[(2 * i) % len(addrs)], "end_addr": addrs[(2 * i + 1) % len(addrs)]}
+              for i in range(n_requests)]
+    lat, statuses = [], Counter()
+    t = time.perf_counter()
+    await asyncio.gather(*(_client(host, port, bodies[c::clients], lat, statuses) for c in range(clients)))
+    wall = time.perf_counter() - t
+    return {"requests_per_s": n_requests / wall, "status": dict(statuses), **_stats(lat)}
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Load-test the JSON API with local upstream stand-ins.")
+    ap.add_argument("-o", "--output", default="-")
+    ap.add_argument("--latency", default="nominatim=0.05,kma=0.15,osrm=0.1,bus=0.05,subway=0.05")
+    ap.add_argument("--fail", default="")
+    ap.add_argument("--requests", type=int, default=1000)
+    ap.add_argument("--clients", default="50,200", help="concurrent keep-alive clients per run")
+    ap.add_argument("--distinct", type=int, default=200, help="different address pairs")
+    ap.add_argument("--concurrency", type=int, default=64)
+    ap.add_argument("--queue", type=int, default=256)
+    args = ap.parse_args(argv)
+
+    fake = FakeUpstream(config=build_config(args.latency, args.fail), seed=0).start()
+    tmp = tempfile.mkdtemp(prefix="bench-server-")
+    os.environ.update(fake.env())
+    os.environ["ETA_HISTORY_DB"] = os.path.join(tmp, "eta_history.db")
+    os.environ["GEOCODE_CACHE_DB"] = os.path.join(tmp, "geocode_cache.db")
+
+    import utils.map_utils as map_utils
+    from utils.rate_limit import TokenBucket
+    from server import PlanService
+    # the stand-in has no usage policy; don't let the 1 req/s Nominatim limit dominate
+    map_utils._nominatim_bucket = TokenBucket(rate=10000, capacity=10000)
+
+    service = PlanService(concurrency=args.concurrency, max_queue=args.queue)
+    ready = threading.Event()
+    addr = {}
+
+    def on_ready(server):
+        addr["host"], addr["port"] = server.sockets[0].getsockname()[:2]
+        ready.set()
+    threading.Thread(target=lambda: asyncio.run(service.serve("127.0.0.1", 0, ready=on_ready)),
+                     name="api", daemon=True).start()
+    ready.wait()
+
+    report = {"meta": {"git_rev": _git_rev(), "cpus": os.cpu_count(), "concurrency": args.concurrency,
+                       "queue": args.queue, "distinct": args.distinct,
+                       "upstream": {"latency": args.latency, "fail": args.fail}}, "runs": {}}
+    try:
+        for c in (int(x) for x in args.clients.split(",") if x):
+            report["runs"][str(c)] = asyncio.run(_drive(addr["host"], addr["port"], args.requests, c, args.distinct))
+        report["upstream_hits"] = dict(fake.hits)
+    finally:
+        fake.stop()
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# bench/bench_startup.py
+"""
+Startup / rerun benchmark for streamlit_app.py.
+
+    python -m bench.bench_startup [--reruns 20] [-o startup.json]
+
+Reports (JSON):
+  import_s      : cold import of the app's modules, in a fresh interpreter
+  numpy_import_s: the part of import_s that is NumPy (loaded at startup by
+                  utils.geo / route_agent / plan_agent)
+  first_run_s   : first script run (what a freshly started pod pays)
+  rerun_s       : per-rerun cost with no result (median / p90 / max)
+  rerun_result_s: per-rerun cost with a result and map on screen
+"""
+import argparse, json, math, os, statistics, subprocess, sys, tempfile, time
+from datetime import datetime, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+APP = os.path.join(ROOT, "streamlit_app.py")
+
+_IMPORT_SNIPPET = """
+import time
+t = time.perf_counter()
+import {}
+print(time.perf_counter() - t)
+"""
+APP_MODULES = "streamlit, agents.data_agent, agents.route_agent, agents.history_agent, agents.plan_agent, agents.iot_agent"
+
+def measure_import(modules=APP_MODULES, repeat=3):
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", _IMPORT_SNIPPET.format(modules)], cwd=ROOT,
+                             capture_output=True, text=True, check=True).stdout
+        runs.append(float(out.strip().splitlines()[-1]))
+    return min(runs)
+
+def _stats(xs):
+    xs = sorted(xs)
+    # nearest rank: the smallest sample with at least 90% of samples <= it
+    return {"median": statistics.median(xs), "p90": xs[math.ceil(0.9 * len(xs)) - 1], "max": xs[-1]}
+
+def _sample_result():
+    from agents.plan_agent import PlanResult
+    start, end = (37.5665, 126.9780), (37.4979, 127.0276)
+    n = 400
+    coords = [(start[0] + (end[0]-start[0])*i/n, start[1] + (end[1]-start[1])*i/n) for i in range(n + 1)]
+    return PlanResult(
+        best_mode="subway", base_minutes=20, final_minutes=22,
+        wake_dt=datetime.now() + timedelta(hours=8), rain=False,
+        traffic_delay=8, wait_eta=0, signal_penalty=1, mean_err=2.0, std_err=3.0, percentile=None,
+        start_coord=start, end_coord=end, coords=coords,
+        crossings=[(c[0], c[1], 60) for c in coords[::40]],
+        progressive_levels=[30, 10, 0],
+    )
+
+def measure_app(reruns=20):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP, default_timeout=60)
+    t = time.perf_counter(); at.run(); first = time.perf_counter() - t
+    plain = []
+    for _ in range(reruns):
+        t = time.perf_counter(); at.run(); plain.append(time.perf_counter() - t)
+    result = _sample_result()
+    at.session_state["result"] = result
+    # the map is cached per result_key, which the page sets together with result
+    at.session_state["result_key"] = ("bench", result.wake_dt.isoformat())
+    with_result = []
+    for _ in range(reruns):
+        t = time.perf_counter(); at.run(); with_result.append(time.perf_counter() - t)
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return first, _stats(plain), _stats(with_result)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--reruns", type=int, default=20)
+    ap.add_argument("-o", "--output", default="-")
+    args = ap.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix="bench-startup-")
+    os.environ.setdefault("ETA_HISTORY_DB", os.path.join(tmp, "eta_history.db"))
+    os.environ.setdefault("GEOCODE_CACHE_DB", os.path.join(tmp, "geocode_cache.db"))
+    sys.path.insert(0, ROOT)
+
+    report = {"bench": "startup", "python": sys.version.split()[0], "time": datetime.now().isoformat(timespec="seconds")}
+    report["import_s"] = measure_import()
+    report["numpy_import_s"] = measure_import("numpy")
+    report["first_run_s"], report["rerun_s"], report["rerun_result_s"] = measure_app(args.reruns)
+    text = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+if __name__ == "__main__":
+    main()
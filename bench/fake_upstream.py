@@ -0,0 +1,156 @@
+# bench/fake_upstream.py
+"""
+Local stand-in for every upstream the agents call (Nominatim, KMA, OSRM,
+bus and subway arrival APIs). Replays the recorded responses in
+bench/fixtures with per-endpoint latency and failure injection.
+
+    python -m bench.fake_upstream --port 8765 --latency kma=0.2,osrm=0.1 --fail kma=0.1
+
+then point the app at it:
+
+    NOMINATIM_URL=http://127.0.0.1:8765 KMA_URL=http://127.0.0.1:8765/1360000 \\
+    OSRM_URL=http://127.0.0.1:8765 BUS_API_URL=http://127.0.0.1:8765/6410000 \\
+    SUBWAY_API_URL=http://127.0.0.1:8765 streamlit run streamlit_app.py
+"""
+import argparse, copy, hashlib, json, os, random, threading, time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# endpoint name -> (path prefix, fixture file)
+ENDPOINTS = {
+    "nominatim": ("/search", "nominatim_search.json"),
+    "kma": ("/1360000/VilageFcstInfoService_2.0/getVilageFcst", "kma_vilage_fcst.json"),
+    "osrm": ("/route/v1/", "osrm_route.json"),
+    "bus": ("/6410000/busarrivalservice/", "bus_arrival.json"),
+    "subway": ("/api/subway/", "subway_arrival.json"),
+}
+
+class EndpointConfig:
+    """latency_s (mean, +-jitter fraction), fail_rate (HTTP 503), hang_rate (sleep hang_s then answer)"""
+    def __init__(self, latency_s=0.0, jitter=0.2, fail_rate=0.0, hang_rate=0.0, hang_s=30.0):
+        self.latency_s = latency_s
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.hang_rate = hang_rate
+        self.hang_s = hang_s
+
+class FakeUpstream:
+    def __init__(self, host="127.0.0.1", port=0, fixtures=FIXTURES, config=None, seed=None):
+        self.fixtures = {name: json.load(open(os.path.join(fixtures, fname), encoding="utf-8"))
+                         for name, (_, fname) in ENDPOINTS.items()}
+        self.config = {name: EndpointConfig() for name in ENDPOINTS}
+        self.config.update(config or {})
+        self.hits = {name: 0 for name in ENDPOINTS}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self):
+        """environment variables that point the agents at this server"""
+        return {
+            "NOMINATIM_URL": self.url,
+            "KMA_URL": self.url + "/1360000",
+            "OSRM_URL": self.url,
+            "BUS_API_URL": self.url + "/6410000",
+            "SUBWAY_API_URL": self.url,
+            "WEATHER_API_KEY": "bench", "BUS_API_KEY": "bench", "SUBWAY_API_KEY": "bench",
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-upstream", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _body(self, name, query):
+        data = self.fixtures[name]
+        if name == "nominatim":
+            # deterministic per-address coordinates around the recorded point
+            q = query.get("q", [""])[0]
+            h = hashlib.sha1(q.encode("utf-8")).digest()
+            data = copy.deepcopy(data)
+            data[0]["lat"] = str(float(data[0]["lat"]) + (h[0] - 128) / 128 * 0.08)
+            data[0]["lon"] = str(float(data[0]["lon"]) + (h[1] - 128) / 128 * 0.10)
+        return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                name = next((n for n, (prefix, _) in ENDPOINTS.items() if parts.path.startswith(prefix)), None)
+                if name is None:
+                    return self._send(404, b"{}")
+                cfg = fake.config[name]
+                with fake._lock:
+                    fake.hits[name] += 1
+                    roll = fake._rng.random()
+                    jitter = 1 + fake._rng.uniform(-cfg.jitter, cfg.jitter)
+                if roll < cfg.hang_rate:
+                    time.sleep(cfg.hang_s)
+                elif cfg.latency_s:
+                    time.sleep(cfg.latency_s * jitter)
+                if cfg.hang_rate <= roll < cfg.hang_rate + cfg.fail_rate:
+                    return self._send(503, b'{"error":"injected failure"}')
+                self._send(200, fake._body(name, parse_qs(parts.query)))
+
+            def _send(self, status, body):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+def parse_kv(text, cast=float):
+    """'kma=0.2,osrm=0.1' -> {'kma': 0.2, 'osrm': 0.1}"""
+    out = {}
+    for part in filter(None, (text or "").split(",")):
+        k, v = part.split("=", 1)
+        if k.strip() not in ENDPOINTS:
+            raise ValueError(f"unknown endpoint {k!r}; expected one of {', '.join(ENDPOINTS)}")
+        out[k.strip()] = cast(v)
+    return out
+
+def build_config(latency="", fail="", hang=""):
+    lat, fl, hg = parse_kv(latency), parse_kv(fail), parse_kv(hang)
+    return {n: EndpointConfig(latency_s=lat.get(n, 0.0), fail_rate=fl.get(n, 0.0), hang_rate=hg.get(n, 0.0))
+            for n in ENDPOINTS}
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Serve recorded upstream responses locally.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", default="", help="per-endpoint mean latency in s, e.g. kma=0.2,osrm=0.1")
+    ap.add_argument("--fail", default="", help="per-endpoint HTTP 503 rate, e.g. kma=0.1")
+    ap.add_argument("--hang", default="", help="per-endpoint rate of 30 s hangs, e.g. osrm=0.05")
+    args = ap.parse_args(argv)
+    fake = FakeUpstream(args.host, args.port, config=build_config(args.latency, args.fail, args.hang))
+    for k, v in fake.env().items():
+        print(f"{k}={v}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
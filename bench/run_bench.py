@@ -0,0 +1,167 @@
+# bench/run_bench.py
+"""
+End-to-end benchmark against local stand-ins (bench/fake_upstream.py).
+
+    python -m bench.run_bench -o bench.json
+    python -m bench.run_bench --latency kma=0.3,osrm=0.15,nominatim=0.1 --fail kma=0.2
+    python -m bench.run_bench --history-sizes 10000,100000,1000000 --skip-plans
+
+Measures
+  plan.cold / plan.warm : single-plan latency with empty / populated caches
+  plan.concurrency      : plans/sec and latency at several concurrency levels
+  history.<rows>        : HistoryAgent bulk-insert throughput and per-call
+                          latency of add_record / predict_correction (mean, p90) /
+                          summarize / train_simple_model at that table size
+and writes one JSON document, so runs from different versions can be diffed.
+"""
+import argparse, json, os, platform, random, statistics, subprocess, sys, tempfile, time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from bench.fake_upstream import FakeUpstream, build_config
+
+def _stats(xs):
+    xs = sorted(xs)
+    if not xs:
+        return {}
+    pick = lambda q: xs[min(len(xs) - 1, int(q * len(xs)))]
+    return {"n": len(xs), "mean_ms": statistics.fmean(xs) * 1000, "p50_ms": pick(0.5) * 1000,
+            "p95_ms": pick(0.95) * 1000, "max_ms": xs[-1] * 1000}
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+# ---------- plans ----------
+def _clear_caches():
+    import agents.data_agent as data_agent
+    import agents.route_agent as route_agent
+    import utils.map_utils as map_utils
+    from utils import http
+    data_agent._forecast_cache.clear()
+    route_agent._route_cache.clear()
+    map_utils._mem_cache.clear()
+    conn = map_utils._cache()._conn()
+    conn.execute("DELETE FROM geocode")
+    conn.commit()
+    http._breakers.clear()
+
+def _addresses(n):
+    gu = ["중구", "종로구", "용산구", "마포구", "성동구", "강남구", "서초구", "송파구", "영등포구", "동작구"]
+    return [f"서울특별시 {gu[i % len(gu)]} 테스트로 {i}" for i in range(n)]
+
+def bench_plans(pa, cold_runs, warm_runs, levels, plans_per_level):
+    out = {}
+    addrs = _addresses(200)
+
+    def one(i):
+        t = time.perf_counter()
+        pa.plan(addrs[(2 * i) % len(addrs)], addrs[(2 * i + 1) % len(addrs)],
+                bus_station_id="228000710", subway_station="시청")
+        return time.perf_counter() - t
+
+    cold = []
+    for i in range(cold_runs):
+        _clear_caches()
+        cold.append(one(i))
+    out["cold"] = _stats(cold)
+    one(0)  # prime the caches for this address pair
+    warm = [one(0) for _ in range(warm_runs)]
+    out["warm"] = _stats(warm)
+
+    conc = {}
+    for c in levels:
+        _clear_caches()
+        t = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=c) as pool:
+            lat = list(pool.map(one, range(plans_per_level)))
+        wall = time.perf_counter() - t
+        conc[str(c)] = {"plans_per_s": plans_per_level / wall, **_stats(lat)}
+    out["concurrency"] = conc
+    return out
+
+# ---------- history ----------
+def bench_history(size, routes=1000, samples=200):
+    from agents.history_agent import HistoryAgent
+    rng = random.Random(size)
+    with tempfile.TemporaryDirectory(prefix="bench-history-") as tmp:
+        ha = HistoryAgent(os.path.join(tmp, "eta_history.db"))
+        rows = ((f"route{rng.randrange(routes)}", rng.choice(("walk", "bus", "subway")),
+                 rng.randint(5, 60), rng.randint(5, 75)) for _ in range(size))
+        t = time.perf_counter()
+        n = ha.add_records(rows)
+        bulk = time.perf_counter() - t
+        res = {"rows": n, "bulk_insert_rows_per_s": n / bulk}
+
+        def timed(fn):
+            xs = []
+            for _ in range(samples):
+                key = f"route{rng.randrange(routes)}"
+                t = time.perf_counter(); fn(key); xs.append(time.perf_counter() - t)
+            return _stats(xs)
+
+        res["add_record"] = timed(lambda k: ha.add_record(k, "bus", 20, 24))
+        res["predict_correction"] = timed(lambda k: ha.predict_correction(k, "bus"))
+        res["predict_correction_p90"] = timed(lambda k: ha.predict_correction(k, "bus", percentile=90))
+        res["summarize"] = timed(lambda k: ha.summarize(k, "bus"))
+        res["train_simple_model"] = timed(lambda k: ha.train_simple_model(k, "bus"))
+        ha.close()
+        res["db_bytes"] = sum(os.path.getsize(os.path.join(tmp, f)) for f in os.listdir(tmp))
+    return res
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="End-to-end benchmark with local upstream stand-ins.")
+    ap.add_argument("-o", "--output", default="-")
+    ap.add_argument("--latency", default="nominatim=0.05,kma=0.15,osrm=0.1,bus=0.05,subway=0.05",
+                    help="per-endpoint mean latency in s")
+    ap.add_argument("--fail", default="", help="per-endpoint HTTP 503 rate")
+    ap.add_argument("--hang", default="", help="per-endpoint rate of 30 s hangs")
+    ap.add_argument("--cold-runs", type=int, default=10)
+    ap.add_argument("--warm-runs", type=int, default=50)
+    ap.add_argument("--concurrency", default="1,8,32")
+    ap.add_argument("--plans-per-level", type=int, default=100)
+    ap.add_argument("--history-sizes", default="10000,100000")
+    ap.add_argument("--skip-plans", action="store_true")
+    ap.add_argument("--skip-history", action="store_true")
+    args = ap.parse_args(argv)
+
+    fake = FakeUpstream(config=build_config(args.latency, args.fail, args.hang), seed=0).start()
+    tmp = tempfile.mkdtemp(prefix="bench-")
+    os.environ.update(fake.env())
+    os.environ["ETA_HISTORY_DB"] = os.path.join(tmp, "eta_history.db")
+    os.environ["GEOCODE_CACHE_DB"] = os.path.join(tmp, "geocode_cache.db")
+
+    report = {"meta": {"git_rev": _git_rev(), "python": platform.python_version(), "platform": platform.platform(),
+                       "cpus": os.cpu_count(), "time": datetime.now().isoformat(timespec="seconds"),
+                       "upstream": {"latency": args.latency, "fail": args.fail, "hang": args.hang}}}
+    try:
+        if not args.skip_plans:
+            import utils.map_utils as map_utils
+            from utils.rate_limit import TokenBucket
+            from agents.plan_agent import PlanAgent
+            # the stand-in has no usage policy; don't let the 1 req/s Nominatim limit dominate
+            map_utils._nominatim_bucket = TokenBucket(rate=10000, capacity=10000)
+            pa = PlanAgent()
+            levels = [int(c) for c in args.concurrency.split(",") if c]
+            report["plan"] = bench_plans(pa, args.cold_runs, args.warm_runs, levels, args.plans_per_level)
+            report["upstream_hits"] = dict(fake.hits)
+        if not args.skip_history:
+            report["history"] = {str(n): bench_history(n) for n in (int(s) for s in args.history_sizes.split(",") if s)}
+    finally:
+        fake.stop()
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+# server.py
+"""
+JSON HTTP API over the same agents as the Streamlit page, for mobile and
+kiosk clients. Standard library only (asyncio streams, HTTP/1.1 keep-alive).
+
+    python server.py --port 8080 --concurrency 64 --queue 256
+
+    POST /plan              batch_plan profile fields (+ "date": "YYYY-MM-DD", "with_route")
+    POST /history           {"route_key", "mode", "predicted", "actual"} or {"records": [[...], ...]}
+    GET  /history?route_key=..&mode=..[&percentile=90]
+    POST /alarms            {"user", "wake_dt": ISO, "levels": [30, 10, 0], "plan": {plan body}}
+    GET  /alarms?user=..    pending alarms + undelivered messages
+    DELETE /alarms/<id>
+    GET  /health, GET /metrics (Prometheus text)
+
+The agents are blocking (requests / sqlite3), so the event loop only
+parses and routes; plans and database writes run on a thread pool of
+`concurrency` workers, and each plan's upstream calls fan out further on
+DataAgent's pool. Requests beyond `concurrency` wait in a queue of at most
+`queue`; past that the server answers 503 with Retry-After right away
+instead of letting latency grow without bound.
+"""
+import argparse, asyncio, functools, json, logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from urllib.parse import urlsplit, parse_qs
+from agents.data_agent import DataAgent
+from agents.route_agent import RouteAgent
+from agents.history_agent import HistoryAgent
+from agents.plan_agent import PlanAgent
+from agents.alarm_scheduler import AlarmScheduler, InboxNotifier, MultiNotifier, WebhookNotifier
+from batch_plan import plan_kwargs, result_json
+from utils.api_keys import ALARM_WEBHOOK_URL
+from utils import metrics
+
+log = logging.getLogger("smart_commute.server")
+
+MAX_BODY = 1 << 20
+READ_TIMEOUT_S = 30.0
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 422: "Unprocessable Entity", 500: "Internal Server Error",
+           503: "Service Unavailable"}
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+class PlanService:
+    def __init__(self, plan_agent=None, scheduler=None, inbox=None, concurrency=64, max_queue=256):
+        if plan_agent is None:
+            plan_agent = PlanAgent(DataAgent(), RouteAgent(), HistoryAgent())
+        if scheduler is None:
+            inbox = InboxNotifier()
+            webhook = WebhookNotifier(ALARM_WEBHOOK_URL) if ALARM_WEBHOOK_URL else None
+            scheduler = AlarmScheduler(MultiNotifier(inbox, webhook))
+        self.pa = plan_agent
+        self.ha = plan_agent.ha
+        self.scheduler = scheduler
+        self.inbox = inbox
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="api")
+        self._sem = None  # created on the serving loop
+        self._waiting = 0
+        self._running = 0
+
+    # ---------- bounded offload ----------
+    async def offload(self, fn, *args):
+        """run fn on the worker pool; 503 when `max_queue` requests are already waiting"""
+        if self._sem.locked() and self._waiting >= self.max_queue:
+            metrics.incr("api_rejected")
+            raise HTTPError(503, "server busy", {"Retry-After": "1"})
+        self._waiting += 1
+        try:
+            await self._sem.acquire()
+        finally:
+            self._waiting -= 1
+        self._running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+        finally:
+            self._running -= 1
+            self._sem.release()
+
+    # ---------- endpoints ----------
+    async def post_plan(self, body, query):
+        try:
+            kwargs = plan_kwargs(body, date.fromisoformat(body["date"]) if body.get("date") else None)
+        except (KeyError, ValueError, TypeError) as e:
+            raise HTTPError(400, f"bad plan request: {e}")
+        try:
+            r = await self.offload(functools.partial(self.pa.plan_cached, **kwargs))
+        except ValueError as e:  # PlanError, malformed target_time, ...
+            raise HTTPError(422, str(e))
+        return 200, result_json(r, with_route=bool(body.get("with_route")))
+
+    async def post_history(self, body, query):
+        try:
+            if "records" in body:
+                records = [tuple(r) for r in body["records"]]
+                n = await self.offload(self.ha.add_records, records)
+            else:
+                await self.offload(self.ha.add_record, body["route_key"], body["mode"],
+                                   int(body["predicted"]), int(body["actual"]))
+                n = 1
+        except (KeyError, ValueError, TypeError, IndexError) as e:
+            raise HTTPError(400, f"bad history record: {e}")
+        return 201, {"inserted": n}
+
+    async def get_history(self, body, query):
+        route_key, mode = query.get("route_key"), query.get("mode")
+        if not route_key or not mode:
+            raise HTTPError(400, "route_key and mode are required")
+        try:
+            percentile = int(query["percentile"]) if query.get("percentile") else None
+            if percentile is not None and not 0 <= percentile <= 100:
+                raise ValueError(f"{percentile} is not within 0..100")
+        except ValueError as e:
+            raise HTTPError(400, f"bad percentile: {e}")
+
+        def read():
+            mean, std = self.ha.predict_correction(route_key, mode, percentile=percentile)
+            return {"route_key": route_key, "mode": mode, "correction": mean, "std_error": std,
+                    "percentile": percentile, "summary": self.ha.summarize(route_key, mode)}
+        return 200, await self.offload(read)
+
+    async def post_alarms(self, body, query):
+        try:
+            user = str(body["user"])
+            wake_dt = datetime.fromisoformat(body["wake_dt"])
+            if wake_dt.tzinfo is not None:  # e.g. "...T07:00:00+09:00" -> naive local time
+                wake_dt = wake_dt.astimezone().replace(tzinfo=None)
+            levels = [int(l) for l in body.get("levels", (30, 10, 0))]
+            refresh = None
+            if body.get("plan"):
+                kwargs = plan_kwargs(body["plan"], wake_dt.date())
+                refresh = lambda: self.pa.plan(**kwargs).wake_dt
+        except (KeyError, ValueError, TypeError) as e:
+            raise HTTPError(400, f"bad alarm request: {e}")
+        alarm_id = self.scheduler.schedule(user, wake_dt, levels, refresh=refresh)
+        return 201, {"alarm_id": alarm_id}
+
+    async def get_alarms(self, body, query):
+        user = query.get("user")
+        if not user:
+            raise HTTPError(400, "user is required")
+        pending = [{**a, "wake_dt": a["wake_dt"].isoformat(timespec="minutes")} for a in self.scheduler.pending(user)]
+        messages = [{"title": t, "message": m} for t, m in self.inbox.drain(user)] if self.inbox else []
+        return 200, {"pending": pending, "messages": messages}
+
+    async def delete_alarm(self, body, query, alarm_id):
+        try:
+            ok = self.scheduler.cancel(int(alarm_id))
+        except ValueError:
+            raise HTTPError(400, "bad alarm id")
+        if not ok:
+            raise HTTPError(404, "no such alarm")
+        return 200, {"cancelled": int(alarm_id)}
+
+    async def get_health(self, body, query):
+        return 200, {"status": "ok", "running": self._running, "waiting": self._waiting,
+                     "concurrency": self.concurrency, "max_queue": self.max_queue, "alarms": len(self.scheduler)}
+
+    async def get_metrics(self, body, query):
+        return 200, metrics.prometheus_text()
+
+    def route(self, method, path):
+        routes = {
+            ("POST", "/plan"): self.post_plan,
+            ("POST", "/history"): self.post_history,
+            ("GET", "/history"): self.get_history,
+            ("POST", "/alarms"): self.post_alarms,
+            ("GET", "/alarms"): self.get_alarms,
+            ("GET", "/health"): self.get_health,
+            ("GET", "/metrics"): self.get_metrics,
+        }
+        handler = routes.get((method, path))
+        if handler is not None:
+            return handler, ()
+        if method == "DELETE" and path.startswith("/alarms/"):
+            return self.delete_alarm, (path[len("/alarms/"):],)
+        if any(p == path for _, p in routes) or path.startswith("/alarms/"):
+            raise HTTPError(405, "method not allowed")
+        raise HTTPError(404, "not found")
+
+    # ---------- HTTP/1.1 ----------
+    async def _read_request(self, reader):
+        line = await asyncio.wait_for(reader.readline(), READ_TIMEOUT_S)
+        if not line:
+            return None
+        try:
+            method, target, version = line.decode("latin-1").split()
+        except ValueError:
+            raise HTTPError(400, "bad request line")
+        headers = {}
+        while True:
+            h = await asyncio.wait_for(reader.readline(), READ_TIMEOUT_S)
+            if h in (b"\r\n", b"\n", b""):
+                break
+            k, _, v = h.decode("latin-1").partition(":")
+            headers[k.strip().lower()] = v.strip()
+        try:
+            n = int(headers.get("content-length") or 0)
+            if n < 0:
+                raise ValueError(n)
+        except ValueError:
+            raise HTTPError(400, "bad Content-Length")
+        if n > MAX_BODY:
+            raise HTTPError(413, "body too large")
+        body = await asyncio.wait_for(reader.readexactly(n), READ_TIMEOUT_S) if n else b""
+        return method.upper(), target, version, headers, body
+
+    async def _respond(self, writer, status, payload, keep_alive, headers=None):
+        if isinstance(payload, str):
+            data, ctype = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            data, ctype = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8"
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", f"Content-Type: {ctype}",
+                f"Content-Length: {len(data)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        head += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    req = await self._read_request(reader)
+                except HTTPError as e:
+                    await self._respond(writer, e.status, {"error": str(e)}, False)
+                    break
+                if req is None:
+                    break
+                method, target, version, headers, raw = req
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                parts = urlsplit(target)
+                query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+                extra = route_error = None
+                try:
+                    handler, args = self.route(method, parts.path)
+                    endpoint = parts.path.split("/")[1]
+                except HTTPError as e:
+                    # 404 / 405 share one series instead of one per requested URL
+                    route_error, endpoint = e, "unknown"
+                with metrics.span("api", path=endpoint):
+                    try:
+                        if route_error is not None:
+                            raise route_error
+                        body = json.loads(raw) if raw else {}
+                        if not isinstance(body, dict):
+                            raise HTTPError(400, "JSON object expected")
+                        status, payload = await handler(body, query, *args)
+                    except HTTPError as e:
+                        status, payload, extra = e.status, {"error": str(e)}, e.headers
+                    except json.JSONDecodeError:
+                        status, payload = 400, {"error": "invalid JSON"}
+                    except Exception as e:
+                        log.exception("request failed: %s %s", method, target)
+                        status, payload = 500, {"error": type(e).__name__}
+                await self._respond(writer, status, payload, keep_alive, extra)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8080, ready=None):
+        self._sem = asyncio.Semaphore(self.concurrency)
+        server = await asyncio.start_server(self.handle, host, port, backlog=1024)
+        if ready is not None:
+            ready(server)
+        async with server:
+            await server.serve_forever()
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Smart Commute JSON HTTP API.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8080)
+    ap.add_argument("--concurrency", type=int, default=64, help="plans / DB writes running at once")
+    ap.add_argument("--queue", type=int, default=256, help="requests allowed to wait before 503")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    service = PlanService(concurrency=args.concurrency, max_queue=args.queue)
+    try:
+        asyncio.run(service.serve(args.host, args.port,
+                                  ready=lambda s: log.info("listening on %s", s.sockets[0].getsockname()[:2])))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,14 @@
 # streamlit_app.py
-from datetime import datetime, timedelta
+import uuid
 import streamlit as st
-from utils.map_utils import geocode
 from agents.data_agent import DataAgent
 from agents.route_agent import RouteAgent
 from agents.history_agent import HistoryAgent
-from agents.schedule_agent import ScheduleAgent
+from agents.plan_agent import PlanAgent, PlanError, MAP_ZOOM, PLAN_MEMO_TTL_S
 from agents.iot_agent import send_browser_alarm
-from streamlit_folium import st_folium
-import folium
+from agents.alarm_scheduler import AlarmScheduler, InboxNotifier, MultiNotifier, WebhookNotifier
+from utils.api_keys import ALARM_WEBHOOK_URL
+from utils import metrics
 
 # =========================
 # Streamlit state init
@@ -16,8 +16,8 @@ import folium
 if "result" not in st.session_state:
     st.session_state["result"] = None
 
-if "progressive_js" not in st.session_state:
-    st.session_state["progressive_js"] = None
+if "user_id" not in st.session_state:
+    st.session_state["user_id"] = uuid.uuid4().hex
 
 # =========================
 # Page config
@@ -26,11 +26,58 @@ st.set_page_config(page_title="Smart Commute", layout="wide")
 st.title("Smart Commute — 통합 시스템")
 
 # =========================
-# Agents
+# Agents (process-wide, survive reruns and are shared by sessions)
 # =========================
-da = DataAgent()
-ra = RouteAgent()
-ha = HistoryAgent()
+@st.cache_resource
+def get_agents():
+    da = DataAgent()
+    ra = RouteAgent()
+    ha = HistoryAgent()
+    return da, ra, ha, PlanAgent(da, ra, ha)
+
+da, ra, ha, pa = get_agents()
+
+@st.cache_resource
+def get_alarm_scheduler():
+    inbox = InboxNotifier()
+    webhook = WebhookNotifier(ALARM_WEBHOOK_URL) if ALARM_WEBHOOK_URL else None
+    return AlarmScheduler(MultiNotifier(inbox, webhook)), inbox
+
+scheduler, inbox = get_alarm_scheduler()
+
+# 서버 알람을 열린 탭에서 브라우저 알림으로 전달
+@st.fragment(run_every=30)
+def deliver_alarms():
+    for title, msg in inbox.drain(st.session_state["user_id"]):
+        send_browser_alarm(title, msg)
+
+deliver_alarms()
+
+# 결과별 지도 HTML 캐시: 입력이 그대로인 rerun은 folium 직렬화를 건너뜀
+@st.cache_data(ttl=PLAN_MEMO_TTL_S, max_entries=256, show_spinner=False)
+def render_map_html(result_key, _r):
+    # folium is heavy: import only once there is a map to draw
+    import folium
+
+    mid = (
+        (_r.start_coord[0] + _r.end_coord[0]) / 2,
+        (_r.start_coord[1] + _r.end_coord[1]) / 2
+    )
+    m = folium.Map(location=mid, zoom_start=MAP_ZOOM)
+    folium.Marker(_r.start_coord, popup="출발지", icon=folium.Icon(color="green")).add_to(m)
+    folium.Marker(_r.end_coord, popup="도착지", icon=folium.Icon(color="red")).add_to(m)
+
+    if len(_r.coords):
+        folium.PolyLine(_r.coords.tolist(), color="blue", weight=5).add_to(m)
+
+    for lat, lon, wt in _r.crossings.tolist():
+        folium.CircleMarker(
+            location=(lat, lon),
+            radius=4,
+            color="orange",
+            popup=f"신호 대기 {int(wt)}초"
+        ).add_to(m)
+    return m.get_root().render()
 
 # =========================
 # Sidebar (입력)
@@ -47,82 +94,51 @@ safety_margin = st.sidebar.slider("안전 여유 (분)", 0, 20, 5)
 allow_walk = st.sidebar.checkbox("도보", True)
 allow_bus = st.sidebar.checkbox("버스", True)
 allow_subway = st.sidebar.checkbox("지하철", True)
+allow_transit = st.sidebar.checkbox("환승 (도보+버스+지하철)", True, help="TRANSIT_PATH 시간표가 있을 때만 사용")
+
+bus_station_id = st.sidebar.text_input("버스 정류소 ID (선택)", "")
+subway_station = st.sidebar.text_input("지하철 승차역 (선택)", "")
 
 use_ml_correction = st.sidebar.checkbox("히스토리 보정 사용", True)
+eta_percentile = st.sidebar.selectbox(
+    "보정 기준",
+    [None, 50, 80, 90, 95],
+    format_func=lambda p: "평균 오차" if p is None else f"p{p} (시간대별)",
+    disabled=not use_ml_correction
+)
 progressive_levels = st.sidebar.multiselect(
     "점진 알람 단계 (분 전)",
     [30, 10, 0],
     default=[30, 10, 0]
 )
 
+show_debug = st.sidebar.checkbox("디버그 패널", False)
+
 # =========================
 # 계산 버튼 (계산 + 저장만!)
 # =========================
 if st.button("🚀 계산 시작"):
+    modes = [m for m, ok in (("walk", allow_walk), ("bus", allow_bus), ("subway", allow_subway), ("transit", allow_transit)) if ok]
+    plan_kwargs = dict(
+        start_addr=start_addr, end_addr=end_addr, target_time=target_time,
+        prep_minutes=prep_minutes, safety_margin=safety_margin,
+        modes=modes,
+        use_history=use_ml_correction,
+        percentile=eta_percentile,
+        progressive_levels=progressive_levels,
+        bus_station_id=bus_station_id.strip() or None,
+        subway_station=subway_station.strip() or None
+    )
     try:
-        start_coord = geocode(start_addr)
-        end_coord = geocode(end_addr)
-    except Exception as e:
-        st.error(f"주소 변환 실패: {e}")
+        # ✅ 결과 저장 (핵심) — 같은 입력은 PLAN_MEMO_TTL_S 동안 재계산하지 않음
+        r = pa.plan_cached(**plan_kwargs)
+        st.session_state["result"] = r
+        st.session_state["result_key"] = (pa.plan_key(**plan_kwargs), r.wake_dt.isoformat())
+        st.session_state["plan_kwargs"] = plan_kwargs
+    except PlanError as e:
+        st.error(str(e))
         st.stop()
 
-    weather = da.get_weather(start_coord)
-    crossings = da.get_crossings_info(start_coord, end_coord)
-    signal_penalty = da.traffic_light_penalty_minutes(crossings)
-    traffic_delay = da.get_traffic_delay(start_coord, end_coord)
-
-    options = []
-    if allow_walk:
-        options.append(("walk", ra.estimate_walk_minutes(start_coord, end_coord) + signal_penalty))
-    if allow_bus:
-        options.append(("bus", ra.estimate_bus_minutes(start_coord, end_coord) + traffic_delay + signal_penalty))
-    if allow_subway:
-        options.append(("subway", ra.estimate_subway_minutes(start_coord, end_coord) + signal_penalty))
-
-    if not options:
-        st.error("이동수단을 선택하세요.")
-        st.stop()
-
-    best_mode, base_minutes = min(options, key=lambda x: x[1])
-
-    mean_err, std_err = (0, 0)
-    if use_ml_correction:
-        mean_err, std_err = ha.predict_correction(f"{start_addr}|{end_addr}", best_mode)
-
-    final_minutes = max(1, int(base_minutes + mean_err))
-
-    weather_pen = 5 if weather.get("rain") else 0
-
-    sa = ScheduleAgent(target_time, prep_minutes, safety_margin)
-    wake_dt = sa.compute_wakeup_dt(
-        final_minutes,
-        weather_penalty=weather_pen
-    )
-
-    coords = ra.get_osrm_coords(
-        start_coord,
-        end_coord,
-        mode="walking" if best_mode == "walk" else "driving"
-    )
-
-    # ✅ 결과 저장 (핵심)
-    st.session_state["result"] = {
-        "best_mode": best_mode,
-        "base_minutes": base_minutes,
-        "final_minutes": final_minutes,
-        "wake_dt": wake_dt,
-        "weather": weather,
-        "traffic_delay": traffic_delay,
-        "signal_penalty": signal_penalty,
-        "mean_err": mean_err,
-        "std_err": std_err,
-        "start_coord": start_coord,
-        "end_coord": end_coord,
-        "coords": coords,
-        "crossings": crossings,
-        "progressive_levels": progressive_levels
-    }
-
 # =========================
 # 결과 출력 (항상 유지됨)
 # =========================
@@ -130,61 +146,61 @@ if st.session_state["result"]:
     r = st.session_state["result"]
 
     st.success("✅ 계산 완료")
-    st.write("**권장 이동수단:**", r["best_mode"])
-    st.write("기본 ETA:", r["base_minutes"], "분")
-    st.write("보정 ETA:", r["final_minutes"], "분")
-    st.write("권장 기상 시간:", r["wake_dt"].strftime("%Y-%m-%d %H:%M"))
+    st.write("**권장 이동수단:**", r.best_mode)
+    st.write("기본 ETA:", r.base_minutes, "분")
+    st.write("보정 ETA:", r.final_minutes, "분")
+    if r.wait_eta:
+        st.write("승차 대기:", r.wait_eta, "분")
+    st.write("권장 기상 시간:", r.wake_dt.strftime("%Y-%m-%d %H:%M"))
+    if r.legs:
+        hm = lambda s: f"{s // 3600 % 24:02d}:{s % 3600 // 60:02d}"
+        st.table([{"구간": leg["mode"], "노선": leg["route"] or "", "출발": leg["from"] or "출발지", "도착": leg["to"] or "목적지",
+                   "시각": f"{hm(leg['dep_s'])}–{hm(leg['arr_s'])}"} for leg in r.legs])
 
     if use_ml_correction:
-        st.info(f"히스토리 오차: 평균 {r['mean_err']:+.1f}분 / 표준편차 {r['std_err']:.1f}분")
+        if r.percentile is not None:
+            st.info(f"히스토리 오차: p{r.percentile} {r.mean_err:+.1f}분 (같은 시간대) / 표준편차 {r.std_err:.1f}분")
+        else:
+            st.info(f"히스토리 오차: 평균 {r.mean_err:+.1f}분 / 표준편차 {r.std_err:.1f}분")
 
     # =========================
     # 지도 (사라지지 않음)
     # =========================
-    mid = (
-        (r["start_coord"][0] + r["end_coord"][0]) / 2,
-        (r["start_coord"][1] + r["end_coord"][1]) / 2
-    )
-
-    m = folium.Map(location=mid, zoom_start=13)
-    folium.Marker(r["start_coord"], popup="출발지", icon=folium.Icon(color="green")).add_to(m)
-    folium.Marker(r["end_coord"], popup="도착지", icon=folium.Icon(color="red")).add_to(m)
-
-    if r["coords"]:
-        folium.PolyLine(r["coords"], color="blue", weight=5).add_to(m)
-
-    for lat, lon, wt in r["crossings"]:
-        folium.CircleMarker(
-            location=(lat, lon),
-            radius=4,
-            color="orange",
-            popup=f"신호 대기 {wt}초"
-        ).add_to(m)
-
-    st_folium(m, width=700, height=450)
+    st.iframe(render_map_html(st.session_state["result_key"], r), width=700, height=450)
 
     # =========================
     # 알람
     # =========================
     if st.button("🔔 점진 알람 등록"):
-        now = datetime.now()
-        js_blocks = []
-
-        for lvl in sorted(r["progressive_levels"], reverse=True):
-            alarm_time = r["wake_dt"] - timedelta(minutes=lvl)
-            delay_ms = max(0, int((alarm_time - now).total_seconds() * 1000))
-            msg = f"{lvl}분 전 알림 (기상 {r['wake_dt'].strftime('%H:%M')})"
-
-            js_blocks.append(f"""
-            setTimeout(() => {{
-                if (Notification.permission === "granted") {{
-                    new Notification("Smart Commute", {{ body: "{msg}" }});
-                }} else {{
-                    alert("{msg}");
-                }}
-            }}, {delay_ms});
-            """)
-
-        js = "<script>" + "".join(js_blocks) + "</script>"
-        st.components.v1.html(js, height=0)
-        st.success("알람 등록 완료 (탭 유지 필요)")
+        # 서버 측 스케줄러: 탭을 닫아도 유지, 기상 시간 전까지 ETA를 주기적으로 재계산
+        plan_kwargs = st.session_state["plan_kwargs"]
+        if st.session_state.get("alarm_id"):
+            scheduler.cancel(st.session_state["alarm_id"])
+        st.session_state["alarm_id"] = scheduler.schedule(
+            st.session_state["user_id"],
+            r.wake_dt,
+            r.progressive_levels,
+            refresh=lambda: pa.plan(**plan_kwargs).wake_dt
+        )
+        st.success("알람 등록 완료 (서버에서 관리 / 교통·날씨 변화 시 자동 조정)")
+
+# =========================
+# 디버그 패널 (계측)
+# =========================
+if show_debug:
+    snap = metrics.snapshot()
+    with st.expander("🔧 성능 계측", expanded=True):
+        st.write("**캐시 적중률**")
+        st.table([{"cache": k, "hit": v["hit"], "miss": v["miss"], "hit_ratio": round(v["hit_ratio"], 3)}
+                  for k, v in snap["caches"].items()])
+        st.write("**지연 시간 (ms)**")
+        st.table([{"span": h["name"], "labels": ", ".join(f"{k}={v}" for k, v in h["labels"].items()),
+                   "count": h["count"], "p50": round(h["p50"]*1000, 1), "p95": round(h["p95"]*1000, 1),
+                   "mean": round(h["sum"]/h["count"]*1000, 1) if h["count"] else 0.0}
+                  for h in snap["histograms"]])
+        st.write("**카운터 (오류 / fallback / 재시도)**")
+        st.table([{"counter": c["name"], "labels": ", ".join(f"{k}={v}" for k, v in c["labels"].items()), "value": c["value"]}
+                  for c in snap["counters"] if c["name"] not in ("cache_hit", "cache_miss")])
+        if st.session_state["result"]:
+            st.write("**세션 결과 메모리:**", f"{st.session_state['result'].nbytes() / 1024:.1f} KB")
+        st.download_button("Prometheus 텍스트", metrics.prometheus_text(snap), "metrics.prom")
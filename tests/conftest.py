@@ -0,0 +1,14 @@
+# tests/conftest.py
+import os
+import pytest
+from utils.transit import TransitNetwork
+
+GTFS = os.path.join(os.path.dirname(__file__), "fixtures", "gtfs")
+DATE = "20261019"  # a Monday
+
+@pytest.fixture(scope="session")
+def net(tmp_path_factory):
+    """the fixture feed compiled for DATE and loaded back memory-mapped"""
+    out = tmp_path_factory.mktemp("net")
+    TransitNetwork.from_gtfs(GTFS, DATE).save(str(out))
+    return TransitNetwork.load(str(out))
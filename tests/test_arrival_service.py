@@ -0,0 +1,45 @@
+# tests/test_arrival_service.py
+import time, types
+from datetime import datetime, timedelta
+import pytest
+from agents.arrival_service import ArrivalService
+
+class Upstream:
+    def __init__(self):
+        self.calls = 0
+
+    def get_bus_eta(self, station_id):
+        self.calls += 1
+        return 4
+
+@pytest.fixture
+def svc():
+    # refresh every 0.1 s against a 0.05 s idle TTL: like 1800 s > 900 s far from wake-up
+    s = ArrivalService(data_agent=Upstream(), default_interval_s=0.1, idle_ttl_s=0.05)
+    s._sa = types.SimpleNamespace(dynamic_update_interval_seconds=lambda wake_dt: 0.1)
+    yield s
+    s.stop()
+
+def test_timed_watch_outlives_the_idle_ttl(svc):
+    svc.watch("bus", "s1", datetime.now() + timedelta(hours=4))
+    time.sleep(0.55)
+    assert ("bus", "s1") in svc._hot and svc.da.calls >= 3
+
+def test_timed_watch_ends_at_wake_time(svc):
+    svc.watch("bus", "s1", datetime.now() + timedelta(seconds=0.3))
+    time.sleep(0.7)
+    assert ("bus", "s1") not in svc._hot
+    calls = svc.da.calls
+    time.sleep(0.3)
+    assert svc.da.calls == calls
+
+def test_untimed_watch_ends_when_idle(svc):
+    svc.watch("bus", "s2")
+    time.sleep(0.4)
+    assert ("bus", "s2") not in svc._hot
+
+def test_idle_untimed_watch_keeps_a_timed_one(svc):
+    svc.watch("bus", "s3")
+    svc.watch("bus", "s3", datetime.now() + timedelta(hours=4))
+    time.sleep(0.4)
+    assert ("bus", "s3") in svc._hot and not svc._hot[("bus", "s3")]["untimed"]
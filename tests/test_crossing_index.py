@@ -0,0 +1,89 @@
+# tests/test_crossing_index.py
+"""
+CrossingIndex.query_polyline against a brute-force scan of every crossing
+against every route segment, in the same local metric frame.
+"""
+import numpy as np
+import pytest
+from utils.crossing_index import CELL_DEG, CrossingIndex
+from utils.geo import EARTH_R_KM
+
+M_PER_DEG = EARTH_R_KM * 1000 * np.pi / 180.0
+
+def brute(idx, coords, buffer_m):
+    """indices of the crossings within buffer_m of any segment"""
+    pts = np.asarray(coords, dtype=np.float64)
+    k = np.cos(np.radians(pts[:, 0].mean()))
+    P = np.stack([idx.lon.astype(np.float64) * k, idx.lat.astype(np.float64)], 1) * M_PER_DEG
+    A = np.stack([pts[:-1, 1] * k, pts[:-1, 0]], 1) * M_PER_DEG
+    B = np.stack([pts[1:, 1] * k, pts[1:, 0]], 1) * M_PER_DEG
+    best = np.full(len(P), np.inf)
+    for a, b in zip(A, B):
+        ab = b - a
+        t = np.clip((P - a) @ ab / max(ab @ ab, 1e-9), 0.0, 1.0)
+        best = np.minimum(best, np.hypot(*(P - a - t[:, None] * ab).T))
+    return set(np.nonzero(best <= buffer_m)[0].tolist())
+
+def as_set(idx, hits):
+    keys = {(la, lo, cy): i for i, (la, lo, cy) in
+            enumerate(zip(idx.lat.tolist(), idx.lon.tolist(), idx.cycle.tolist()))}
+    return {keys[h] for h in hits}
+
+@pytest.fixture(scope="module")
+def idx():
+    rng = np.random.default_rng(7)
+    n = 20_000
+    return CrossingIndex(37.50 + rng.random(n) * 0.05, 127.00 + rng.random(n) * 0.06, rng.integers(40, 160, n))
+
+def zigzag(k, rng):
+    t = np.linspace(0, 1, k)
+    lat = 37.505 + 0.04 * t + 0.003 * np.sin(t * 40) + rng.normal(0, 0.00005, k)
+    lon = 127.005 + 0.05 * t + 0.003 * np.cos(t * 31)
+    return np.stack([lat, lon], 1)
+
+@pytest.mark.parametrize("k", [2, 30, 400])
+@pytest.mark.parametrize("buffer_m", [10.0, 25.0, 60.0])
+def test_matches_brute_force(idx, k, buffer_m):
+    rng = np.random.default_rng(k)
+    for _ in range(3):
+        route = zigzag(k, rng)
+        hits = idx.query_polyline(route, buffer_m)
+        assert len(hits) == len(set(hits))
+        assert as_set(idx, hits) == brute(idx, route, buffer_m)
+
+def test_long_segments_across_many_cells(idx):
+    # a few straight segments, each spanning dozens of cells diagonally and both axes
+    route = [(37.501, 127.001), (37.549, 127.059), (37.501, 127.059), (37.549, 127.001), (37.5255, 127.03)]
+    hits = idx.query_polyline(route, 40.0)
+    assert len(hits) > 100
+    assert as_set(idx, hits) == brute(idx, route, 40.0)
+
+def test_buffer_edge():
+    lat0, lon0 = 37.5, 127.0
+    route = [(lat0, lon0), (lat0, lon0 + 0.01)]
+    # offsets inside, and just past, the first cell rows above the segment, so the
+    # padded bbox edge lands on (or right beside) the crossing's own cell
+    lats = lat0 + np.array([0.3, 0.999, 1.001, 2.0, 2.5]) * CELL_DEG
+    idx = CrossingIndex(np.r_[lat0, lats], np.full(len(lats) + 1, lon0 + 0.005), np.arange(len(lats) + 1) + 60)
+    for lat, cycle in zip(idx.lat.tolist(), idx.cycle.tolist()):
+        d = (lat - lat0) * M_PER_DEG
+        assert cycle in [h[2] for h in idx.query_polyline(route, d + 1e-6)]
+        if d > 0:
+            assert cycle not in [h[2] for h in idx.query_polyline(route, d - 1e-3)]
+
+def test_ordered_along_route_and_counted_once():
+    # crossings on a U-shaped route: the first leg runs east, the second back west
+    lon = 127.0 + np.arange(10) * 0.002
+    idx = CrossingIndex(np.r_[np.full(10, 37.5001), np.full(10, 37.5039)], np.r_[lon, lon], np.arange(20) + 40)
+    route = [(37.5, 126.999), (37.5, 127.02), (37.504, 127.02), (37.504, 126.999)]
+    hits = idx.query_polyline(route, 25.0)
+    assert [h[2] for h in hits] == list(range(40, 50)) + list(range(59, 49, -1))
+    # a crossing at a vertex is near both segments but reported once
+    corner = CrossingIndex([37.5001], [127.0201], [90])
+    assert corner.query_polyline(route, 25.0) == [(pytest.approx(37.5001), pytest.approx(127.0201), 90)]
+
+def test_empty_inputs(idx):
+    assert CrossingIndex([], [], []).query_polyline([(37.5, 127.0), (37.51, 127.01)]) == []
+    assert idx.query_polyline([]) == []
+    single = idx.query_polyline([(37.52, 127.03)], 30.0)
+    assert as_set(idx, single) == brute(idx, [(37.52, 127.03), (37.52, 127.03)], 30.0)
@@ -0,0 +1,73 @@
+# tests/test_history_agent.py
+import random, threading
+from datetime import datetime, timedelta
+import pytest
+import numpy as np
+from agents.history_agent import KST, MIN_BUCKET_N, HistoryAgent, read_archive
+
+@pytest.fixture
+def ha(tmp_path):
+    return HistoryAgent(str(tmp_path / "eta_history.db"))
+
+def _old_records(n, days_ago=200, seed=0):
+    rng = random.Random(seed)
+    t0 = datetime.utcnow() - timedelta(days=days_ago)
+    return [(f"r{rng.randrange(7)}", rng.choice(("bus", "subway")), 20, 20 + rng.randrange(-3, 9),
+             (t0 + timedelta(minutes=37 * i)).isoformat()) for i in range(n)]
+
+def test_compact_streams_in_chunks(ha, tmp_path):
+    old = _old_records(2500)
+    ha.add_records(old)
+    ha.add_records([("r1", "bus", 20, 22), ("r1", "bus", 20, 25)])  # recent: stays
+    res = ha.compact(90, str(tmp_path / "archive"), chunk=1000)
+    assert res["rows"] == len(old) and len(res["archives"]) == 3
+    archived = [row for path in res["archives"] for row in read_archive(path)]
+    assert [r[:4] for r in archived] == [r[:4] for r in old]
+    assert [datetime.fromisoformat(r[4]) for r in archived] == [datetime.fromisoformat(r[4]) for r in old]
+    with ha._connection() as conn:
+        assert conn.execute("SELECT count(*) FROM eta_history").fetchone()[0] == 2
+        # rollups split across chunks still add up per (route, mode)
+        for route, mode in {(r[0], r[1]) for r in old}:
+            n, err = conn.execute("SELECT sum(n), sum(sum_err) FROM eta_daily WHERE route_key=? AND mode=?",
+                                  (route, mode)).fetchone()
+            mine = [r[3] - r[2] for r in old if r[0] == route and r[1] == mode]
+            assert (n, err) == (len(mine), sum(mine))
+    assert ha.compact(90, str(tmp_path / "archive"), chunk=1000)["rows"] == 0
+
+def test_connections_are_reused_across_threads(ha):
+    # Streamlit runs every rerun on a fresh thread
+    opened = []
+    open_ = ha._open
+    ha._open = lambda: opened.append(1) or open_()
+    for i in range(20):
+        t = threading.Thread(target=lambda: (ha.add_record("r", "bus", 20, 21 + i % 3), ha.route_stats("r", "bus")))
+        t.start()
+        t.join()
+    assert len(opened) <= 1 and ha.route_stats("r", "bus")["n"] == 20
+
+def test_predict_correction_percentile_by_hour_of_week(ha):
+    # Monday 08h KST (Sunday 23h UTC): small errors; Wednesday 15h KST (06h UTC): large ones
+    monday = [("r", "bus", 20, 20 + i % 10, datetime(2026, 10, 18, 23, i % 60, i // 60).isoformat()) for i in range(200)]
+    wednesday = [("r", "bus", 20, 50 + i % 10, datetime(2026, 10, 21, 6, i % 60).isoformat()) for i in range(60)]
+    ha.add_records(monday + wednesday)
+    ew_mean, std = ha.predict_correction("r", "bus")
+    errs = lambda rows: [a - p for _, _, p, a, _ in rows]
+    when = KST.localize(datetime(2026, 10, 26, 8, 30))  # a later Monday, same hour of week
+    corr, std90 = ha.predict_correction("r", "bus", percentile=90, when=when)
+    assert np.quantile(errs(monday), 0.85) <= corr <= np.quantile(errs(monday), 0.95)
+    assert std90 == std
+    corr, _ = ha.predict_correction("r", "bus", percentile=90, when=KST.localize(datetime(2026, 10, 21, 15, 5)))
+    assert np.quantile(errs(wednesday), 0.85) <= corr <= np.quantile(errs(wednesday), 0.95)
+    assert ha.predict_correction("r", "bus", percentile=10, when=when)[0] < ew_mean < corr
+    # no history at all: no correction
+    assert ha.predict_correction("nowhere", "bus", percentile=90) == (0.0, 0.0)
+
+def test_percentile_on_sparse_bucket_merges_nearest_hours(ha):
+    # too few trips at Tuesday 09h KST: the same hour on neighbouring days fills in
+    sparse = [("r", "bus", 20, 40, datetime(2026, 10, 20, 0, i).isoformat()) for i in range(MIN_BUCKET_N // 4)]
+    monday = [("r", "bus", 20, 21, datetime(2026, 10, 19, 0, i).isoformat()) for i in range(MIN_BUCKET_N)]
+    far = [("r", "bus", 20, 99, datetime(2026, 10, 23, 12, i).isoformat()) for i in range(MIN_BUCKET_N)]
+    ha.add_records(sparse + monday + far)
+    when = KST.localize(datetime(2026, 10, 20, 9, 0))
+    assert ha.predict_correction("r", "bus", percentile=100, when=when)[0] == 20
+    assert ha.predict_correction("r", "bus", percentile=0, when=when)[0] == 1
@@ -0,0 +1,53 @@
+# tests/test_plan.py
+"""
+PlanAgent.plan() on the fixture timetable: which live terms (arrival wait,
+traffic delay) are added on top of a mode's minutes.
+"""
+import types
+import pytest
+import agents.plan_agent as plan_agent
+from agents.data_agent import DataAgent
+from agents.history_agent import HistoryAgent
+from agents.plan_agent import PlanAgent
+from agents.route_agent import RouteAgent, journey_minutes
+from agents.schedule_agent import ScheduleAgent
+from tests.test_transit import _near
+
+LIVE_WAIT = 7
+
+class Arrivals:
+    def __init__(self):
+        self.asked = []
+
+    def get(self, mode, station):
+        self.asked.append((mode, station))
+        return LIVE_WAIT
+
+    def watch(self, mode, station, wake_dt):
+        pass
+
+@pytest.fixture
+def pa(net, tmp_path, monkeypatch):
+    places = {"A1": _near("A1"), "A4": _near("A4", 0), "S1": _near("S1"), "S3": _near("S3", -0.002)}
+    monkeypatch.setattr(plan_agent, "geocode", lambda addr, deadline=None: places[addr])
+    return PlanAgent(DataAgent(), RouteAgent(osrm_url="http://127.0.0.1:9", transit=net),
+                     HistoryAgent(str(tmp_path / "h.db")), Arrivals(), od=types.SimpleNamespace(get=lambda *a: None))
+
+def _plan(pa, start, end, mode):
+    return pa.plan(start, end, "08:40", modes=(mode,), use_history=False,
+                   bus_station_id="228000710", subway_station="서울역")
+
+@pytest.mark.parametrize("start,end,mode", [("A1", "A4", "bus"), ("S1", "S3", "subway")])
+def test_timetable_minutes_get_no_live_wait_or_traffic(pa, start, end, mode):
+    arrive_by = ScheduleAgent("08:40").target_dt()
+    j = pa.ra.transit_journey(plan_agent.geocode(start), plan_agent.geocode(end), arrive_by, mode=mode)
+    r = _plan(pa, start, end, mode)
+    assert r.wait_eta == 0 and pa.arrivals.asked == []
+    assert r.base_minutes == journey_minutes(j, arrive_by) + r.signal_penalty
+
+def test_straight_line_bus_gets_live_wait_and_traffic(pa):
+    # S1 -> S3 has no bus on the timetable
+    r = _plan(pa, "S1", "S3", "bus")
+    assert pa.arrivals.asked == [("bus", "228000710")] and r.wait_eta == LIVE_WAIT
+    estimate = pa.ra._estimate(plan_agent.geocode("S1"), plan_agent.geocode("S3"), "bus")
+    assert r.base_minutes == estimate + r.traffic_delay + r.signal_penalty
@@ -0,0 +1,86 @@
+# tests/test_server.py
+"""
+server.PlanService over a real socket, with the alarm scheduler but no
+plan agent (the alarm / parsing paths don't plan).
+"""
+import asyncio, json, logging, socket, threading, types
+from datetime import datetime, timedelta, timezone
+import pytest
+from server import PlanService
+from agents.alarm_scheduler import AlarmScheduler, InboxNotifier
+from utils import metrics
+
+@pytest.fixture
+def service():
+    inbox = InboxNotifier()
+    svc = PlanService(plan_agent=types.SimpleNamespace(ha=None), scheduler=AlarmScheduler(inbox), inbox=inbox)
+    ready, port = threading.Event(), []
+    def on_ready(server):
+        port.append(server.sockets[0].getsockname()[1])
+        ready.set()
+    threading.Thread(target=lambda: asyncio.run(svc.serve("127.0.0.1", 0, on_ready)), daemon=True).start()
+    ready.wait(5)
+    svc.port = port[0]
+    yield svc
+    svc.scheduler.stop()
+
+def raw(svc, request):
+    """send raw bytes, return (status, JSON body) or None when the connection closed without a reply"""
+    with socket.create_connection(("127.0.0.1", svc.port), timeout=5) as s:
+        s.sendall(request)
+        data = b""
+        while chunk := s.recv(65536):
+            data += chunk
+    if not data:
+        return None
+    head, _, body = data.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(body)
+
+def call(svc, method, path, body=None):
+    data = json.dumps(body).encode() if body is not None else b""
+    return raw(svc, f"{method} {path} HTTP/1.1\r\nConnection: close\r\nContent-Length: {len(data)}\r\n\r\n"
+                    .encode() + data)
+
+def test_alarm_with_utc_offset_is_scheduled_in_local_time(service):
+    wake = datetime.now(timezone(timedelta(hours=9))).replace(microsecond=0) + timedelta(hours=2)
+    status, body = call(service, "POST", "/alarms", {"user": "u1", "wake_dt": wake.isoformat(), "plan": {
+        "start_addr": "a", "end_addr": "b"}})
+    assert status == 201
+    status, body = call(service, "GET", "/alarms?user=u1")
+    local = wake.astimezone().replace(tzinfo=None)
+    assert [a["wake_dt"] for a in body["pending"]] == [local.isoformat(timespec="minutes")]
+
+def test_unschedulable_alarm_leaves_no_ghost():
+    sched = AlarmScheduler(InboxNotifier())
+    aware = datetime.now(timezone.utc) + timedelta(hours=1)
+    with pytest.raises(TypeError):  # naive now() - aware wake_dt in the refresh interval
+        sched.schedule("u1", aware, refresh=lambda: None)
+    assert sched.pending() == [] and sched._heap == []
+    sched.stop()
+
+def test_failed_refresh_comparison_keeps_refreshing(caplog):
+    sched = AlarmScheduler(InboxNotifier())
+    wake = datetime.now() + timedelta(hours=1)
+    alarm_id = sched.schedule("u1", wake, refresh=lambda: datetime.now(timezone.utc) + timedelta(hours=1))
+    alarm = sched._alarms[alarm_id]
+    sched._heap.clear()
+    with caplog.at_level(logging.ERROR, logger="agents.alarm_scheduler"):
+        sched._refresh(alarm, alarm.version)
+    assert "alarm refresh failed" in caplog.text
+    assert alarm.wake_dt == wake
+    assert [e[4] for e in sched._heap] == ["refresh"]
+    sched.stop()
+
+@pytest.mark.parametrize("length", ["abc", "-5"])
+def test_bad_content_length_is_400(service, length):
+    status, body = raw(service, f"POST /history HTTP/1.1\r\nContent-Length: {length}\r\n\r\n{{}}".encode())
+    assert status == 400 and "Content-Length" in body["error"]
+
+def test_unknown_paths_share_one_metrics_series(service):
+    metrics.reset()
+    for i in range(5):
+        assert call(service, "GET", f"/zz{i}")[0] == 404
+    assert call(service, "DELETE", "/health")[0] == 405
+    assert call(service, "GET", "/health")[0] == 200
+    paths = {h["labels"]["path"] for h in metrics.snapshot()["histograms"] if h["name"] == "api"}
+    assert paths == {"unknown", "health"}
@@ -0,0 +1,69 @@
+# tests/test_sketch.py
+import random
+import numpy as np
+import pytest
+from utils.sketch import DEFAULT_K, KLLSketch
+
+# rank error is ~1.7/k; leave room so the random compactions never flake
+EPS = 3.0 / DEFAULT_K
+QS = np.linspace(0.01, 0.99, 99)
+
+@pytest.fixture(autouse=True)
+def _seed():
+    random.seed(1)  # compaction offsets come from the random module
+
+def assert_rank_error(sketch, data):
+    """every sketch quantile lies between the exact (q - EPS) and (q + EPS) quantiles"""
+    lo = np.quantile(data, np.clip(QS - EPS, 0, 1))
+    hi = np.quantile(data, np.clip(QS + EPS, 0, 1))
+    got = np.array([sketch.quantile(q) for q in QS])
+    assert np.all((got >= lo) & (got <= hi)), QS[(got < lo) | (got > hi)]
+
+def test_quantiles_single_sketch():
+    data = np.random.default_rng(0).lognormal(1.0, 0.8, 100_000) - 3.0
+    s = KLLSketch()
+    for x in data:
+        s.update(x)
+    assert len(s) == len(data)
+    assert s._size() < 4 * DEFAULT_K
+    assert_rank_error(s, data)
+
+def test_quantiles_merged_sketches():
+    # 24 hourly sketches with different distributions, merged at query time
+    rng = np.random.default_rng(1)
+    parts = [rng.normal(h % 7, 1 + h % 3, rng.integers(200, 5000)) for h in range(24)]
+    sketches = []
+    for part in parts:
+        s = KLLSketch()
+        for x in part:
+            s.update(x)
+        sketches.append(s)
+    merged = KLLSketch.merged(sketches)
+    data = np.concatenate(parts)
+    assert len(merged) == len(data)
+    assert merged._size() < 4 * DEFAULT_K
+    assert_rank_error(merged, data)
+
+def test_small_sketch_is_exact():
+    s = KLLSketch()
+    for x in [5, 1, 4, 2, 3]:
+        s.update(x)
+    assert [s.quantile(q) for q in (0.0, 0.2, 0.5, 1.0)] == [1.0, 1.0, 3.0, 5.0]
+    assert KLLSketch().quantile(0.5) is None
+
+def test_bytes_round_trip_float32():
+    s = KLLSketch(k=64)
+    for x in np.random.default_rng(2).normal(0, 10, 20_000):
+        s.update(x)
+    r = KLLSketch.from_bytes(s.to_bytes())
+    assert (r.n, r.k) == (s.n, s.k)
+    assert [len(level) for level in r.levels] == [len(level) for level in s.levels]
+    for a, b in zip(s.levels, r.levels):
+        assert np.array_equal(np.float32(a), np.float32(b))
+    for q in QS:
+        assert r.quantile(q) == float(np.float32(s.quantile(q)))
+    # a restored sketch keeps accepting values and merging
+    r.update(1.5)
+    r.merge(KLLSketch.from_bytes(s.to_bytes()))
+    assert len(r) == 2 * s.n + 1
+    assert KLLSketch.from_bytes(KLLSketch().to_bytes()).quantile(0.5) is None
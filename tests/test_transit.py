@@ -0,0 +1,126 @@
+# tests/test_transit.py
+"""
+RAPTOR (utils/transit.py) against a plain connection-scan search over the
+same fixture feed, read straight from the GTFS text files.
+"""
+import csv, math, os
+from collections import defaultdict
+from datetime import datetime
+import pytest
+from utils.geo import haversine_km
+from utils.transit import MAX_ACCESS_M, TRANSFER_RADIUS_M, WALK_KMH
+from agents.route_agent import RouteAgent, journey_minutes
+from tests.conftest import GTFS
+
+WALK_MPS = WALK_KMH / 3.6
+
+def _rows(name):
+    with open(os.path.join(GTFS, name), encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
+
+def _secs(hms):
+    h, m, s = map(int, hms.split(":"))
+    return h * 3600 + m * 60 + s
+
+def _walk_s(a, b):
+    return math.ceil(haversine_km(a, b) * 1000.0 / WALK_MPS)
+
+class ConnectionScan:
+    """earliest arrival by connection scan, footpaths after every alighting"""
+    def __init__(self, route_types=None):
+        self.stops = {r["stop_id"]: (float(r["stop_lat"]), float(r["stop_lon"])) for r in _rows("stops.txt")}
+        rtype = {r["route_id"]: int(r["route_type"]) for r in _rows("routes.txt")}
+        weekday = {r["service_id"] for r in _rows("calendar.txt") if r["monday"] == "1"}
+        trips = {r["trip_id"] for r in _rows("trips.txt")
+                 if r["service_id"] in weekday and (route_types is None or rtype[r["route_id"]] in route_types)}
+        by_trip = defaultdict(list)
+        for r in _rows("stop_times.txt"):
+            if r["trip_id"] in trips:
+                by_trip[r["trip_id"]].append((int(r["stop_sequence"]), r["stop_id"], _secs(r["arrival_time"]), _secs(r["departure_time"])))
+        self.conns = sorted((a[3], b[2], a[1], b[1], t) for t, st in by_trip.items()
+                            for a, b in zip(sorted(st), sorted(st)[1:]))
+
+    def arrive(self, origin, dest, depart_s):
+        reach = {s: depart_s + _walk_s(origin, c) for s, c in self.stops.items()
+                 if haversine_km(origin, c) * 1000.0 <= MAX_ACCESS_M}
+        on = set()
+        for dep, arr, a, b, trip in self.conns:
+            if trip in on or reach.get(a, math.inf) <= dep:
+                on.add(trip)
+                for s, c in self.stops.items():
+                    d = haversine_km(self.stops[b], c) * 1000.0
+                    if s == b or d <= TRANSFER_RADIUS_M:
+                        t = arr if s == b else arr + math.ceil(d / WALK_MPS)
+                        if t < reach.get(s, math.inf):
+                            reach[s] = t
+        best = depart_s + _walk_s(origin, dest)
+        for s, t in reach.items():
+            if haversine_km(dest, self.stops[s]) * 1000.0 <= MAX_ACCESS_M:
+                best = min(best, t + _walk_s(self.stops[s], dest))
+        return best
+
+_REF = ConnectionScan()
+
+def _near(stop_id, dlat=0.002):
+    lat, lon = _REF.stops[stop_id]
+    return lat + dlat, lon
+
+ODS = [("A1", "A4"), ("A1", "S3"), ("A2", "S2"), ("S3", "A1"), ("A1", "S2"), ("S1", "S3")]
+
+@pytest.mark.parametrize("o,d", ODS)
+def test_earliest_arrival_matches_connection_scan(net, o, d):
+    ref = _REF
+    origin, dest = _near(o), _near(d, -0.002)
+    for depart in range(7 * 3600, 8 * 3600 + 1, 7 * 60 + 13):
+        j = net.query(origin, dest, depart)
+        assert j["arrive_s"] == ref.arrive(origin, dest, depart), (o, d, depart)
+        assert j["legs"][-1]["arr_s"] == j["arrive_s"]
+        assert ref.arrive(origin, dest, j["leave_s"]) <= j["arrive_s"]
+
+def test_route_types_restrict_vehicles(net):
+    origin, dest = _near("A1"), _near("S3", -0.002)
+    for types, ref in (([3], ConnectionScan({3})), ([1], ConnectionScan({1}))):
+        j = net.query(origin, dest, 7 * 3600, route_types=types)
+        assert j["arrive_s"] == ref.arrive(origin, dest, 7 * 3600)
+
+def test_overtaking_express_is_taken(net):
+    # the 07:32 express passes the 07:30 local before A2
+    j = net.query(_near("A1", 0), _near("A4", 0), 7 * 3600 + 31 * 60)
+    ride = [leg for leg in j["legs"] if leg["mode"] == "bus"]
+    assert len(ride) == 1 and ride[0]["dep_s"] == 7 * 3600 + 32 * 60
+
+def test_weekend_trips_are_dropped(net):
+    # the Saturday/Sunday 07:03 trip would reach A4 at 07:06
+    j = net.query(_near("A1", 0), _near("A4", 0), 7 * 3600 + 2 * 60)
+    assert j["arrive_s"] > 7 * 3600 + 10 * 60
+
+@pytest.mark.parametrize("o,d", ODS)
+def test_arrive_by_leaves_late_and_arrives_in_time(net, o, d):
+    ref = _REF
+    origin, dest = _near(o), _near(d, -0.002)
+    deadline = 8 * 3600 + 40 * 60 - 3600  # 07:40
+    j = net.query_arrive_by(origin, dest, deadline)
+    assert j["arrive_s"] <= deadline
+    assert ref.arrive(origin, dest, j["leave_s"]) <= deadline
+    # latest minute one could leave and still make it, by brute force
+    latest = max(t for t in range(deadline - 5400, deadline, 60) if ref.arrive(origin, dest, t) <= deadline)
+    assert j["leave_s"] >= latest - 60
+
+def test_leave_time_skips_the_wait_at_the_first_stop(net):
+    # bus every 10 min; leaving at 07:01 would mean waiting for the 07:10 bus
+    j = net.query(_near("A1"), _near("A4", 0), 7 * 3600 + 60)
+    access = j["legs"][0]["arr_s"] - j["legs"][0]["dep_s"]
+    assert j["legs"][1]["dep_s"] == 7 * 3600 + 10 * 60 + 30  # 30 s dwell at A1
+    assert j["leave_s"] == j["legs"][1]["dep_s"] - access
+    assert j["minutes"] == math.ceil((j["arrive_s"] - j["leave_s"]) / 60)
+
+def test_walk_only_bus_falls_back_to_straight_line(net):
+    ra = RouteAgent(transit=net)
+    # S1 -> S3 only has the subway; a "bus" option must not be a walking time
+    start, end = _near("S1"), _near("S3", -0.002)
+    arrive_by = datetime(2026, 10, 19, 8, 40)
+    assert ra.transit_journey(start, end, arrive_by, mode="bus") is None
+    assert ra.estimate_bus_minutes(start, end, arrive_by) == ra._estimate(start, end, "bus")
+    j = ra.transit_journey(start, end, arrive_by, mode="subway")
+    assert ra.estimate_subway_minutes(start, end, arrive_by) == journey_minutes(j, arrive_by)
+    assert j["arrive_s"] <= 8 * 3600 + 40 * 60
@@ -21,3 +21,16 @@ TRAFFIC_API_KEY = _get("TRAFFIC_API_KEY")
 CROSSROAD_API_KEY = _get("CROSSROAD_API_KEY")
 TRAFFIC_LIGHT_API_KEY = _get("TRAFFIC_LIGHT_API_KEY")
 NOMINATIM_USER_AGENT = _get("NOMINATIM_USER_AGENT", "smart-commute-agent")
+# upstream base URLs (override to point at local stand-ins, e.g. bench/fake_upstream.py)
+NOMINATIM_URL = _get("NOMINATIM_URL", "https://nominatim.openstreetmap.org")
+KMA_URL = _get("KMA_URL", "https://apis.data.go.kr/1360000")
+BUS_API_URL = _get("BUS_API_URL", "https://apis.data.go.kr/6410000")
+SUBWAY_API_URL = _get("SUBWAY_API_URL", "http://swopenAPI.seoul.go.kr")
+# optional push endpoint for server-side alarms (agents/alarm_scheduler.WebhookNotifier)
+ALARM_WEBHOOK_URL = _get("ALARM_WEBHOOK_URL")
+# OSRM-compatible routing server (point at a local osrm-backend to avoid the public demo)
+OSRM_URL = _get("OSRM_URL", "https://router.project-osrm.org")
+# local signalized-intersection dump (.csv or prebuilt .npz, see utils/crossing_index.py)
+CROSSINGS_PATH = _get("CROSSINGS_PATH")
+# compiled GTFS timetable directory (python -m utils.transit gtfs/ out/), enables timetable routing
+TRANSIT_PATH = _get("TRANSIT_PATH")
@@ -0,0 +1,48 @@
+# utils/cache.py
+import threading, time
+from collections import OrderedDict
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache with per-entry expiry.
+    Shared by all Streamlit sessions of the process when kept at module level.
+    """
+    def __init__(self, maxsize=1024, ttl_s=300):
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires <= time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl_s=None, expires_at=None):
+        """expires_at (epoch seconds) wins over ttl_s, which wins over the default ttl."""
+        if expires_at is None:
+            expires_at = time.time() + (self.ttl_s if ttl_s is None else ttl_s)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
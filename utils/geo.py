@@ -0,0 +1,79 @@
+# utils/geo.py
+import numpy as np
+
+EARTH_R_KM = 6371.0
+
+def _as_latlon(points):
+    a = np.asarray(points, dtype=np.float64)
+    if a.ndim == 1:
+        a = a.reshape(1, 2)
+    return np.radians(a[:, 0]), np.radians(a[:, 1])
+
+def haversine_matrix(origins, destinations):
+    """
+    origins (N,2), destinations (M,2) in (lat, lon) degrees -> (N,M) km.
+    sin(d/2) is expanded as sin(b/2)cos(a/2) - cos(b/2)sin(a/2), so all trig
+    except one arcsin runs per point; the (N,M) work is in-place multiply/add.
+    """
+    lat1, lon1 = _as_latlon(origins)
+    lat2, lon2 = _as_latlon(destinations)
+    aa = np.multiply(np.cos(lat1/2)[:, None], np.sin(lat2/2)[None, :])
+    tmp = np.multiply(np.sin(lat1/2)[:, None], np.cos(lat2/2)[None, :])
+    aa -= tmp; aa *= aa                                   # sin^2(dlat/2)
+    bb = np.multiply(np.cos(lon1/2)[:, None], np.sin(lon2/2)[None, :])
+    np.multiply(np.sin(lon1/2)[:, None], np.cos(lon2/2)[None, :], out=tmp)
+    bb -= tmp; bb *= bb                                   # sin^2(dlon/2)
+    bb *= np.cos(lat1)[:, None]; bb *= np.cos(lat2)[None, :]
+    aa += bb
+    np.clip(aa, 0.0, 1.0, out=aa)
+    np.sqrt(aa, out=aa)
+    np.arcsin(aa, out=aa)  # == atan2(sqrt(a), sqrt(1-a)) for a in [0, 1]
+    aa *= 2*EARTH_R_KM
+    return aa
+
+def haversine_km(a, b):
+    """scalar great-circle distance between two (lat, lon) points in km"""
+    return float(haversine_matrix(a, b)[0, 0])
+
+def zoom_tolerance_m(zoom, lat, pixels=1.0):
+    """ground distance (m) covered by `pixels` web-mercator pixels at zoom/lat"""
+    return pixels * 156543.03392 * np.cos(np.radians(lat)) / (2 ** zoom)
+
+def simplify_polyline(coords, tolerance_m):
+    """
+    Douglas–Peucker simplification of a (lat, lon) polyline.
+    Points closer than tolerance_m to the simplified line are dropped;
+    endpoints are always kept. Returns an (K,2) float array.
+    """
+    pts = np.asarray(coords, dtype=np.float64)
+    n = len(pts)
+    if n < 3 or tolerance_m <= 0:
+        return pts
+    # local equirectangular projection to metres
+    lat0 = np.radians(pts[:, 0].mean())
+    xy = np.empty_like(pts)
+    xy[:, 0] = np.radians(pts[:, 1]) * np.cos(lat0) * EARTH_R_KM * 1000
+    xy[:, 1] = np.radians(pts[:, 0]) * EARTH_R_KM * 1000
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j <= i + 1:
+            continue
+        a, b = xy[i], xy[j]
+        seg = xy[i+1:j]
+        ab = b - a
+        L2 = ab @ ab
+        if L2 == 0:
+            d = np.hypot(*(seg - a).T)
+        else:
+            t = np.clip(((seg - a) @ ab) / L2, 0.0, 1.0)
+            d = np.hypot(*(seg - (a + t[:, None] * ab)).T)
+        k = int(d.argmax())
+        if d[k] > tolerance_m:
+            k += i + 1
+            keep[k] = True
+            stack.append((i, k))
+            stack.append((k, j))
+    return pts[keep]
@@ -0,0 +1,77 @@
+# utils/geocache.py
+import os, sqlite3, threading, time
+
+CACHE_PATH = os.environ.get("GEOCODE_CACHE_DB") or os.path.join(os.path.dirname(__file__), "..", "geocode_cache.db")
+
+class GeocodeCache:
+    """
+    Disk-backed address -> (lat, lon) cache shared by every process that
+    points at the same file. Entries expire after `ttl_s`; once more than
+    `max_entries` are stored the least recently used ones are evicted.
+    """
+    # last_used is only rewritten when older than this, so hot hits stay read-only
+    TOUCH_EVERY_S = 300
+    EVICT_EVERY = 64
+
+    def __init__(self, path=CACHE_PATH, ttl_s=30*24*3600, max_entries=100_000):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._puts = 0
+        conn = self._conn()
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS geocode (
+            address TEXT PRIMARY KEY,
+            lat REAL,
+            lon REAL,
+            created REAL,
+            last_used REAL
+        )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_geocode_last_used ON geocode(last_used)")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, address):
+        conn = self._conn()
+        row = conn.execute("SELECT lat, lon, created, last_used FROM geocode WHERE address=?", (address,)).fetchone()
+        if not row:
+            return None
+        now = time.time()
+        if now - row[2] > self.ttl_s:
+            conn.execute("DELETE FROM geocode WHERE address=?", (address,))
+            conn.commit()
+            return None
+        if now - row[3] > self.TOUCH_EVERY_S:
+            conn.execute("UPDATE geocode SET last_used=? WHERE address=?", (now, address))
+            conn.commit()
+        return row[0], row[1]
+
+    def put(self, address, coord):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO geocode(address, lat, lon, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                     (address, float(coord[0]), float(coord[1]), now, now))
+        conn.commit()
+        self._puts += 1
+        if self._puts % self.EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM geocode WHERE created < ?", (time.time() - self.ttl_s,))
+        conn.execute("""
+        DELETE FROM geocode WHERE address IN (
+            SELECT address FROM geocode ORDER BY last_used DESC LIMIT -1 OFFSET ?
+        )
+        """, (self.max_entries,))
+        conn.commit()
@@ -0,0 +1,158 @@
+# utils/http.py
+"""
+Shared HTTP client for every agent: one pooled requests.Session, bounded
+retries with jittered exponential backoff, and a circuit breaker per
+endpoint so callers fail fast (and take their fallback) while an upstream
+is down.
+"""
+import random, threading, time
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from utils import metrics
+
+CONNECT_TIMEOUT_S = 3.05
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+class CircuitOpenError(requests.RequestException):
+    """raised instead of calling an endpoint whose breaker is open"""
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures; while open
+    every call fails immediately. After `reset_timeout_s` one trial call is let
+    through (half-open): success closes the breaker, failure re-opens it.
+    """
+    def __init__(self, name, failure_threshold=5, reset_timeout_s=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout_s:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout_s or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+_session = None
+_breakers = {}
+_lock = threading.Lock()
+
+def session():
+    """process-wide pooled session (thread-safe for plain GETs)"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=0)
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                _session = s
+    return _session
+
+def breaker(endpoint):
+    b = _breakers.get(endpoint)
+    if b is None:
+        with _lock:
+            b = _breakers.setdefault(endpoint, CircuitBreaker(endpoint))
+    return b
+
+def _endpoint_name(url):
+    parts = urlsplit(url)
+    first = parts.path.strip("/").split("/", 1)[0]
+    return f"{parts.netloc}/{first}"
+
+def get(url, params=None, headers=None, timeout=8, endpoint=None, retries=1, backoff_s=0.25):
+    """
+    GET with retries and a per-endpoint circuit breaker. Returns a response
+    with a 2xx status; raises requests.RequestException (CircuitOpenError
+    when the breaker is open) otherwise.
+    """
+    b = breaker(endpoint or _endpoint_name(url))
+    if not b.allow():
+        metrics.incr("circuit_open", endpoint=b.name)
+        raise CircuitOpenError(f"circuit open: {b.name}")
+    with metrics.span("http", endpoint=b.name):
+        return _get(b, url, params, headers, timeout, retries, backoff_s)
+
+def _get(b, url, params, headers, timeout, retries, backoff_s):
+    attempt = 0
+    while True:
+        try:
+            r = session().get(url, params=params, headers=headers, timeout=(CONNECT_TIMEOUT_S, timeout))
+            if r.status_code in RETRY_STATUS and attempt < retries:
+                raise requests.HTTPError(f"{r.status_code} from {b.name}", response=r)
+            r.raise_for_status()
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            retryable = status is None or status in RETRY_STATUS
+            if retryable and attempt < retries:
+                attempt += 1
+                metrics.incr("http_retry", endpoint=b.name)
+                # full jitter: sleep U(0, backoff * 2^attempt)
+                time.sleep(random.uniform(0, backoff_s * (2 ** attempt)))
+                continue
+            if retryable:
+                b.record_failure()
+            else:
+                b.record_success()  # 4xx: the endpoint is up, the request was bad
+            raise
+        except Exception:
+            b.record_failure()
+            raise
+        b.record_success()
+        return r
+
+def post(url, json=None, timeout=8, endpoint=None):
+    """
+    POST (not retried: it may not be idempotent) behind the same per-endpoint
+    circuit breaker as get(). Returns a 2xx response or raises.
+    """
+    b = breaker(endpoint or _endpoint_name(url))
+    if not b.allow():
+        metrics.incr("circuit_open", endpoint=b.name)
+        raise CircuitOpenError(f"circuit open: {b.name}")
+    with metrics.span("http", endpoint=b.name):
+        try:
+            r = session().post(url, json=json, timeout=(CONNECT_TIMEOUT_S, timeout))
+            r.raise_for_status()
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code not in RETRY_STATUS:
+                b.record_success()  # 4xx: the endpoint is up, the request was bad
+            else:
+                b.record_failure()
+            raise
+        except Exception:
+            b.record_failure()
+            raise
+        b.record_success()
+        return r
@@ -1,22 +1,92 @@
 # utils/map_utils.py
-import requests
-from utils.api_keys import NOMINATIM_USER_AGENT
-from functools import lru_cache
+import threading, time
+from utils import http, metrics
+from utils.api_keys import NOMINATIM_USER_AGENT, NOMINATIM_URL
+from utils.cache import TTLCache
+from utils.geocache import GeocodeCache, CACHE_PATH
+from utils.rate_limit import SharedRateLimit, RateLimited
 
-@lru_cache(maxsize=512)
-def geocode(address: str):
-    """
-    address -> (lat, lon)
-    uses Nominatim with caching. Raises ValueError if not found.
-    """
-    if not address:
-        raise ValueError("empty address")
-    url = "https://nominatim.openstreetmap.org/search"
+# Nominatim usage policy: at most 1 request per second, counted across every
+# process sharing the geocode cache file
+_nominatim_bucket = SharedRateLimit(CACHE_PATH, "nominatim", rate=1.0)
+
+# in-process L1 in front of the shared disk cache
+_mem_cache = TTLCache(maxsize=512, ttl_s=24*3600)
+
+_disk_cache = None
+_disk_cache_lock = threading.Lock()
+
+def _cache():
+    global _disk_cache
+    if _disk_cache is None:
+        with _disk_cache_lock:
+            if _disk_cache is None:
+                _disk_cache = GeocodeCache()
+    return _disk_cache
+
+def normalize_address(address):
+    return " ".join(address.split()) if address else ""
+
+def _nominatim(address, deadline=None):
+    url = f"{NOMINATIM_URL}/search"
     headers = {"User-Agent": NOMINATIM_USER_AGENT}
     params = {"q": address, "format": "json", "limit": 1}
-    resp = requests.get(url, params=params, headers=headers, timeout=8)
-    resp.raise_for_status()
+    # don't hold a shared worker past the caller's deadline waiting for a slot
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    if not _nominatim_bucket.acquire(timeout):
+        metrics.incr("rate_limited", endpoint="nominatim")
+        raise RateLimited("nominatim: no request slot before the deadline")
+    resp = http.get(url, params=params, headers=headers, timeout=8, endpoint="nominatim")
     j = resp.json()
     if not j:
         raise ValueError("address not found")
     return float(j[0]["lat"]), float(j[0]["lon"])
+
+def _lookup(address, deadline=None):
+    hit = _cache().get(address)
+    metrics.cache("geocode_disk", hit is not None)
+    if hit is not None:
+        return hit
+    with metrics.span("nominatim"):
+        coord = _nominatim(address, deadline)
+    _cache().put(address, coord)
+    return coord
+
+def _geocode_normalized(address, deadline=None):
+    coord = _mem_cache.get(address)
+    metrics.cache("geocode_mem", coord is not None)
+    if coord is None:
+        coord = _lookup(address, deadline)
+        _mem_cache.set(address, coord)
+    return coord
+
+def geocode(address: str, deadline=None):
+    """
+    address -> (lat, lon)
+    in-process LRU -> shared disk cache -> rate-limited Nominatim.
+    Raises ValueError if not found, RateLimited when no Nominatim slot is
+    free before deadline (time.monotonic() value; default: wait).
+    """
+    address = normalize_address(address)
+    if not address:
+        raise ValueError("empty address")
+    with metrics.span("geocode"):
+        return _geocode_normalized(address, deadline)
+
+def geocode_many(addresses):
+    """
+    addresses -> list of (lat, lon) or None (not found / failed), same order.
+    Duplicates are looked up once; cache misses go to Nominatim one at a
+    time under the rate limiter.
+    """
+    unique = {}
+    for a in addresses:
+        unique.setdefault(normalize_address(a), None)
+    for a in unique:
+        if not a:
+            continue
+        try:
+            unique[a] = _geocode_normalized(a)
+        except Exception:
+            unique[a] = None
+    return [unique[normalize_address(a)] for a in addresses]
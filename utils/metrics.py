@@ -0,0 +1,170 @@
+# utils/metrics.py
+"""
+Lightweight in-process instrumentation: counters and latency histograms,
+keyed by metric name plus labels.
+
+    with metrics.span("weather"):
+        ...
+    metrics.incr("cache_hit", cache="forecast")
+
+snapshot() returns everything as a dict; prometheus_text() renders the
+Prometheus exposition format; write_snapshot() dumps either to a file.
+A counter update is a dict lookup under one lock and a span a few microseconds,
+cheap enough to leave on in production.
+"""
+import bisect, functools, json, os, threading, time
+from contextlib import contextmanager
+
+# latency bucket upper bounds, seconds
+BUCKETS_S = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+SNAPSHOT_PATH = os.environ.get("METRICS_SNAPSHOT_PATH")
+SNAPSHOT_EVERY_S = 15.0
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> int
+_histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum, count]
+_last_write = 0.0
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items())) if labels else ()
+
+def incr(name, n=1, **labels):
+    k = _key(name, labels)
+    with _lock:
+        _counters[k] = _counters.get(k, 0) + n
+
+def observe(name, seconds, **labels):
+    k = _key(name, labels)
+    i = bisect.bisect_left(BUCKETS_S, seconds)
+    with _lock:
+        h = _histograms.get(k)
+        if h is None:
+            h = _histograms[k] = [0] * (len(BUCKETS_S) + 3)
+        h[i] += 1
+        h[-2] += seconds
+        h[-1] += 1
+
+@contextmanager
+def span(name, **labels):
+    """time the block into histogram `name`; exceptions also count as error"""
+    t = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        incr(name + "_error", **labels)
+        raise
+    finally:
+        observe(name, time.perf_counter() - t, **labels)
+
+def timed(name, **labels):
+    """decorator form of span()"""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+def cache(name, hit):
+    incr("cache_hit" if hit else "cache_miss", cache=name)
+
+def fallback(source, reason="error"):
+    incr("fallback", source=source, reason=reason)
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+# ---------- reading ----------
+def quantile(hist, q):
+    """approximate quantile (seconds) from a snapshot histogram by linear interpolation in its bucket"""
+    counts, total = hist["buckets"], hist["count"]
+    if not total:
+        return 0.0
+    target = q * total
+    cum, lower = 0, 0.0
+    for ub, c in zip(list(BUCKETS_S) + [float("inf")], counts):
+        if c and cum + c >= target:
+            if ub == float("inf"):
+                return lower
+            return lower + (ub - lower) * (target - cum) / c
+        cum += c
+        lower = ub
+    return lower
+
+def snapshot():
+    with _lock:
+        counters = [(k, v) for k, v in _counters.items()]
+        hists = [(k, list(h)) for k, h in _histograms.items()]
+    out = {"time": time.time(), "counters": [], "histograms": [], "caches": {}}
+    for (name, labels), v in sorted(counters):
+        out["counters"].append({"name": name, "labels": dict(labels), "value": v})
+    for (name, labels), h in sorted(hists):
+        entry = {"name": name, "labels": dict(labels), "buckets": h[:-2], "sum": h[-2], "count": h[-1]}
+        entry["p50"] = quantile(entry, 0.5)
+        entry["p95"] = quantile(entry, 0.95)
+        out["histograms"].append(entry)
+    caches = {}
+    for c in out["counters"]:
+        if c["name"] in ("cache_hit", "cache_miss"):
+            slot = caches.setdefault(c["labels"].get("cache", "?"), {"hit": 0, "miss": 0})
+            slot["hit" if c["name"] == "cache_hit" else "miss"] += c["value"]
+    for name, slot in caches.items():
+        total = slot["hit"] + slot["miss"]
+        slot["hit_ratio"] = slot["hit"] / total if total else 0.0
+    out["caches"] = caches
+    return out
+
+def _prom_labels(labels, extra=None):
+    items = list(labels.items()) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in items) + "}"
+
+def prometheus_text(snap=None):
+    snap = snap or snapshot()
+    lines = []
+    seen = set()
+    for c in snap["counters"]:
+        metric = f"smart_commute_{c['name']}_total"
+        if metric not in seen:
+            lines.append(f"# TYPE {metric} counter"); seen.add(metric)
+        lines.append(f"{metric}{_prom_labels(c['labels'])} {c['value']}")
+    for h in snap["histograms"]:
+        metric = f"smart_commute_{h['name']}_seconds"
+        if metric not in seen:
+            lines.append(f"# TYPE {metric} histogram"); seen.add(metric)
+        cum = 0
+        for ub, n in zip(list(BUCKETS_S) + ["+Inf"], h["buckets"]):
+            cum += n
+            lines.append(f"{metric}_bucket{_prom_labels(h['labels'], {'le': ub})} {cum}")
+        lines.append(f"{metric}_sum{_prom_labels(h['labels'])} {h['sum']}")
+        lines.append(f"{metric}_count{_prom_labels(h['labels'])} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+def write_snapshot(path, fmt=None):
+    """write JSON (default) or Prometheus text (fmt='prom' or a .prom path) atomically"""
+    fmt = fmt or ("prom" if path.endswith(".prom") else "json")
+    snap = snapshot()
+    text = prometheus_text(snap) if fmt == "prom" else json.dumps(snap, indent=1)
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+def maybe_write_snapshot(path=SNAPSHOT_PATH):
+    """write to METRICS_SNAPSHOT_PATH at most every SNAPSHOT_EVERY_S seconds"""
+    global _last_write
+    if not path:
+        return
+    now = time.monotonic()
+    if now - _last_write < SNAPSHOT_EVERY_S:
+        return
+    _last_write = now
+    try:
+        write_snapshot(path)
+    except OSError:
+        pass
@@ -0,0 +1,87 @@
+# utils/rate_limit.py
+import sqlite3, threading, time
+
+class RateLimited(TimeoutError):
+    """no token within the caller's timeout"""
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`.
+    acquire() blocks until a token is available or `timeout` would pass.
+    Per process: N processes together allow N * rate.
+    """
+    def __init__(self, rate=1.0, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def try_acquire(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+    def acquire(self, timeout=None):
+        """True once a token is taken; False (without waiting) when it can't be within timeout s"""
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return True
+                wait_s = (1.0 - self._tokens) / self.rate
+            if timeout is not None:
+                if wait_s > timeout:
+                    return False
+                timeout -= wait_s
+            time.sleep(wait_s)
+
+class SharedRateLimit:
+    """
+    At most `rate` acquisitions per second across every process that uses
+    the same SQLite file (several Streamlit / API workers on one host).
+    acquire() reserves the next free slot in one write transaction, then
+    sleeps until it; a slot further away than `timeout` is not taken.
+    """
+    def __init__(self, path, name, rate=1.0):
+        self.path = path
+        self.name = name
+        self.rate = float(rate)
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS rate_limit (name TEXT PRIMARY KEY, next_at REAL)")
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def acquire(self, timeout=None):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute("SELECT next_at FROM rate_limit WHERE name=?", (self.name,)).fetchone()
+            slot = max(now, row[0]) if row else now
+            if timeout is not None and slot - now > timeout:
+                conn.rollback()
+                return False
+            conn.execute("INSERT OR REPLACE INTO rate_limit(name, next_at) VALUES (?, ?)", (self.name, slot + 1.0 / self.rate))
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        if slot > now:
+            time.sleep(slot - now)
+        return True
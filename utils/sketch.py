@@ -0,0 +1,116 @@
+# utils/sketch.py
+"""
+KLL streaming quantile sketch (Karnin, Lang, Liberty 2016).
+
+Level h holds items of weight 2**h. When the sketch is full, the lowest
+overfull level is sorted and every other item (random offset) is promoted
+one level up, so memory stays around 3*k items however many values are
+added, and rank error is roughly 1.7/k. Two sketches merge by
+concatenating levels and compacting, so per-hour sketches can be combined
+at query time.
+
+    s = KLLSketch()
+    for x in errors:
+        s.update(x)
+    s.quantile(0.9)
+    KLLSketch.from_bytes(s.to_bytes())
+"""
+import math, random, struct
+from array import array
+
+DEFAULT_K = 128
+_C = 2.0 / 3.0  # capacity decay per level below the top
+_HEADER = struct.Struct("<QHH")  # n, k, number of levels
+
+class KLLSketch:
+    __slots__ = ("k", "n", "levels")
+
+    def __init__(self, k=DEFAULT_K):
+        self.k = k
+        self.n = 0
+        self.levels = [[]]
+
+    def __len__(self):
+        return self.n
+
+    def _capacity(self, h):
+        return max(2, int(math.ceil(self.k * _C ** (len(self.levels) - h - 1))))
+
+    def _max_size(self):
+        return sum(self._capacity(h) for h in range(len(self.levels)))
+
+    def _size(self):
+        return sum(len(level) for level in self.levels)
+
+    def _compress(self):
+        while self._size() >= self._max_size():
+            for h, level in enumerate(self.levels):
+                if len(level) >= self._capacity(h):
+                    if h + 1 == len(self.levels):
+                        self.levels.append([])
+                    level.sort()
+                    # an odd item out stays at this level
+                    keep = [level.pop()] if len(level) % 2 else []
+                    self.levels[h + 1].extend(level[random.getrandbits(1)::2])
+                    self.levels[h] = keep
+                    break
+
+    def update(self, x):
+        self.levels[0].append(float(x))
+        self.n += 1
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compress()
+
+    def merge(self, other):
+        """fold other into self (in place); returns self"""
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for h, level in enumerate(other.levels):
+            self.levels[h].extend(level)
+        self.n += other.n
+        self._compress()
+        return self
+
+    @classmethod
+    def merged(cls, sketches, k=DEFAULT_K):
+        out = cls(k)
+        for s in sketches:
+            out.merge(s)
+        return out
+
+    def quantile(self, q):
+        """approximate q-quantile (0 <= q <= 1) of everything added, or None if empty"""
+        items = sorted((x, 1 << h) for h, level in enumerate(self.levels) for x in level)
+        if not items:
+            return None
+        target = q * sum(w for _, w in items)
+        cum = 0
+        for x, w in items:
+            cum += w
+            if cum >= target:
+                return x
+        return items[-1][0]
+
+    # ---------- storage ----------
+    def to_bytes(self):
+        """n, k, level sizes (uint32) then all items as float32"""
+        sizes = array("I", (len(level) for level in self.levels))
+        values = array("f", (x for level in self.levels for x in level))
+        return _HEADER.pack(self.n, self.k, len(self.levels)) + sizes.tobytes() + values.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        n, k, nlevels = _HEADER.unpack_from(data)
+        off = _HEADER.size
+        sizes = array("I")
+        sizes.frombytes(data[off:off + 4 * nlevels])
+        values = array("f")
+        values.frombytes(data[off + 4 * nlevels:])
+        s = cls(k)
+        s.n = n
+        s.levels = []
+        i = 0
+        for size in sizes:
+            s.levels.append(values[i:i + size].tolist())
+            i += size
+        return s
@@ -0,0 +1,426 @@
+# utils/transit.py
+"""
+Timetable router: a GTFS feed compiled into flat NumPy arrays and queried
+with RAPTOR (Delling, Pajor, Werneck 2012), including walking transfers.
+
+Build once (optionally for one service date) and load memory-mapped, so
+every worker process maps the same pages instead of holding its own copy:
+
+    python -m utils.transit gtfs_dir/ transit_net/ --date 20261019
+
+    net = TransitNetwork.load("transit_net/")
+    j = net.query((37.566, 126.978), (37.498, 127.028), depart_s=8*3600)
+    j["leave_s"], j["arrive_s"], j["legs"]
+    j = net.query_arrive_by((37.566, 126.978), (37.498, 127.028), arrive_by_s=8*3600 + 40*60)
+
+Layout. Trips with the same stop sequence form a pattern (RAPTOR "route");
+each pattern is split further until no trip overtakes another, so every
+stop column of its timetable is sorted. A slot is one (pattern, position)
+pair; slot s owns the times of all the pattern's trips at that stop,
+dep[slot_col[s] : slot_col[s] + ntrips]. dep_key = slot * TIME_KEY + dep
+is therefore globally sorted, and "first trip leaving slot s at or after
+t" for every boarding slot of a round is one np.searchsorted. Riding on
+is a segmented running minimum over the slots of each pattern.
+"""
+import csv, json, os, sys
+from collections import defaultdict
+import numpy as np
+from utils.geo import haversine_matrix
+
+WALK_KMH = 4.5
+MAX_ACCESS_M = 800.0     # walk to / from the first / last stop
+TRANSFER_RADIUS_M = 300.0
+MAX_ROUNDS = 5           # at most this many vehicles per journey
+ARRIVE_BY_LEAD_S = 3600  # query_arrive_by() starts searching this long before the deadline
+ARRIVE_BY_STEP_S = 60
+ARRIVE_BY_QUERIES = 10
+TIME_KEY = 1 << 20       # > any GTFS time in seconds (times may exceed 24:00)
+
+# GTFS route_type -> app mode (basic and extended types)
+def route_mode(route_type):
+    t = int(route_type)
+    if t == 3 or 200 <= t < 300 or 700 <= t < 800:
+        return "bus"
+    if t in (0, 1, 2, 12) or 100 <= t < 200 or 400 <= t < 500 or 900 <= t < 1000:
+        return "subway"
+    return "other"
+
+_ARRAYS = ("stop_coords", "stop_names", "route_type", "route_names", "pat_slot_off", "pat_ntrips",
+           "slot_stop", "slot_col", "dep", "arr", "dep_key", "transfer_off", "transfer_to", "transfer_s")
+
+def _seconds(hms):
+    h, m, s = hms.strip().split(":")
+    return int(h) * 3600 + int(m) * 60 + int(s)
+
+def _csr(keys, n):
+    """offsets for items grouped by key (keys already sorted)"""
+    return np.searchsorted(keys, np.arange(n + 1)).astype(np.int64)
+
+def _ranges(lo, hi):
+    """concatenated [lo, hi) ranges without a Python loop"""
+    n = hi - lo
+    offs = np.repeat(lo - np.concatenate(([0], np.cumsum(n)[:-1])), n)
+    return offs + np.arange(int(n.sum()), dtype=np.int64)
+
+def _active_services(gtfs_dir, date):
+    """service_ids running on date (YYYYMMDD) per calendar.txt / calendar_dates.txt"""
+    from datetime import datetime
+    weekday = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")[
+        datetime.strptime(date, "%Y%m%d").weekday()]
+    active = set()
+    path = os.path.join(gtfs_dir, "calendar.txt")
+    if os.path.exists(path):
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            for row in csv.DictReader(f):
+                if row[weekday] == "1" and row["start_date"] <= date <= row["end_date"]:
+                    active.add(row["service_id"])
+    path = os.path.join(gtfs_dir, "calendar_dates.txt")
+    if os.path.exists(path):
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            for row in csv.DictReader(f):
+                if row["date"] == date:
+                    (active.add if row["exception_type"] == "1" else active.discard)(row["service_id"])
+    return active
+
+def _footpaths(coords, radius_m, walk_kmh):
+    """all stop pairs within radius_m on a uniform grid -> (from, to, seconds) sorted by from"""
+    cell = radius_m / 111_000.0
+    iy = np.floor(coords[:, 0] / cell).astype(np.int64)
+    ix = np.floor(coords[:, 1] / cell).astype(np.int64)
+    cells = defaultdict(list)
+    for i, key in enumerate(zip(iy.tolist(), ix.tolist())):
+        cells[key].append(i)
+    src, dst, dist = [], [], []
+    for (cy, cx), members in cells.items():
+        near = [j for dy in (-1, 0, 1) for dx in (-1, 0, 1) for j in cells.get((cy + dy, cx + dx), ())]
+        a, b = np.array(members), np.array(near)
+        d = haversine_matrix(coords[a], coords[b]) * 1000.0
+        ii, jj = np.nonzero((d <= radius_m) & (a[:, None] != b[None, :]))
+        src.append(a[ii]); dst.append(b[jj]); dist.append(d[ii, jj])
+    if not src:
+        return np.zeros(0, np.int64), np.zeros(0, np.int32), np.zeros(0, np.int32)
+    src, dst, dist = np.concatenate(src), np.concatenate(dst), np.concatenate(dist)
+    order = np.lexsort((dst, src))
+    secs = np.ceil(dist[order] / (walk_kmh / 3.6)).astype(np.int32)
+    return src[order], dst[order].astype(np.int32), secs
+
+class TransitNetwork:
+    def __init__(self, arrays):
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+        # derived per-slot helpers (O(slots), cheap next to the mapped timetable)
+        n_pat = len(self.pat_ntrips)
+        lengths = np.diff(self.pat_slot_off)
+        self.slot_pattern = np.repeat(np.arange(n_pat, dtype=np.int64), lengths)
+        self.slot_pos = np.arange(len(self.slot_stop), dtype=np.int64) - self.pat_slot_off[self.slot_pattern]
+        self.slot_ntrips = np.asarray(self.pat_ntrips, dtype=np.int64)[self.slot_pattern]
+        self._pmax = int(lengths.max()) if n_pat else 1
+        # segmented running minimum: patterns earlier in slot order get a higher
+        # offset, so the minimum restarts at every pattern's first slot
+        self._K = (int(np.max(self.pat_ntrips, initial=0)) + 1) * self._pmax
+        self.slot_seg = (n_pat - 1 - self.slot_pattern) * self._K
+        self.slot_first = self.slot_pos == 0
+        self.transfer_n = np.diff(self.transfer_off)
+        self._type_masks = {}
+
+    def __len__(self):
+        return len(self.stop_coords)
+
+    # ---------- build / persist ----------
+    @classmethod
+    def from_gtfs(cls, gtfs_dir, date=None, transfer_radius_m=TRANSFER_RADIUS_M, walk_kmh=WALK_KMH):
+        def rows(name):
+            with open(os.path.join(gtfs_dir, name), encoding="utf-8-sig", newline="") as f:
+                yield from csv.DictReader(f)
+
+        stop_index, coords, names = {}, [], []
+        for r in rows("stops.txt"):
+            stop_index[r["stop_id"]] = len(coords)
+            coords.append((float(r["stop_lat"]), float(r["stop_lon"])))
+            names.append(r.get("stop_name") or r["stop_id"])
+        routes = {r["route_id"]: (int(r.get("route_type") or 3), r.get("route_short_name") or r.get("route_long_name") or r["route_id"])
+                  for r in rows("routes.txt")}
+        services = _active_services(gtfs_dir, date) if date else None
+        trip_route = {r["trip_id"]: r["route_id"] for r in rows("trips.txt")
+                      if services is None or r["service_id"] in services}
+
+        trips = defaultdict(list)  # trip_id -> [(seq, stop, arr, dep)]
+        for r in rows("stop_times.txt"):
+            if r["trip_id"] in trip_route and r["arrival_time"].strip():
+                trips[r["trip_id"]].append((int(r["stop_sequence"]), stop_index[r["stop_id"]],
+                                            _seconds(r["arrival_time"]), _seconds(r["departure_time"] or r["arrival_time"])))
+
+        # group trips by (route, stop sequence), then split on overtaking
+        groups = defaultdict(list)
+        for trip_id, st in trips.items():
+            st.sort()
+            if len(st) < 2:
+                continue
+            groups[(trip_route[trip_id], tuple(s[1] for s in st))].append(
+                (np.array([s[2] for s in st], np.int32), np.array([s[3] for s in st], np.int32)))
+        patterns = []  # (route_id, stops, arr (T,P), dep (T,P))
+        for (route_id, stops), tt in groups.items():
+            tt.sort(key=lambda x: x[1][0])
+            subs = []  # each: list of (arr, dep) with no overtaking
+            for a, d in tt:
+                for sub in subs:
+                    if (sub[-1][0] <= a).all() and (sub[-1][1] <= d).all():
+                        sub.append((a, d)); break
+                else:
+                    subs.append([(a, d)])
+            for sub in subs:
+                patterns.append((route_id, stops, np.stack([x[0] for x in sub]), np.stack([x[1] for x in sub])))
+
+        # flatten: slots in pattern order, times stop-major within a pattern
+        pat_slot_off, pat_ntrips, slot_stop, slot_col, arr_cols, dep_cols = [0], [], [], [], [], []
+        route_type, route_names = [], []
+        col = 0
+        for route_id, stops, A, D in patterns:
+            T = A.shape[0]
+            slot_stop.extend(stops)
+            slot_col.extend(range(col, col + T * len(stops), T))
+            arr_cols.append(A.T.ravel()); dep_cols.append(D.T.ravel())
+            col += T * len(stops)
+            pat_slot_off.append(len(slot_stop)); pat_ntrips.append(T)
+            rt, rn = routes.get(route_id, (3, route_id))
+            route_type.append(rt); route_names.append(rn)
+        slot_stop = np.array(slot_stop, np.int32)
+        slot_col = np.array(slot_col, np.int64)
+        dep = np.concatenate(dep_cols) if dep_cols else np.zeros(0, np.int32)
+        arr = np.concatenate(arr_cols) if arr_cols else np.zeros(0, np.int32)
+        slot_of_time = np.repeat(np.arange(len(slot_stop), dtype=np.int64),
+                                 np.repeat(np.array(pat_ntrips, np.int64), np.diff(pat_slot_off)))
+
+        coords = np.array(coords, np.float64).reshape(-1, 2)
+        src, dst, secs = _footpaths(coords, transfer_radius_m, walk_kmh)
+        return cls({
+            "stop_coords": coords, "stop_names": np.array(names, dtype=str),
+            "route_type": np.array(route_type, np.int16), "route_names": np.array(route_names, dtype=str),
+            "pat_slot_off": np.array(pat_slot_off, np.int64), "pat_ntrips": np.array(pat_ntrips, np.int32),
+            "slot_stop": slot_stop, "slot_col": slot_col, "dep": dep, "arr": arr,
+            "dep_key": slot_of_time * TIME_KEY + dep,
+            "transfer_off": _csr(src, len(coords)), "transfer_to": dst, "transfer_s": secs,
+        })
+
+    def save(self, out_dir):
+        os.makedirs(out_dir, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(os.path.join(out_dir, name + ".npy"), np.asarray(getattr(self, name)))
+        with open(os.path.join(out_dir, "meta.json"), "w") as f:
+            json.dump({"stops": len(self), "patterns": len(self.pat_ntrips), "slots": len(self.slot_stop),
+                       "stop_times": len(self.dep), "transfers": len(self.transfer_to)}, f)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """directory written by save(); arrays are memory-mapped read-only unless mmap=False"""
+        mode = "r" if mmap else None
+        return cls({name: np.load(os.path.join(path, name + ".npy"), mmap_mode=mode) for name in _ARRAYS})
+
+    # ---------- queries ----------
+    def _slot_mask(self, route_types):
+        key = None if route_types is None else tuple(sorted(route_types))
+        mask = self._type_masks.get(key)
+        if mask is None:
+            ok = np.ones(len(self.pat_ntrips), bool) if key is None else np.isin(self.route_type, key)
+            mask = self._type_masks[key] = ok[self.slot_pattern]
+        return mask
+
+    def stops_near(self, point, radius_m=MAX_ACCESS_M):
+        """(stop indices, distance m) within radius_m of a (lat, lon) point"""
+        d = haversine_matrix(point, self.stop_coords)[0] * 1000.0
+        idx = np.flatnonzero(d <= radius_m)
+        return idx, d[idx]
+
+    def query(self, origin, dest, depart_s, route_types=None, max_rounds=MAX_ROUNDS,
+              max_access_m=MAX_ACCESS_M, walk_kmh=WALK_KMH):
+        """
+        Earliest arrival from origin to dest (lat, lon) leaving at depart_s
+        (seconds after midnight of the service day), using only patterns whose
+        GTFS route_type is in route_types (default all). Among journeys with
+        the same arrival the one with fewest vehicles wins. Returns
+        {"depart_s", "leave_s", "arrive_s", "minutes", "transfers", "legs"}
+        or None when no stop is within max_access_m of both ends. leave_s is
+        when to set off to walk straight onto the first vehicle (no wait at
+        the stop) and minutes = arrive_s - leave_s. A walk-only journey (one
+        leg) is returned when it is faster.
+        """
+        walk_mps = walk_kmh / 3.6
+        acc, acc_m = self.stops_near(origin, max_access_m)
+        egr, egr_m = self.stops_near(dest, max_access_m)
+        if not len(acc) or not len(egr):
+            return None
+        egr_s = np.ceil(egr_m / walk_mps).astype(np.int64)
+        direct_m = float(haversine_matrix(origin, dest)[0, 0]) * 1000.0
+        best_dest = depart_s + int(np.ceil(direct_m / walk_mps))
+
+        INF = np.iinfo(np.int64).max // 4
+        n_stops, n_slots = len(self), len(self.slot_stop)
+        best = np.full(n_stops, INF, np.int64)
+        best[acc] = depart_s + np.ceil(acc_m / walk_mps).astype(np.int64)
+        labels = [best.copy()]
+        parents = []  # per round: (ride_alight_slot, ride_trip, ride_board_slot, ride_arrival, walk_from)
+        marked = best < INF
+        allowed = self._slot_mask(route_types)
+        sentinel = self.slot_seg + self._K - 1
+        stop_dest_round = 0
+
+        for _ in range(max_rounds):
+            # earliest catchable trip at every slot whose stop improved last round
+            slots = np.flatnonzero(marked[self.slot_stop] & allowed)
+            if not len(slots):
+                break
+            t0 = np.minimum(best[self.slot_stop[slots]], TIME_KEY - 1)
+            trip = np.searchsorted(self.dep_key, slots * TIME_KEY + t0) - self.slot_col[slots]
+            ok = trip < self.slot_ntrips[slots]
+            slots, trip = slots[ok], trip[ok]
+            key = sentinel.copy()
+            key[slots] = self.slot_seg[slots] + trip * self._pmax + self.slot_pos[slots]
+            # ride on: the best (earliest trip, earliest boarding) strictly before each slot
+            np.minimum.accumulate(key, out=key)
+            ride = np.empty_like(key)
+            ride[0] = sentinel[0]
+            ride[1:] = key[:-1]
+            ride[self.slot_first] = sentinel[self.slot_first]
+            rel = ride - self.slot_seg
+            on = np.flatnonzero(rel < self._K - 1)
+            trip_on = rel[on] // self._pmax
+            board_pos = rel[on] % self._pmax
+            t_arr = np.asarray(self.arr[self.slot_col[on] + trip_on], dtype=np.int64)
+            stop_on = self.slot_stop[on].astype(np.int64)
+            better = (t_arr < best[stop_on]) & (t_arr < best_dest)
+            on, trip_on, board_pos, t_arr, stop_on = on[better], trip_on[better], board_pos[better], t_arr[better], stop_on[better]
+
+            ride_arr = np.full(n_stops, INF, np.int64)
+            np.minimum.at(ride_arr, stop_on, t_arr)
+            win = t_arr == ride_arr[stop_on]
+            alight = np.full(n_stops, -1, np.int64)
+            alight[stop_on[win]] = on[win]
+            trips = np.full(n_stops, -1, np.int64)
+            trips[stop_on[win]] = trip_on[win]
+            board = np.full(n_stops, -1, np.int64)
+            board[stop_on[win]] = self.pat_slot_off[self.slot_pattern[on[win]]] + board_pos[win]
+            improved = np.flatnonzero(alight >= 0)
+            if not len(improved):
+                break
+            best[improved] = ride_arr[improved]
+
+            # one footpath hop from every stop reached by a vehicle this round
+            walk_from = np.full(n_stops, -1, np.int64)
+            fp = _ranges(self.transfer_off[improved], self.transfer_off[improved + 1])
+            if len(fp):
+                src = np.repeat(improved, self.transfer_n[improved])
+                to = np.asarray(self.transfer_to[fp], dtype=np.int64)
+                t_walk = ride_arr[src] + self.transfer_s[fp]
+                keep = (t_walk < best[to]) & (t_walk < best_dest)
+                src, to, t_walk = src[keep], to[keep], t_walk[keep]
+                cand = np.full(n_stops, INF, np.int64)
+                np.minimum.at(cand, to, t_walk)
+                win = t_walk == cand[to]
+                walk_from[to[win]] = src[win]
+                walked = np.flatnonzero(walk_from >= 0)
+                best[walked] = cand[walked]
+
+            marked = (alight >= 0) | (walk_from >= 0)
+            labels.append(best.copy())
+            parents.append((alight, trips, board, ride_arr, walk_from))
+            arrive = int((best[egr] + egr_s).min())
+            if arrive < best_dest:
+                best_dest, stop_dest_round = arrive, len(parents)
+
+        if stop_dest_round == 0:
+            return self._walk_journey(origin, dest, depart_s, best_dest)
+        return self._journey(origin, dest, depart_s, best_dest, stop_dest_round, labels, parents, egr, egr_s)
+
+    def query_arrive_by(self, origin, dest, arrive_by_s, route_types=None, lead_s=ARRIVE_BY_LEAD_S,
+                        step_s=ARRIVE_BY_STEP_S, max_queries=ARRIVE_BY_QUERIES, **kw):
+        """
+        Journey arriving at or before arrive_by_s that leaves as late as
+        possible (to within step_s), or None (no stop in range / nothing
+        arrives in time). Arrival is non-decreasing in the departure time, so
+        this is a bisection over forward queries: the first starts lead_s
+        before the deadline and moves earlier by any overshoot; a journey
+        that makes it lets the search jump to its leave time.
+        """
+        depart, best, n = arrive_by_s - lead_s, None, 0
+        while best is None:
+            if n == max_queries:
+                return None
+            j = self.query(origin, dest, depart, route_types, **kw)
+            n += 1
+            if j is None:
+                return None
+            if j["arrive_s"] <= arrive_by_s:
+                best = j
+            else:
+                depart -= max(j["arrive_s"] - arrive_by_s, step_s)
+        lo, hi = best["leave_s"], arrive_by_s
+        while hi - lo > step_s and n < max_queries:
+            mid = (lo + hi) // 2
+            j = self.query(origin, dest, mid, route_types, **kw)
+            n += 1
+            if j["arrive_s"] <= arrive_by_s:
+                best, lo = j, j["leave_s"]
+            else:
+                hi = mid
+        return best
+
+    # ---------- journey reconstruction ----------
+    def _stop_leg(self, kind, a, b, dep_s, arr_s, route=None, coords=None):
+        return {"mode": kind, "route": route,
+                "from": None if a is None else str(self.stop_names[a]), "to": None if b is None else str(self.stop_names[b]),
+                "dep_s": int(dep_s), "arr_s": int(arr_s), "coords": coords}
+
+    def _walk_journey(self, origin, dest, depart_s, arrive_s):
+        leg = self._stop_leg("walk", None, None, depart_s, arrive_s, coords=[tuple(origin), tuple(dest)])
+        return {"depart_s": int(depart_s), "leave_s": int(depart_s), "arrive_s": int(arrive_s),
+                "minutes": -(-(arrive_s - depart_s) // 60), "transfers": 0, "legs": [leg]}
+
+    def _pt(self, stop):
+        return float(self.stop_coords[stop, 0]), float(self.stop_coords[stop, 1])
+
+    def _journey(self, origin, dest, depart_s, arrive_s, k, labels, parents, egr, egr_s):
+        at = labels[k][egr] + egr_s
+        i = int(np.flatnonzero(at == arrive_s)[0])
+        s = int(egr[i])
+        legs = [self._stop_leg("walk", s, None, labels[k][s], arrive_s, coords=[self._pt(s), tuple(dest)])]
+        rides = 0
+        while k > 0:
+            if labels[k][s] == labels[k - 1][s]:
+                k -= 1
+                continue
+            alight, trips, board, ride_arr, walk_from = parents[k - 1]
+            p = int(walk_from[s])
+            if p >= 0:
+                legs.append(self._stop_leg("walk", p, s, ride_arr[p], labels[k][s], coords=[self._pt(p), self._pt(s)]))
+                s = p
+            slot_a, trip, slot_b = int(alight[s]), int(trips[s]), int(board[s])
+            pat = int(self.slot_pattern[slot_a])
+            b = int(self.slot_stop[slot_b])
+            legs.append(self._stop_leg(
+                route_mode(self.route_type[pat]), b, s,
+                self.dep[self.slot_col[slot_b] + trip], self.arr[self.slot_col[slot_a] + trip],
+                route=str(self.route_names[pat]),
+                coords=[self._pt(int(x)) for x in self.slot_stop[slot_b:slot_a + 1]]))
+            rides += 1
+            s = b
+            k -= 1
+        # leave just in time for the first vehicle instead of waiting at the stop
+        board_s = legs[-1]["dep_s"]
+        leave_s = board_s - (int(labels[0][s]) - int(depart_s))
+        legs.append(self._stop_leg("walk", None, s, leave_s, board_s, coords=[tuple(origin), self._pt(s)]))
+        legs.reverse()
+        return {"depart_s": int(depart_s), "leave_s": int(leave_s), "arrive_s": int(arrive_s),
+                "minutes": -(-(int(arrive_s) - int(leave_s)) // 60), "transfers": max(0, rides - 1), "legs": legs}
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Compile a GTFS feed into a memory-mappable TransitNetwork.")
+    ap.add_argument("gtfs_dir")
+    ap.add_argument("out_dir")
+    ap.add_argument("--date", help="only trips running on YYYYMMDD (calendar.txt / calendar_dates.txt)")
+    ap.add_argument("--transfer-radius-m", type=float, default=TRANSFER_RADIUS_M)
+    args = ap.parse_args()
+    net = TransitNetwork.from_gtfs(args.gtfs_dir, args.date, args.transfer_radius_m)
+    net.save(args.out_dir)
+    print(f"{len(net)} stops, {len(net.pat_ntrips)} patterns, {len(net.dep)} stop times, "
+          f"{len(net.transfer_to)} footpaths -> {args.out_dir}", file=sys.stderr)